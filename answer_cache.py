@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from urllib.parse import urlsplit
+
+module_logger = logging.getLogger("app.answer_cache")
+
+# --- Cache Configuration ---
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+# Entries older than this are never served.
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_MAX_BYTES = int(os.environ.get("ANSWER_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# How long a notebook's source fingerprint is trusted before the browser re-reads it.
+SOURCE_FINGERPRINT_TTL_SECONDS = float(os.environ.get("SOURCE_FINGERPRINT_TTL_SECONDS", "300"))
+# Stored by earlier versions when the source list could not be read; such entries are purged at startup.
+UNKNOWN_FINGERPRINT = "unknown"
+
+CACHE_MODES = ("use", "bypass", "refresh")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    notebook TEXT NOT NULL,
+    query TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access);
+CREATE INDEX IF NOT EXISTS answers_notebook ON answers (notebook);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    notebook TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+def normalize_notebook(notebook_id: str) -> str:
+    """Drop query string, fragment and trailing slash so ?authuser=0 variants share entries."""
+    parts = urlsplit(notebook_id.strip())
+    if not parts.netloc:
+        return notebook_id.strip()
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+def normalize_query(llmquery: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", llmquery).casefold().split())
+
+
+def make_key(notebook_id: str, llmquery: str, fingerprint: str) -> str:
+    material = "\x1f".join((normalize_notebook(notebook_id), normalize_query(llmquery), fingerprint))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    SQLite-backed store of query results keyed by notebook, normalized query and source fingerprint.
+
+    Only answers whose sources were fingerprinted are cached: without one a
+    change of sources could not be noticed, so nothing is stored or served.
+
+    Thread-safe; every call is a short blocking SQLite transaction, so async
+    callers should go through asyncio.to_thread.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+                 fingerprint_ttl_seconds: float = SOURCE_FINGERPRINT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.fingerprint_ttl_seconds = fingerprint_ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("DELETE FROM answers WHERE fingerprint = ?", (UNKNOWN_FINGERPRINT,))
+        self._conn.execute("DELETE FROM fingerprints WHERE fingerprint = ?", (UNKNOWN_FINGERPRINT,))
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def fingerprint(self, notebook_id: str) -> str | None:
+        """The notebook's last known source fingerprint, if it was read recently enough to trust."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, checked_at FROM fingerprints WHERE notebook = ?",
+                (normalize_notebook(notebook_id),),
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.fingerprint_ttl_seconds:
+            return None
+        return row[0]
+
+    def record_fingerprint(self, notebook_id: str, fingerprint: str | None):
+        """Remember the notebook's current sources; answers cached for other source lists are dropped."""
+        notebook = normalize_notebook(notebook_id)
+        if not fingerprint:
+            # Sources unreadable: forget the old fingerprint so the next lookup reads them again.
+            with self._lock:
+                self._conn.execute("DELETE FROM fingerprints WHERE notebook = ?", (notebook,))
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO fingerprints (notebook, fingerprint, checked_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(notebook) DO UPDATE SET fingerprint = excluded.fingerprint, checked_at = excluded.checked_at",
+                (notebook, fingerprint, time.time()),
+            )
+            stale = self._conn.execute(
+                "DELETE FROM answers WHERE notebook = ? AND fingerprint != ?", (notebook, fingerprint),
+            ).rowcount
+        if stale:
+            self.invalidations += stale
+            module_logger.info(f"Sources of {notebook} changed; invalidated {stale} cached answer(s).")
+
+    def get(self, notebook_id: str, llmquery: str, fingerprint: str | None) -> tuple[dict, float] | None:
+        """Return (result, age_seconds) for a live entry, counting the hit or miss."""
+        if not fingerprint:
+            self.misses += 1
+            return None
+        key = make_key(notebook_id, llmquery, fingerprint)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0]), now - row[1]
+
+    def put(self, notebook_id: str, llmquery: str, fingerprint: str, result: dict) -> str:
+        if not fingerprint:
+            raise ValueError("answers are only cached under a source fingerprint")
+        key = make_key(notebook_id, llmquery, fingerprint)
+        payload = json.dumps(result)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, notebook, query, fingerprint, payload, size, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, normalize_notebook(notebook_id), normalize_query(llmquery), fingerprint,
+                 payload, len(payload), now, now),
+            )
+            self.stores += 1
+            self._evict(now)
+        return key
+
+    def store_result(self, notebook_id: str, llmquery: str, result: dict) -> str | None:
+        """Cache a fresh run_query result under the source fingerprint it reported; None if it reported none."""
+        fingerprint = result.get("source_fingerprint")
+        self.record_fingerprint(notebook_id, fingerprint)
+        if not fingerprint:
+            return None
+        cached = {k: v for k, v in result.items() if k not in ("session_id", "cache", "timing", "coalesced")}
+        return self.put(notebook_id, llmquery, fingerprint, cached)
+
+    def _evict(self, now: float):
+        # Caller holds self._lock.
+        evicted = self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            # Drop least recently used entries: the entry overflow, or a tenth of the entries when over the byte limit.
+            batch = max(1, (count - self.max_entries) if count > self.max_entries else count // 10)
+            evicted += self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_access LIMIT ?)", (batch,),
+            ).rowcount
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        self.evictions += evicted
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM answers").rowcount
+            self._conn.execute("DELETE FROM fingerprints")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
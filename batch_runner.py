@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from answer_cache import AnswerCache
+from broker_client import BrokerUnavailableError
+from driver_pool import BrowserSession, PoolExhaustedError, PoolNotStartedError
+from notebook_query import QueryError
+from scheduler import DeadlineExceededError, QueueFullError, Scheduler
+
+module_logger = logging.getLogger("app.batch_runner")
+
+
+def parse_batch_lines(text: str) -> tuple[list[dict], list[dict]]:
+    """
+    Parse a JSONL batch body into query items and per-line errors.
+
+    Each line is {"notebook_id": ..., "llmquery": ..., "id": optional}. Items are
+    numbered by line so results, which arrive in completion order, can be matched up.
+    """
+    items, errors = [], []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("line must be a JSON object")
+            notebook_id = record["notebook_id"]
+            llmquery = record["llmquery"]
+            if not isinstance(notebook_id, str) or not isinstance(llmquery, str):
+                raise ValueError("notebook_id and llmquery must be strings")
+        except (ValueError, KeyError) as e:
+            errors.append({
+                "index": line_number,
+                "status": "error",
+                "status_code": 400,
+                "detail": f"Invalid batch line: {type(e).__name__} - {e}",
+            })
+            continue
+        items.append({
+            "index": line_number,
+            "id": record.get("id"),
+            "notebook_id": notebook_id,
+            "llmquery": llmquery,
+        })
+    return items, errors
+
+
+class _BatchQueue:
+    """Pending items grouped by notebook, handed out so sessions stay on the notebook they already show."""
+
+    def __init__(self, items: list[dict]):
+        self.groups: dict[str, deque] = {}
+        for item in items:
+            self.groups.setdefault(item["notebook_id"], deque()).append(item)
+        self.workers_on: dict[str, int] = {notebook_id: 0 for notebook_id in self.groups}
+
+    def notebook_for(self, current: str | None) -> str | None:
+        """Notebook a worker showing `current` would take next, to ask the scheduler for a session near it."""
+        if self.groups.get(current):
+            return current
+        pending = [n for n, group in self.groups.items() if group]
+        return min(pending, key=lambda n: (self.workers_on[n], -len(self.groups[n]))) if pending else None
+
+    def next_for(self, session: BrowserSession) -> dict | None:
+        current = session.current_notebook
+        if current in self.groups and self.groups[current]:
+            return self.groups[current].popleft()
+        # A notebook open in another of the session's tabs costs a tab switch, not a reload.
+        open_tabs = [n for n in session.notebooks if self.groups.get(n)]
+        if open_tabs:
+            return self._switch(current, open_tabs[-1])
+        pending = [n for n, group in self.groups.items() if group]
+        if not pending:
+            return None
+        # Switch to the notebook with the fewest sessions on it, then the most work left.
+        return self._switch(current, min(pending, key=lambda n: (self.workers_on[n], -len(self.groups[n]))))
+
+    def _switch(self, current: str | None, notebook_id: str) -> dict:
+        if current in self.workers_on:
+            self.workers_on[current] -= 1
+        self.workers_on[notebook_id] += 1
+        return self.groups[notebook_id].popleft()
+
+    def drain(self) -> list[dict]:
+        remaining = [item for group in self.groups.values() for item in group]
+        for group in self.groups.values():
+            group.clear()
+        return remaining
+
+
+async def _cached_line(cache: AnswerCache, item: dict) -> dict | None:
+    """The item's result line from the cache, or None when it needs a browser (miss, stale sources, cache error)."""
+    try:
+        fingerprint = await asyncio.to_thread(cache.fingerprint, item["notebook_id"])
+        hit = fingerprint and await asyncio.to_thread(cache.get, item["notebook_id"], item["llmquery"], fingerprint)
+    except Exception as e:
+        module_logger.warning(f"Answer cache lookup for batch item {item['index']} failed: {type(e).__name__} - {e}")
+        return None
+    if not hit:
+        return None
+    result, age_seconds = hit
+    result["cache"] = {"status": "hit", "age_seconds": round(age_seconds, 3)}
+    result["timing"] = {"queue_wait_seconds": 0.0, "browser_seconds": 0.0, "phases": {}}
+    return _result_line(item, status="ok", status_code=200, session_id=None, navigation_reused=False, result=result)
+
+
+def _result_line(item: dict, **fields) -> dict:
+    line = {"index": item["index"], "id": item["id"], "notebook_id": item["notebook_id"], "llmquery": item["llmquery"]}
+    line.update(fields)
+    return line
+
+
+async def run_batch(scheduler: Scheduler, items: list[dict], concurrency: int, cache: AnswerCache | None = None,
+                    client_id: str = "batch", deadline_seconds: float | None = None):
+    """
+    Run items across up to `concurrency` pooled sessions and yield one result dict
+    per item in completion order. Consecutive items for the same notebook stay on
+    the session already showing it, so navigation happens once per notebook per session.
+
+    Sessions are taken from the scheduler at batch priority; a worker hands its
+    session back between items whenever interactive requests are waiting, and
+    deadline_seconds bounds each of its waits for one.
+
+    With a cache, items whose notebook has a fresh source fingerprint are answered
+    from it before any session is taken, and every answer the browser produces is stored.
+    """
+    if cache is not None:
+        pending = []
+        for item in items:
+            line = await _cached_line(cache, item)
+            if line is None:
+                pending.append(item)
+            else:
+                yield line
+        items = pending
+        if not items:
+            return
+    queue = _BatchQueue(items)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker(worker_id: int):
+        session = ticket = None
+        # The scheduler wait is charged to the first item run on each ticket; later items on it did not queue.
+        session_wait = 0.0
+
+        def timing(result: dict, item_started: float) -> dict:
+            nonlocal session_wait
+            wait, session_wait = session_wait, 0.0
+            # The session's phase breakdown is kept; the batch adds queue wait and browser time around it.
+            return {**result.get("timing", {}), "queue_wait_seconds": wait,
+                    "browser_seconds": round(time.monotonic() - item_started, 3)}
+
+        async def acquire(current: str | None = None):
+            nonlocal session, ticket, session_wait
+            # Ask for a session near the notebook this worker will run next, so the scheduler can keep affinity.
+            session, ticket = await scheduler.acquire(queue.notebook_for(current), client_id, "batch", deadline_seconds)
+            session_wait = ticket.timing()["queue_wait_seconds"]
+
+        async def run_item(item: dict):
+            navigation_reused = session.has_notebook(item["notebook_id"])
+            item_started = time.monotonic()
+            result = await session.query(item["notebook_id"], item["llmquery"])
+            if cache is not None:
+                await asyncio.to_thread(cache.store_result, item["notebook_id"], item["llmquery"], result)
+                result["cache"] = {"status": "miss"}
+            result["timing"] = timing(result, item_started)
+            return _result_line(item, status="ok", status_code=200, session_id=session.session_id,
+                                navigation_reused=navigation_reused, result=result)
+
+        try:
+            await acquire()
+            while (item := queue.next_for(session)) is not None:
+                try:
+                    line = await run_item(item)
+                except QueryError as e:
+                    line = _result_line(item, status="error", status_code=e.status_code,
+                                        session_id=session.session_id, detail=e.detail)
+                except Exception as e:
+                    module_logger.error(f"Batch item {item['index']} failed: {e}", exc_info=True)
+                    line = _result_line(item, status="error", status_code=500,
+                                        session_id=session.session_id, detail=f"{type(e).__name__} - {e}")
+                results.put_nowait(line)
+                if line["status"] == "error" and not await session.healthy():
+                    # Replace a dead browser rather than failing the rest of the batch on it.
+                    await scheduler.release(ticket, session, broken=True)
+                    session = None
+                    await acquire(item["notebook_id"])
+                elif scheduler.should_yield(ticket):
+                    # Interactive requests are waiting: give the session up and queue again behind them.
+                    await scheduler.release(ticket, session)
+                    session = None
+                    await acquire(item["notebook_id"])
+        except (PoolExhaustedError, PoolNotStartedError, QueueFullError, DeadlineExceededError, BrokerUnavailableError) as e:
+            module_logger.warning(f"Batch worker {worker_id} could not get a browser session: {e}")
+        except Exception as e:
+            # Anything else ends this worker only; the other workers keep going and its items are reported as 503s.
+            module_logger.error(f"Batch worker {worker_id} stopped: {type(e).__name__} - {e}", exc_info=True)
+        finally:
+            if session is not None:
+                await scheduler.release(ticket, session)
+
+    workers = [asyncio.create_task(worker(i)) for i in range(max(1, min(concurrency, len(items))))]
+    all_done = asyncio.gather(*workers, return_exceptions=True)
+    all_done.add_done_callback(lambda _: results.put_nowait(None))
+
+    try:
+        while (line := await results.get()) is not None:
+            yield line
+        await all_done
+        for item in queue.drain():
+            yield _result_line(item, status="error", status_code=503, detail="No browser session became available to run this item.")
+    finally:
+        # Client went away: stop handing out new items; in-flight queries finish and check in.
+        queue.drain()
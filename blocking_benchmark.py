@@ -0,0 +1,72 @@
+"""
+Compare navigation time and Chrome memory with and without resource blocking.
+
+Launches one session per mode the way the pool does (staged profile, same
+Chrome options), navigates to --url --iterations times in each, then sums the
+resident memory of the session's Chrome processes. The unblocked run observes
+what blocking would skip, so it also reports the bytes blocking saves.
+
+    python blocking_benchmark.py --url https://notebooklm.google.com/notebook/<id> --iterations 5
+"""
+import argparse
+import json
+import logging
+import time
+
+from metrics import process_tree_rss
+from transport_benchmark import _summary
+
+module_logger = logging.getLogger("app.blocking_benchmark")
+
+# Benchmark label -> RESOURCE_BLOCKING mode the session is launched with.
+MODES = {"unblocked": "observe", "blocked": "on"}
+
+
+def measure(session, url: str, iterations: int) -> dict:
+    driver = session.driver
+    samples = []
+    for _ in range(iterations):
+        driver.get("about:blank")
+        started = time.perf_counter()
+        driver.get(url)
+        samples.append(time.perf_counter() - started)
+    return {
+        "navigation": _summary(samples),
+        # chromedriver's children are the browser and its renderer, GPU and utility processes.
+        "chrome_rss_mb": round(process_tree_rss(driver.service.process.pid) / 2**20, 1),
+        "resource_blocking": session.blocker.stats() if session.blocker is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page loads with and without resource blocking.")
+    parser.add_argument("--url", required=True, help="Page to load, normally a notebook URL.")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    from driver_pool import _prepare_profile_template, launch_session, profile_stager
+
+    _prepare_profile_template()
+    report = {"url": args.url, "iterations": args.iterations, "modes": {}}
+    try:
+        for label, mode in MODES.items():
+            session = launch_session(f"blocking-benchmark-{label}", resource_blocking=mode)
+            try:
+                report["modes"][label] = measure(session, args.url, args.iterations)
+            finally:
+                session.close()
+    finally:
+        profile_stager.discard_spares()
+
+    unblocked, blocked = report["modes"]["unblocked"], report["modes"]["blocked"]
+    report["navigation_speedup"] = round(unblocked["navigation"]["p50_ms"] / max(blocked["navigation"]["p50_ms"], 0.001), 2)
+    report["rss_saved_mb"] = round(unblocked["chrome_rss_mb"] - blocked["chrome_rss_mb"], 1)
+    if unblocked["resource_blocking"] is not None:
+        report["bytes_saved_per_load"] = unblocked["resource_blocking"]["blocked_bytes"] // args.iterations
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Browser broker: owns the Chrome sessions and serves them to web workers over a Unix socket.
+
+Run it once per host, then start any number of web workers with
+BROWSER_BROKER_SOCKET pointing at the same socket:
+
+    python broker.py --socket /tmp/notebooklm-broker.sock
+    BROWSER_BROKER_SOCKET=/tmp/notebooklm-broker.sock gunicorn main:app -k uvicorn.workers.UvicornWorker -w 4
+
+Web workers can then be restarted or scaled without touching the warm browsers.
+See broker_client.py for the wire protocol.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+
+from broker_client import (BROWSER_BROKER_SOCKET, DEFAULT_BROKER_SOCKET, MESSAGE_LIMIT_BYTES, encode_error,
+                           read_message, send_message)
+from driver_pool import BrowserSession, DriverPool
+from log_pipeline import configure_logging, request_id_var
+from metrics import render_pool_metrics
+from scheduler import Scheduler, Ticket
+from warmup import Warmup
+
+module_logger = logging.getLogger("app.broker")
+
+
+def _session_info(session: BrowserSession) -> dict:
+    return {"session_id": session.session_id, "current_notebook": session.current_notebook, "notebooks": session.notebooks}
+
+
+class Broker:
+    """Serves one DriverPool and its Scheduler to front-end connections."""
+
+    def __init__(self, pool: DriverPool | None = None, scheduler: Scheduler | None = None):
+        self.pool = pool or DriverPool()
+        self.scheduler = scheduler or Scheduler(self.pool)
+        # Started by serve() once the socket is listening (WARMUP_NOTEBOOKS).
+        self.warmup = Warmup(self.pool, self.scheduler)
+        self.connections = 0
+        self.leases = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            request = await read_message(reader)
+            if request is None:
+                return
+            if request.get("op") == "acquire":
+                await self._lease(request, reader, writer)
+                return
+            try:
+                reply = {"result": await self._pool_op(request)}
+            except Exception as e:
+                if not isinstance(e, (ValueError, LookupError, RuntimeError)):
+                    module_logger.error(f"Broker request {request.get('op')} failed: {e}", exc_info=True)
+                reply = {"error": encode_error(e)}
+            await send_message(writer, reply)
+        except (OSError, ValueError) as e:
+            module_logger.warning(f"Front-end connection failed: {type(e).__name__} - {e}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _pool_op(self, request: dict):
+        op = request.get("op")
+        if op == "status":
+            return {**self.pool.stats(), "scheduler": self.scheduler.stats(), "broker": self.stats()}
+        if op == "waterfalls":
+            return self.pool.waterfalls(request.get("session_id"), request.get("limit"), request.get("requests", True))
+        if op == "ready":
+            return self.warmup.describe()
+        if op == "metrics":
+            return await render_pool_metrics(self.pool, self.scheduler)
+        if op == "setup":
+            launched = await self.pool.start(request["notebook_id"], min_size=request.get("min_size"),
+                                             max_size=request.get("max_size"))
+            self.warmup.mark_setup()
+            return {"launched_sessions": [s.session_id for s in launched], "pool": self.pool.stats()}
+        if op == "close":
+            if request.get("session_id"):
+                closed_now = await self.pool.close_session(request["session_id"])
+                return {"closed_now": closed_now, "pool": self.pool.stats()}
+            was_running = self.pool.started or self.pool.size
+            closed = await self.pool.close()
+            return {"was_running": bool(was_running), "closed": closed, "pool": self.pool.stats()}
+        if op == "add_node":
+            return await self.pool.add_node(request["name"], request["url"], request.get("max_sessions"))
+        if op == "remove_node":
+            return await self.pool.remove_node(request["name"])
+        raise ValueError(f"Unknown broker op: {op}")
+
+    async def _lease(self, request: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Hold one session for the connection: run its commands until release or disconnect."""
+        # Each connection is its own task, so this only tags the lease's records with the front end's request id.
+        request_id_var.set(request.get("request_id"))
+        try:
+            session, ticket = await self.scheduler.acquire(request.get("notebook_id"), request["client_id"],
+                                                           request.get("priority", "interactive"),
+                                                           request.get("deadline_seconds"))
+        except Exception as e:
+            await send_message(writer, {"error": encode_error(e)})
+            return
+        self.leases += 1
+        broken = False
+        try:
+            await send_message(writer, {"session": _session_info(session),
+                                        "result": {"queue_wait_seconds": ticket.timing()["queue_wait_seconds"]}})
+            while (command := await read_message(reader)) is not None:
+                if command.get("op") == "release":
+                    broken = bool(command.get("broken"))
+                    await send_message(writer, {"result": None})
+                    break
+                await send_message(writer, await self._session_op(session, ticket, command, writer))
+        except (OSError, ValueError) as e:
+            # The front end went away; its lease ends here either way.
+            module_logger.warning(f"Lease on {session.session_id} ended by a connection error: {type(e).__name__} - {e}")
+        finally:
+            self.leases -= 1
+            await self.scheduler.release(ticket, session, broken=broken)
+
+    async def _session_op(self, session: BrowserSession, ticket: Ticket, command: dict,
+                          writer: asyncio.StreamWriter) -> dict:
+        op = command.get("op")
+        try:
+            if op == "query":
+                loop = asyncio.get_running_loop()
+
+                def forward_delta(delta: dict):
+                    # Called on the session's worker thread; queued for the event loop to write.
+                    loop.call_soon_threadsafe(_write_delta, writer, delta)
+                result = await session.query(command["notebook_id"], command["llmquery"],
+                                             on_delta=forward_delta if command.get("stream") else None,
+                                             copy_to_clipboard=command.get("copy_to_clipboard", False))
+            elif op == "fingerprint":
+                result = await session.source_fingerprint(command["notebook_id"])
+            elif op == "title":
+                result = await session.page_title()
+            elif op == "probe":
+                result = await session.healthy()
+            else:
+                raise ValueError(f"Unknown session op: {op}")
+            reply = {"result": result}
+        except Exception as e:
+            if not isinstance(e, ValueError):
+                module_logger.warning(f"Session op {op} on {session.session_id} failed: {type(e).__name__} - {e}")
+            reply = {"error": encode_error(e)}
+        reply.update(session=_session_info(session), should_yield=self.scheduler.should_yield(ticket))
+        return reply
+
+    def stats(self) -> dict:
+        return {"connections": self.connections, "leases": self.leases}
+
+
+def _write_delta(writer: asyncio.StreamWriter, delta: dict):
+    # No drain(): deltas are small and the reply that follows the query drains the buffer.
+    if not writer.is_closing():
+        writer.write(json.dumps({"delta": delta}).encode("utf-8") + b"\n")
+
+
+async def serve(socket_path: str):
+    broker = Broker()
+    if os.path.exists(socket_path):
+        try:
+            _, writer = await asyncio.open_unix_connection(socket_path)
+            writer.close()
+            raise SystemExit(f"Another broker is already listening on {socket_path}.")
+        except ConnectionRefusedError:
+            os.unlink(socket_path) # Left behind by a broker that died.
+    server = await asyncio.start_unix_server(broker.handle, socket_path, limit=MESSAGE_LIMIT_BYTES)
+    os.chmod(socket_path, 0o600)
+    module_logger.info(f"Browser broker listening on {socket_path}.")
+    warmup_task = asyncio.create_task(broker.warmup.run())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        module_logger.info("Browser broker shutting down; closing the pool.")
+        server.close()
+        warmup_task.cancel()
+        await broker.pool.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Own the Chrome sessions and serve them to web workers over a Unix socket.")
+    parser.add_argument("--socket", default=BROWSER_BROKER_SOCKET or DEFAULT_BROKER_SOCKET)
+    args = parser.parse_args()
+
+    configure_logging()
+
+    asyncio.run(serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from driver_pool import PoolExhaustedError, PoolNotStartedError, SessionNotFoundError
+from log_pipeline import request_id_var
+from node_registry import NodeNotFoundError
+from notebook_query import QueryError
+from scheduler import DeadlineExceededError, QueueFullError
+
+module_logger = logging.getLogger("app.broker_client")
+
+# --- Broker Configuration ---
+# Unix socket of the browser broker (broker.py). Empty: this process owns its own pool.
+BROWSER_BROKER_SOCKET = os.environ.get("BROWSER_BROKER_SOCKET", "")
+DEFAULT_BROKER_SOCKET = "/tmp/notebooklm-broker.sock"
+# Answers travel as one JSON line each; allow far more than asyncio's 64 KiB default.
+MESSAGE_LIMIT_BYTES = 16 * 1024 * 1024
+
+
+class BrokerUnavailableError(RuntimeError):
+    """The broker could not be reached, or dropped the connection mid-request."""
+
+
+# --- Wire Protocol ---
+# Newline-delimited JSON. A request is {"op": ..., ...}; a reply is {"result": ...},
+# {"error": {...}}, or, while a streamed query runs, any number of {"delta": {...}} first.
+
+async def send_message(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> dict | None:
+    """Next message, or None once the other side has closed the connection."""
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+def encode_error(e: Exception) -> dict:
+    error = {"type": type(e).__name__, "message": str(e)}
+    if isinstance(e, QueueFullError):
+        error["retry_after"] = e.retry_after
+    if isinstance(e, QueryError):
+        error.update(status_code=e.status_code, message=e.detail)
+    return error
+
+
+def decode_error(error: dict) -> Exception:
+    """Rebuild the exception the broker raised, so callers handle it exactly as in-process."""
+    kind, message = error.get("type"), error.get("message", "")
+    if kind == "QueueFullError":
+        return QueueFullError(message, error.get("retry_after", 1))
+    if kind == "QueryError":
+        return QueryError(error.get("status_code", 500), message)
+    simple = {
+        "PoolNotStartedError": PoolNotStartedError,
+        "PoolExhaustedError": PoolExhaustedError,
+        "DeadlineExceededError": DeadlineExceededError,
+        "SessionNotFoundError": SessionNotFoundError,
+        "NodeNotFoundError": NodeNotFoundError,
+        "ValueError": ValueError,
+    }
+    if kind in simple:
+        return simple[kind](message)
+    # Anything else failed inside the broker the way it would have failed in-process.
+    return RuntimeError(f"{kind} - {message}")
+
+
+class RemoteTicket:
+    """Client-side view of a scheduler ticket held by the broker."""
+
+    def __init__(self, queue_wait_seconds: float):
+        self.queue_wait_seconds = queue_wait_seconds
+        self.started_at = time.monotonic()
+        # Whether the broker's scheduler has waiting interactive requests, as of the last reply.
+        self.yield_requested = False
+
+    def timing(self) -> dict:
+        return {
+            "queue_wait_seconds": self.queue_wait_seconds,
+            "browser_seconds": round(time.monotonic() - self.started_at, 3),
+        }
+
+
+class RemoteSession:
+    """
+    A broker session leased over one connection; offers the BrowserSession calls the front end makes.
+
+    Commands on a lease run one at a time. Closing the connection releases the
+    session, so a front-end worker that dies cannot strand a browser.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, info: dict):
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+        self.session_id = info["session_id"]
+        self.current_notebook = info["current_notebook"]
+        self.notebooks = info["notebooks"]
+        self.broken = False
+        self.ticket: RemoteTicket | None = None
+
+    def has_notebook(self, notebook_id: str) -> bool:
+        return notebook_id in self.notebooks
+
+    async def _call(self, message: dict, on_delta=None):
+        async with self._lock:
+            try:
+                await send_message(self._writer, message)
+                while (reply := await read_message(self._reader)) is not None:
+                    if "delta" in reply:
+                        if on_delta is not None:
+                            on_delta(reply["delta"])
+                        continue
+                    break
+            except (OSError, ValueError) as e:
+                raise BrokerUnavailableError(f"Lost the broker connection: {type(e).__name__} - {e}") from e
+        if reply is None:
+            raise BrokerUnavailableError("The broker closed the connection.")
+        if "session" in reply:
+            self.current_notebook = reply["session"]["current_notebook"]
+            self.notebooks = reply["session"]["notebooks"]
+        if self.ticket is not None and "should_yield" in reply:
+            self.ticket.yield_requested = reply["should_yield"]
+        if "error" in reply:
+            raise decode_error(reply["error"])
+        return reply.get("result")
+
+    async def query(self, notebook_id: str, llmquery: str, on_delta=None, copy_to_clipboard: bool = False) -> dict:
+        return await self._call({"op": "query", "notebook_id": notebook_id, "llmquery": llmquery,
+                                 "stream": on_delta is not None, "copy_to_clipboard": copy_to_clipboard},
+                                on_delta=on_delta)
+
+    async def source_fingerprint(self, notebook_id: str) -> str | None:
+        return await self._call({"op": "fingerprint", "notebook_id": notebook_id})
+
+    async def page_title(self) -> str:
+        return await self._call({"op": "title"})
+
+    async def healthy(self) -> bool:
+        try:
+            return await self._call({"op": "probe"})
+        except BrokerUnavailableError:
+            return False
+
+    async def release(self, broken: bool = False):
+        try:
+            await self._call({"op": "release", "broken": broken or self.broken})
+        except BrokerUnavailableError as e:
+            # The broker releases the session itself when the connection goes away.
+            module_logger.warning(f"Releasing {self.session_id} failed, leaving it to the broker: {e}")
+        finally:
+            self._writer.close()
+
+
+class BrokerClient:
+    """
+    Front-end handle on the browser broker: the Scheduler's acquire/release/session
+    calls plus the pool operations, each sent over the broker's Unix socket.
+
+    Holds no browser state, so any number of web workers can share one broker.
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+
+    async def _connect(self):
+        try:
+            return await asyncio.open_unix_connection(self.socket_path, limit=MESSAGE_LIMIT_BYTES)
+        except OSError as e:
+            raise BrokerUnavailableError(f"Browser broker at {self.socket_path} is unavailable: {e}") from e
+
+    async def request(self, op: str, **params):
+        """One-shot request on its own connection."""
+        reader, writer = await self._connect()
+        try:
+            await send_message(writer, {"op": op, **params})
+            reply = await read_message(reader)
+        except (OSError, ValueError) as e:
+            raise BrokerUnavailableError(f"Lost the broker connection: {type(e).__name__} - {e}") from e
+        finally:
+            writer.close()
+        if reply is None:
+            raise BrokerUnavailableError("The broker closed the connection.")
+        if "error" in reply:
+            raise decode_error(reply["error"])
+        return reply["result"]
+
+    async def acquire(self, notebook_id: str | None, client_id: str, priority: str = "interactive",
+                      deadline_seconds: float | None = None) -> tuple[RemoteSession, RemoteTicket]:
+        reader, writer = await self._connect()
+        try:
+            await send_message(writer, {"op": "acquire", "notebook_id": notebook_id, "client_id": client_id,
+                                        "priority": priority, "deadline_seconds": deadline_seconds,
+                                        "request_id": request_id_var.get()})
+            reply = await read_message(reader)
+        except BaseException as e:
+            writer.close()
+            if isinstance(e, (OSError, ValueError)):
+                raise BrokerUnavailableError(f"Lost the broker connection: {type(e).__name__} - {e}") from e
+            raise
+        if reply is None or "error" in reply:
+            writer.close()
+            if reply is None:
+                raise BrokerUnavailableError("The broker closed the connection.")
+            raise decode_error(reply["error"])
+        session = RemoteSession(reader, writer, reply["session"])
+        session.ticket = RemoteTicket(reply["result"]["queue_wait_seconds"])
+        return session, session.ticket
+
+    async def release(self, ticket: RemoteTicket, session: RemoteSession, broken: bool = False):
+        await session.release(broken)
+
+    @asynccontextmanager
+    async def session(self, notebook_id: str | None, client_id: str, priority: str = "interactive",
+                      deadline_seconds: float | None = None):
+        session, ticket = await self.acquire(notebook_id, client_id, priority, deadline_seconds)
+        try:
+            yield session, ticket
+        except BaseException:
+            session.broken = session.broken or not await session.healthy()
+            raise
+        finally:
+            await self.release(ticket, session)
+
+    def should_yield(self, ticket: RemoteTicket) -> bool:
+        return ticket.yield_requested
+
+    async def status(self) -> dict:
+        """{"pool": ..., "scheduler": ...} as the broker sees them."""
+        return await self.request("status")
+
+    async def ready(self) -> dict:
+        """The broker's warm-up state; "ready" is True once its browsers can answer."""
+        return await self.request("ready")
+
+    async def metrics(self) -> str:
+        """The broker's Prometheus exposition; browser phases and pool gauges are recorded there."""
+        return await self.request("metrics")
+
+    async def waterfalls(self, session_id: str | None = None, limit: int | None = None, requests: bool = True) -> dict:
+        return await self.request("waterfalls", session_id=session_id, limit=limit, requests=requests)
+
+    async def setup(self, notebook_id: str, min_size: int | None = None, max_size: int | None = None) -> dict:
+        """Start or resize the broker's pool: {"launched_sessions": [...], "pool": ...}."""
+        return await self.request("setup", notebook_id=notebook_id, min_size=min_size, max_size=max_size)
+
+    async def close(self, session_id: str | None = None) -> dict:
+        """Close one broker session ({"closed_now": bool, "pool"}) or the whole pool ({"closed": n, "pool"})."""
+        return await self.request("close", session_id=session_id)
+
+    async def add_node(self, name: str, url: str, max_sessions: int | None = None) -> dict:
+        return await self.request("add_node", name=name, url=url, max_sessions=max_sessions)
+
+    async def remove_node(self, name: str) -> dict:
+        return await self.request("remove_node", name=name)
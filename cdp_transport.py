@@ -0,0 +1,152 @@
+import itertools
+import json
+import logging
+import os
+import urllib.request
+
+import websocket
+
+module_logger = logging.getLogger("app.cdp_transport")
+
+# --- Transport Configuration ---
+# "webdriver" sends every page command through chromedriver's HTTP wire protocol.
+# "cdp" sends DOM queries, input and answer waits over one persistent DevTools
+# websocket per session, falling back to WebDriver whenever the websocket fails.
+BROWSER_TRANSPORT = os.environ.get("BROWSER_TRANSPORT", "webdriver")
+CDP_COMMAND_TIMEOUT_SECONDS = 30
+
+# Scripts hand back JSON values only; DOM nodes anywhere in the result become null.
+_BY_VALUE = """function (value) {
+    if (value === undefined) return null;
+    return JSON.parse(JSON.stringify(value, function (key, item) { return item instanceof Node ? null : item; }));
+}"""
+
+
+class CdpError(RuntimeError):
+    """A DevTools command failed, a script threw, or the websocket dropped."""
+
+
+class CdpSession:
+    """
+    Persistent DevTools websocket to one page target.
+
+    Blocking and not thread-safe: like the WebDriver it sits beside, it is only
+    used from its session's worker thread. Events that arrive while waiting for
+    a reply are passed to the callbacks registered with on().
+    """
+
+    def __init__(self, websocket_url: str, timeout: float = CDP_COMMAND_TIMEOUT_SECONDS):
+        self.websocket_url = websocket_url
+        self.timeout = timeout
+        # Chrome rejects DevTools websockets that send an Origin it was not told to allow.
+        self._ws = websocket.create_connection(websocket_url, timeout=timeout, suppress_origin=True)
+        self._ids = itertools.count(1)
+        self._handlers: dict[str, list] = {}
+        self.commands_sent = 0
+
+    @classmethod
+    def attach(cls, driver) -> "CdpSession":
+        """Connect to the DevTools target behind the driver's current window (chromedriver uses target ids as window handles)."""
+        address = driver.capabilities.get("goog:chromeOptions", {}).get("debuggerAddress")
+        if not address:
+            raise CdpError("The browser did not report a DevTools debuggerAddress.")
+        with urllib.request.urlopen(f"http://{address}/json/list", timeout=10) as response:
+            targets = json.load(response)
+        handle = driver.current_window_handle
+        for target in targets:
+            if target.get("id") == handle and target.get("type") == "page":
+                return cls(target["webSocketDebuggerUrl"])
+        raise CdpError(f"No DevTools page target matches window {handle}.")
+
+    @property
+    def connected(self) -> bool:
+        return self._ws.connected
+
+    def on(self, event: str, callback):
+        self._handlers.setdefault(event, []).append(callback)
+
+    def off(self, event: str, callback):
+        if callback in self._handlers.get(event, []):
+            self._handlers[event].remove(callback)
+
+    def send(self, method: str, params: dict | None = None, timeout: float | None = None) -> dict:
+        """Send one command and block until its reply, dispatching any events received meanwhile."""
+        message_id = next(self._ids)
+        try:
+            self._ws.settimeout(timeout or self.timeout)
+            self._ws.send(json.dumps({"id": message_id, "method": method, "params": params or {}}))
+            self.commands_sent += 1
+            while True:
+                message = json.loads(self._ws.recv())
+                if message.get("id") == message_id:
+                    if "error" in message:
+                        raise CdpError(f"{method} failed: {message['error'].get('message')}")
+                    return message.get("result", {})
+                if "method" in message:
+                    self._dispatch(message["method"], message.get("params", {}))
+        except (websocket.WebSocketException, OSError, ValueError) as e:
+            raise CdpError(f"{method} failed: {type(e).__name__} - {e}") from e
+
+    def post(self, method: str, params: dict | None = None):
+        """Send one command without waiting for its reply (the reply is skipped when it arrives)."""
+        try:
+            self._ws.send(json.dumps({"id": next(self._ids), "method": method, "params": params or {}}))
+            self.commands_sent += 1
+        except (websocket.WebSocketException, OSError) as e:
+            raise CdpError(f"{method} failed: {type(e).__name__} - {e}") from e
+
+    def poll_events(self, timeout: float) -> int:
+        """Dispatch events for up to `timeout` seconds without sending anything. Returns how many arrived."""
+        received = 0
+        try:
+            self._ws.settimeout(timeout)
+            while True:
+                message = json.loads(self._ws.recv())
+                if "method" in message:
+                    self._dispatch(message["method"], message.get("params", {}))
+                    received += 1
+        except websocket.WebSocketTimeoutException:
+            return received
+        except (websocket.WebSocketException, OSError, ValueError) as e:
+            raise CdpError(f"Reading DevTools events failed: {type(e).__name__} - {e}") from e
+
+    def _dispatch(self, method: str, params: dict):
+        for callback in list(self._handlers.get(method, ())):
+            try:
+                callback(params)
+            except Exception as e:
+                module_logger.warning(f"Handler for {method} failed: {type(e).__name__} - {e}")
+
+    def evaluate(self, expression: str, await_promise: bool = False, timeout: float | None = None):
+        result = self.send("Runtime.evaluate", {
+            "expression": expression,
+            "returnByValue": True,
+            "awaitPromise": await_promise,
+        }, timeout)
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CdpError(f"Script error: {details.get('exception', {}).get('description') or details.get('text')}")
+        return result.get("result", {}).get("value")
+
+    def execute_script(self, script: str, *args, timeout: float | None = None):
+        """driver.execute_script() over the websocket: `script` reads arguments[...] and returns a JSON value."""
+        expression = f"({_BY_VALUE})((function () {{\n{script}\n}}).apply(null, {json.dumps(list(args))}))"
+        return self.evaluate(expression, timeout=timeout)
+
+    def execute_async_script(self, script: str, *args, timeout: float | None = None):
+        """driver.execute_async_script() over the websocket: the script calls its last argument with the result."""
+        expression = (
+            f"new Promise(function (resolve) {{ (function () {{\n{script}\n}}).apply(null, "
+            f"{json.dumps(list(args))}.concat([function (value) {{ resolve(({_BY_VALUE})(value)); }}])); }})"
+        )
+        return self.evaluate(expression, await_promise=True, timeout=timeout)
+
+    def insert_text(self, text: str):
+        """Type text into the focused element as one input event, replacing any selection."""
+        self.send("Input.insertText", {"text": text})
+
+    def close(self):
+        try:
+            self._ws.close()
+        except Exception as e:
+            module_logger.debug(f"Closing DevTools websocket failed: {e}")
@@ -0,0 +1,880 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+from cdp_transport import BROWSER_TRANSPORT, CdpError, CdpSession
+from log_pipeline import BROWSER_LOG_VERBOSE
+from metrics import TIMEOUTS, PhaseTimer, record_startup
+from minimal_profile import ensure_minimal_profile
+from network_capture import ANSWER_EXTRACTION, NetworkAnswerCapture
+from notebook_query import QueryError, read_source_fingerprint, run_query
+from node_registry import (NODE_HEALTH_INTERVAL_SECONDS, NODE_MAX_SESSIONS, NodeRegistry, NodeUnavailableError,
+                           WebDriverNode)
+from notebook_tabs import NOTEBOOK_TABS_PER_SESSION, NotebookTab, NotebookTabs
+from performance_log import PERF_LOG_DRAIN_SECONDS, PERF_LOG_ENABLED, PerformanceLog
+from profile_staging import ProfileStager
+from resource_blocking import RESOURCE_BLOCKING, ResourceBlocker, merge_stats
+
+module_logger = logging.getLogger("app.driver_pool")
+
+# --- Pool Configuration ---
+# All values can be overridden through the environment so the container can be
+# sized without a rebuild.
+SOURCE_USER_DATA_DIR = os.environ.get("CHROME_PROFILE_DIR", "/home/seluser/chrome-profile")
+# "full" stages sessions from SOURCE_USER_DATA_DIR as-is; "minimal" first derives a
+# cache-free profile (see minimal_profile.py) and stages from that instead.
+PROFILE_MODE = os.environ.get("CHROME_PROFILE_MODE", "full")
+MINIMAL_USER_DATA_DIR = os.environ.get("CHROME_MINIMAL_PROFILE_DIR", "/home/seluser/chrome-profile-minimal")
+CHROMEDRIVER_EXECUTABLE = os.environ.get("CHROMEDRIVER_EXECUTABLE", "/opt/selenium/chromedriver")
+POOL_MIN_SIZE = int(os.environ.get("DRIVER_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.environ.get("DRIVER_POOL_MAX_SIZE", "4"))
+# Seconds a caller waits for a free session before giving up.
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DRIVER_POOL_CHECKOUT_TIMEOUT", "120"))
+# Idle sessions older than this (seconds since last use) are probed before being handed out.
+POOL_HEALTH_PROBE_INTERVAL = float(os.environ.get("DRIVER_POOL_HEALTH_PROBE_INTERVAL", "30"))
+PAGE_LOAD_TIMEOUT = 200
+# user-data-dir for sessions on nodes on other hosts, which cannot see locally staged profiles.
+# The image built from this repo's Dockerfile has the logged-in profile here; Chrome locks it, so such
+# a node runs one session (WEBDRIVER_NODE_MAX_SESSIONS=1) unless it is given its own profiles.
+WEBDRIVER_NODE_PROFILE_DIR = os.environ.get("WEBDRIVER_NODE_PROFILE_DIR", "/home/seluser/chrome-profile")
+# Page opened before cookies.json is applied: WebDriver only sets cookies for the current page's domain.
+COOKIE_ORIGIN_URL = "https://notebooklm.google.com/"
+# Hosts a logged-out browser is redirected to instead of the notebook.
+SIGN_IN_HOSTS = ("accounts.google.com",)
+
+# Session profiles are staged from the logged-in template instead of copied wholesale.
+profile_stager = ProfileStager(SOURCE_USER_DATA_DIR)
+
+
+class PoolNotStartedError(RuntimeError):
+    """Raised when a session is requested before /driver/setup started the pool."""
+
+
+class PoolExhaustedError(RuntimeError):
+    """Raised when no session became free within the checkout timeout."""
+
+
+class SessionNotFoundError(KeyError):
+    """Raised when a session id does not belong to the pool."""
+
+
+class NotLoggedInError(RuntimeError):
+    """Raised when a new session lands on Google's sign-in page instead of the notebook."""
+
+
+def _prepare_profile_template():
+    if PROFILE_MODE == "minimal":
+        template = ensure_minimal_profile(SOURCE_USER_DATA_DIR, MINIMAL_USER_DATA_DIR)
+    elif PROFILE_MODE == "full":
+        template = SOURCE_USER_DATA_DIR
+    else:
+        raise ValueError(f"Unknown CHROME_PROFILE_MODE: {PROFILE_MODE}")
+    if profile_stager.template_dir != template:
+        profile_stager.discard_spares()
+        profile_stager.template_dir = template
+    module_logger.info(f"Staging session profiles from {template} ({PROFILE_MODE} profile mode).")
+
+
+def build_chrome_options(user_data_dir: str | None) -> Options:
+    options = Options()
+
+    # Essential arguments for Docker/headless operation
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-extensions")
+    if NOTEBOOK_TABS_PER_SESSION > 1:
+        # Queries run in whichever tab is focused; keep the others' timers and renderers at full speed.
+        options.add_argument("--disable-background-timer-throttling")
+        options.add_argument("--disable-backgrounding-occluded-windows")
+        options.add_argument("--disable-renderer-backgrounding")
+
+    if BROWSER_LOG_VERBOSE:
+        # Arguments for enabling Chrome's own verbose logging
+        options.add_argument("--enable-logging=stderr")
+        options.add_argument("--v=1") # Chrome's own verbosity level
+
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_argument('--disable-blink-features=AutomationControlled')
+    options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
+    # Each session gets its own copy of the profile; Chrome locks the directory it runs from.
+    # Sessions on other hosts run from WEBDRIVER_NODE_PROFILE_DIR on the node instead.
+    if user_data_dir:
+        options.add_argument(f"--user-data-dir={user_data_dir}")
+
+    # Capability to enable browser console log retrieval via Selenium client.
+    # chromedriver keeps these until read; each session's PerformanceLog drains them.
+    logging_prefs = {"browser": "ALL", "driver": "ALL"} if BROWSER_LOG_VERBOSE else {"browser": "WARNING", "driver": "WARNING"}
+    if PERF_LOG_ENABLED:
+        logging_prefs["performance"] = "ALL"
+    options.set_capability("goog:loggingPrefs", logging_prefs)
+    return options
+
+
+def _load_cookies_file(driver: webdriver.Chrome, user_data_dir: str):
+    # Fallback for profiles that ship a cookies.json next to the Chrome data;
+    # the user-data-dir itself remains the primary source of the login.
+    cookies_file_path = os.path.join(user_data_dir, "cookies.json")
+    if not os.path.exists(cookies_file_path):
+        module_logger.info(f"No cookies file found at {cookies_file_path}. Proceeding without manually setting cookies.")
+        return
+
+    module_logger.info(f"Found cookies file at {cookies_file_path}. Attempting to load and set cookies.")
+    try:
+        with open(cookies_file_path, 'r') as f:
+            cookies = json.load(f)
+        # add_cookie is rejected on about:blank; .google.com cookies are accepted on any Google page.
+        driver.get(COOKIE_ORIGIN_URL)
+        for cookie in cookies:
+            if 'domain' not in cookie:
+                module_logger.warning(f"Cookie with name '{cookie.get('name', 'N/A')}' is missing 'domain'. Skipping add_cookie for this entry.")
+                continue
+            if 'path' not in cookie:
+                cookie['path'] = '/'
+            try:
+                driver.add_cookie(cookie)
+                module_logger.debug(f"Successfully added cookie: {cookie.get('name', 'N/A')}")
+            except Exception as cookie_add_error:
+                module_logger.warning(f"Could not add cookie {cookie.get('name', 'N/A')}: {cookie_add_error}", exc_info=False)
+    except Exception as cookie_load_error:
+        module_logger.warning(f"Error loading or processing cookies file: {cookie_load_error}", exc_info=True)
+
+
+def _check_logged_in(driver: webdriver.Chrome, session_id: str):
+    """Raise NotLoggedInError if the browser was sent to Google's sign-in page."""
+    host = urlsplit(driver.current_url).hostname or ""
+    if host in SIGN_IN_HOSTS:
+        raise NotLoggedInError(f"[{session_id}] Session is not logged in to Google (redirected to {host}).")
+
+
+def _log_browser_console(driver: webdriver.Chrome):
+    try:
+        browser_logs = driver.get_log("browser")
+        if browser_logs:
+            module_logger.info("--- Initial Browser Console Logs ---")
+            for entry in browser_logs:
+                module_logger.info(
+                    f"  LEVEL: {entry.get('level', 'N/A')} - "
+                    f"TIMESTAMP: {entry.get('timestamp', 'N/A')} - "
+                    f"MESSAGE: {entry.get('message', 'N/A')}"
+                )
+            module_logger.info("--- End of Initial Browser Console Logs ---")
+        else:
+            module_logger.info("No initial browser console logs were found via driver.get_log('browser').")
+    except Exception as log_exc:
+        module_logger.warning(f"Could not retrieve initial browser logs via driver.get_log('browser'): {log_exc}", exc_info=True)
+
+
+class SessionWorker:
+    """
+    Dedicated thread that owns every blocking call made against one browser.
+
+    Selenium drivers are not thread-safe, so each session gets exactly one
+    worker thread; the event loop only ever awaits the futures it returns.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so records logged on the worker keep the request id.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class BrowserSession:
+    """One Chrome instance, its notebook tabs, the temporary profile directory it runs from and its worker thread."""
+
+    def __init__(self, session_id: str, driver: webdriver.Chrome, user_data_dir: str | None,
+                 worker: SessionWorker | None = None, blocker: ResourceBlocker | None = None,
+                 resource_blocking: str = "off", max_tabs: int = NOTEBOOK_TABS_PER_SESSION,
+                 node: WebDriverNode | None = None, perf_log: PerformanceLog | None = None):
+        self.session_id = session_id
+        self.driver = driver
+        self.user_data_dir = user_data_dir
+        self.worker = worker or SessionWorker(session_id)
+        self.created_at = time.time()
+        self.last_used_at = time.monotonic()
+        self.queries_served = 0
+        self.broken = False
+        # Mode new tabs get their resource blocker in; the first tab's blocker is passed in by launch_session.
+        self.resource_blocking = resource_blocking
+        # Notebooks open in this browser, one per tab, so callers can keep queries for them on this session.
+        self.tabs = NotebookTabs(driver, session_id, max_tabs, NotebookTab(driver.current_window_handle, blocker=blocker),
+                                 on_open=self._attach_blocker)
+        self.cdp_attach_failures = 0
+        # WebDriver node the browser runs on; None for sessions created outside the pool.
+        self.node = node
+        # Drains chromedriver's log buffers and keeps the last navigation/query waterfalls.
+        self.perf_log = perf_log or PerformanceLog(driver, session_id)
+
+    @property
+    def devtools_reachable(self) -> bool:
+        """Chrome reports its DevTools port as a localhost address, so only same-host browsers can be attached to."""
+        return self.node is None or self.node.same_host
+
+    @property
+    def current_notebook(self) -> str | None:
+        """Notebook in the focused tab."""
+        return self.tabs.active.notebook_id if self.tabs.active is not None else None
+
+    @current_notebook.setter
+    def current_notebook(self, notebook_id: str | None):
+        self.tabs.active.notebook_id = notebook_id
+
+    @property
+    def notebooks(self) -> list[str]:
+        """Notebooks open in this session's tabs, least recently used first."""
+        return self.tabs.notebooks
+
+    def has_notebook(self, notebook_id: str) -> bool:
+        """True if one of this session's tabs already shows notebook_id."""
+        return self.tabs.find(notebook_id) is not None
+
+    @property
+    def blocker(self) -> ResourceBlocker | None:
+        return self.tabs.active.blocker if self.tabs.active is not None else None
+
+    def _attach_blocker(self, tab: NotebookTab):
+        if self.resource_blocking == "off" or not self.devtools_reachable:
+            return
+        try:
+            tab.blocker = ResourceBlocker.attach(self.driver, f"{self.session_id}/{tab.handle[:8]}", enforce=self.resource_blocking == "on")
+        except (CdpError, OSError, ValueError) as e:
+            module_logger.warning(f"Session {self.session_id} could not start resource blocking for a new tab: {type(e).__name__} - {e}")
+
+    def probe(self) -> bool:
+        """Cheap round trip through chromedriver into the page; False if the browser is gone."""
+        try:
+            self.driver.execute_script("return document.readyState")
+            return True
+        except Exception as probe_error:
+            module_logger.warning(f"Health probe failed for session {self.session_id}: {type(probe_error).__name__} - {probe_error}")
+            return False
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking callable on this session's worker thread and await its result."""
+        return await self.worker.run(fn, *args, **kwargs)
+
+    async def healthy(self) -> bool:
+        return await self.run(self.probe)
+
+    async def page_title(self) -> str:
+        return await self.run(lambda: self.driver.title)
+
+    def activate(self, notebook_id: str) -> NotebookTab:
+        """Focus the tab for notebook_id (see NotebookTabs.activate). Blocking; raises notebook_query.QueryError."""
+        try:
+            return self.tabs.activate(notebook_id)
+        except WebDriverException as e:
+            raise QueryError(500, f"Could not switch to a tab for the notebook: {type(e).__name__} - {e}")
+
+    def reset_conversation(self, tab: NotebookTab, reason: str) -> NotebookTab:
+        """Reload or replace a tab whose chat has grown too long (see NotebookTabs.reset). Blocking; raises notebook_query.QueryError."""
+        try:
+            return self.tabs.reset(tab, reason)
+        except WebDriverException as e:
+            raise QueryError(500, f"Could not reset the conversation: {type(e).__name__} - {e}")
+
+    def ensure_cdp(self) -> CdpSession | None:
+        """(Re)attach the focused tab's DevTools websocket if the cdp transport or network extraction is on. Blocking; None means WebDriver only."""
+        if BROWSER_TRANSPORT != "cdp" and ANSWER_EXTRACTION != "network" or not self.devtools_reachable:
+            return None
+        tab = self.tabs.active
+        if tab.cdp is not None and tab.cdp.connected:
+            return tab.cdp
+        try:
+            tab.cdp = CdpSession.attach(self.driver)
+            module_logger.info(f"Session {self.session_id} attached to DevTools at {tab.cdp.websocket_url}.")
+        except (CdpError, OSError, ValueError) as e:
+            tab.cdp = None
+            self.cdp_attach_failures += 1
+            module_logger.warning(f"Session {self.session_id} could not attach to DevTools, using WebDriver: {type(e).__name__} - {e}")
+        return tab.cdp
+
+    async def source_fingerprint(self, notebook_id: str) -> str | None:
+        """Open (or switch to) the notebook and fingerprint its sources; raises notebook_query.QueryError."""
+        await self.run(self.activate, notebook_id)
+        return await self.run(read_source_fingerprint, self.driver, notebook_id)
+
+    async def query(self, notebook_id: str, llmquery: str, on_delta=None, copy_to_clipboard: bool = False) -> dict:
+        """
+        Run one notebook query on this session's worker thread; raises notebook_query.QueryError.
+
+        The result's timing.phases holds the seconds spent in each query phase.
+        """
+        phases = PhaseTimer()
+        with phases.phase("navigation"):
+            tab = await self.run(self.activate, notebook_id)
+            reason = tab.reset_reason()
+            if reason is not None:
+                tab = await self.run(self.reset_conversation, tab, reason)
+        cdp = await self.run(self.ensure_cdp)
+        capture = NetworkAnswerCapture(cdp, notebook_id=notebook_id) if cdp is not None and ANSWER_EXTRACTION == "network" else None
+        expect_answered_position, tab.unrendered_answered_position = tab.unrendered_answered_position, None
+        await self.run(self.perf_log.begin, "query", llmquery[:200], tab.handle)
+        try:
+            result = await self.run(run_query, self.driver, notebook_id, llmquery, on_delta=on_delta,
+                                    copy_to_clipboard=copy_to_clipboard, cdp=cdp if BROWSER_TRANSPORT == "cdp" else None,
+                                    capture=capture, expect_answered_position=expect_answered_position,
+                                    phases=phases, count_dom_nodes=tab.should_count_dom_nodes())
+        except QueryError:
+            if expect_answered_position:
+                # The previous answer may still render into this chat and skew the next query's counts.
+                tab.reset_requested = "unrendered_answer"
+            raise
+        finally:
+            await self.run(self.perf_log.end)
+        if result.get("answer_source") == "network":
+            tab.unrendered_answered_position = result["final_answered_position"]
+        record_startup("first_answer")
+        self.queries_served += 1
+        tab.queries_served += 1
+        tab.turns += 1
+        dom_nodes = result.pop("dom_nodes", None)
+        if dom_nodes is not None:
+            # Sampled every CONVERSATION_DOM_SAMPLE_TURNS turns; between samples the last count stands.
+            tab.dom_nodes = dom_nodes
+        result["session_id"] = self.session_id
+        result["timing"] = {"phases": phases.as_dict()}
+        return result
+
+    async def aclose(self):
+        try:
+            await self.run(self.close)
+        finally:
+            self.worker.shutdown()
+
+    def close(self):
+        with PhaseTimer().phase("cleanup"):
+            self.tabs.close()
+            try:
+                self.driver.quit()
+                module_logger.info(f"WebDriver for session {self.session_id} closed successfully.")
+            except Exception as e:
+                module_logger.error(f"Error during driver.quit() for session {self.session_id}: {e}", exc_info=True)
+            try:
+                profile_stager.release(self.user_data_dir)
+            except Exception as e:
+                module_logger.error(f"Error removing temporary user data directory {self.user_data_dir}: {e}", exc_info=True)
+
+    @property
+    def browser_pid(self) -> int | None:
+        """chromedriver's pid (Chrome runs below it) for sessions on this host; None for remote nodes."""
+        process = getattr(getattr(self.driver, "service", None), "process", None)
+        return process.pid if process is not None else None
+
+    def describe(self) -> dict:
+        tabs = list(self.tabs)
+        return {
+            "session_id": self.session_id,
+            "node": self.node.name if self.node is not None else None,
+            "performance_log": self.perf_log.stats(),
+            "user_data_dir": self.user_data_dir,
+            "created_at": self.created_at,
+            "idle_seconds": round(time.monotonic() - self.last_used_at, 3),
+            "queries_served": self.queries_served,
+            "current_notebook": self.current_notebook,
+            "notebooks": self.tabs.notebooks,
+            "tabs": self.tabs.describe(),
+            "transport": "cdp" if any(t.cdp is not None and t.cdp.connected for t in tabs) else "webdriver",
+            "cdp_attach_failures": self.cdp_attach_failures,
+            "resource_blocking": merge_stats([t.blocker.stats() for t in tabs if t.blocker is not None]),
+        }
+
+
+def launch_session(session_id: str, notebook_id: str | None = None,
+                   worker: SessionWorker | None = None, resource_blocking: str = RESOURCE_BLOCKING,
+                   node: WebDriverNode | None = None) -> BrowserSession:
+    """
+    Stage a profile, start Chrome and optionally open the notebook. Blocking; call it on the session's worker.
+
+    resource_blocking is "off", "on" or "observe" (see resource_blocking.py). node
+    is where Chrome runs: None or the local node starts this host's chromedriver,
+    a remote node gets a webdriver.Remote session. Nodes on other hosts cannot
+    use a staged profile and run from WEBDRIVER_NODE_PROFILE_DIR on the node;
+    a template cookies.json, if present, is applied on top. A session that
+    lands on the sign-in page raises NotLoggedInError.
+    """
+    phases = PhaseTimer()
+    user_data_dir = None
+    if node is None or node.same_host:
+        try:
+            with phases.phase("profile_copy"):
+                user_data_dir = profile_stager.acquire()
+            module_logger.info(f"[{session_id}] Using staged user data directory: {user_data_dir}")
+        except Exception as copy_error:
+            module_logger.error(f"[{session_id}] Error staging user data directory from {SOURCE_USER_DATA_DIR}: {copy_error}", exc_info=True)
+            raise
+
+    options = build_chrome_options(user_data_dir if user_data_dir else WEBDRIVER_NODE_PROFILE_DIR)
+
+    driver = None
+    blocker = None
+    try:
+        with phases.phase("chrome_launch"):
+            if node is None or node.is_local:
+                service = Service(
+                    executable_path=CHROMEDRIVER_EXECUTABLE,
+                    service_args=[],
+                    # ChromeDriver's own logs go to stdout in the verbose profile and nowhere otherwise.
+                    log_output=subprocess.STDOUT if BROWSER_LOG_VERBOSE else subprocess.DEVNULL
+                )
+                module_logger.info(f"[{session_id}] Attempting to instantiate webdriver.Chrome with configured service and options.")
+                driver = webdriver.Chrome(service=service, options=options)
+            else:
+                module_logger.info(f"[{session_id}] Starting a remote session on node {node.name} ({node.url}).")
+                driver = webdriver.Remote(command_executor=node.url, options=options)
+            driver.get("about:blank")
+        module_logger.info(f"[{session_id}] webdriver.Chrome instantiated successfully. Driver session ID: {driver.session_id if driver.session_id else 'N/A'}")
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+
+        if resource_blocking != "off" and (node is None or node.same_host):
+            try:
+                blocker = ResourceBlocker.attach(driver, session_id, enforce=resource_blocking == "on")
+            except (CdpError, OSError, ValueError) as e:
+                module_logger.warning(f"[{session_id}] Could not start resource blocking, loading pages unblocked: {type(e).__name__} - {e}")
+
+        _load_cookies_file(driver, user_data_dir or profile_stager.template_dir)
+
+        perf_log = PerformanceLog(driver, session_id)
+        if notebook_id:
+            module_logger.info(f"[{session_id}] Navigating to: {notebook_id}")
+            perf_log.begin("navigation", notebook_id, driver.current_window_handle)
+            with phases.phase("navigation"):
+                driver.get(notebook_id)
+                WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+            module_logger.info(f"[{session_id}] Page body loaded.")
+            _check_logged_in(driver, session_id)
+
+        _log_browser_console(driver)
+        perf_log.end()
+        session = BrowserSession(session_id, driver, user_data_dir, worker=worker, blocker=blocker,
+                                 resource_blocking=resource_blocking, node=node, perf_log=perf_log)
+        session.current_notebook = notebook_id
+        module_logger.info(f"[{session_id}] Session ready; launch phases in seconds: {phases.as_dict()}")
+        return session
+    except Exception as e:
+        if isinstance(e, TimeoutException):
+            TIMEOUTS.inc(operation="launch")
+        module_logger.error(f"[{session_id}] Driver setup failed: {e}", exc_info=True)
+        if blocker:
+            blocker.close()
+        if driver:
+            try:
+                driver.quit()
+            except Exception as quit_error:
+                module_logger.error(f"[{session_id}] Error during driver quit after setup failure: {quit_error}", exc_info=True)
+        profile_stager.release(user_data_dir)
+        raise
+
+
+class DriverPool:
+    """
+    Keeps between min_size and max_size warm Chrome sessions.
+
+    Sessions are handed out exclusively through checkout()/checkin(); a session
+    that fails its health probe or is returned as broken is quit and replaced.
+    Each session runs on a node from the registry, picked by the notebook's
+    place on the hash ring; sessions on a node that goes down are evicted and
+    relaunched on the nodes that remain.
+    """
+
+    def __init__(self, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 checkout_timeout: float = POOL_CHECKOUT_TIMEOUT,
+                 health_probe_interval: float = POOL_HEALTH_PROBE_INTERVAL,
+                 launcher=launch_session, registry: NodeRegistry | None = None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_probe_interval = health_probe_interval
+        self.notebook_id: str | None = None
+        self._launcher = launcher
+        self._idle: list[BrowserSession] = []
+        self._in_use: dict[str, BrowserSession] = {}
+        self._launching = 0
+        # Bumped by close(); launches that finish under an older generation are quit instead of pooled.
+        self._generation = 0
+        self._launch_tasks: set[asyncio.Task] = set()
+        self._started = False
+        self._ids = itertools.count(1)
+        self._cond = asyncio.Condition()
+        self.evictions = 0
+        self.registry = registry or NodeRegistry.from_env()
+        self._node_watcher: asyncio.Task | None = None
+        self._log_drainer: asyncio.Task | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._launching
+
+    @property
+    def capacity(self) -> int:
+        """Sessions the pool may hold: max_size, or less while the healthy nodes have fewer slots."""
+        return int(min(self.max_size, self.registry.capacity()))
+
+    def _configure(self, min_size: int | None, max_size: int | None):
+        if max_size is not None:
+            self.max_size = max_size
+        if min_size is not None:
+            self.min_size = min_size
+        if self.max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if self.min_size > self.max_size:
+            raise ValueError(f"min_size ({self.min_size}) cannot exceed max_size ({self.max_size})")
+
+    async def _launch(self, notebook_id: str | None = None) -> BrowserSession:
+        # notebook_id only picks the node; the session opens the pool's notebook like any other.
+        try:
+            node = self.registry.reserve(notebook_id)
+        except NodeUnavailableError as e:
+            raise PoolExhaustedError(str(e)) from e
+        # Chrome is started on the thread that will own it for the rest of its life.
+        session_id = f"session-{next(self._ids)}"
+        worker = SessionWorker(session_id)
+        try:
+            session = await worker.run(self._launcher, session_id, self.notebook_id, worker=worker, node=node)
+        except BaseException as e:
+            worker.shutdown()
+            self.registry.release(node)
+            if isinstance(e, Exception):
+                # A logged-out remote node would only serve sign-in pages; take it out at once.
+                self.registry.record(node, e, login_failed=isinstance(e, NotLoggedInError) and not node.is_local)
+            raise
+        self.registry.record(node)
+        return session
+
+    async def _quit(self, session: BrowserSession):
+        try:
+            await session.aclose()
+        finally:
+            if session.node is not None:
+                self.registry.release(session.node)
+
+    async def start(self, notebook_id: str, min_size: int | None = None, max_size: int | None = None) -> list[BrowserSession]:
+        """Start (or resize) the pool and launch sessions in parallel until min_size are live."""
+        async with self._cond:
+            self._configure(min_size, max_size)
+            self.notebook_id = notebook_id
+            first_start = not self._started
+            self._started = True
+            missing = max(0, self.min_size - self.size)
+            self._launching += missing
+            generation = self._generation
+
+        if first_start:
+            # Reclaim profiles left in the staging root by crashed processes before adding new ones.
+            await asyncio.to_thread(profile_stager.janitor)
+            await asyncio.to_thread(_prepare_profile_template)
+            if self.registry.has_remote and self._node_watcher is None:
+                self._node_watcher = asyncio.create_task(self._watch_nodes(), context=contextvars.Context())
+            if self._log_drainer is None:
+                # A fresh context: the pool's own tasks are not part of the request that started them.
+                self._log_drainer = asyncio.create_task(self._drain_logs(), context=contextvars.Context())
+
+        if not missing:
+            return []
+
+        results = await asyncio.gather(*(self._launch() for _ in range(missing)), return_exceptions=True)
+        launched = [r for r in results if isinstance(r, BrowserSession)]
+        failures = [r for r in results if not isinstance(r, BrowserSession)]
+        async with self._cond:
+            current = generation == self._generation
+            if current:
+                self._launching -= missing
+                self._idle.extend(launched)
+                if failures and not self.size:
+                    self._started = False
+            self._cond.notify_all()
+        if not current:
+            await asyncio.gather(*(self._quit(s) for s in launched))
+            raise PoolNotStartedError("Driver pool was closed while its sessions were launching.")
+        if failures and not launched:
+            raise failures[0]
+        for failure in failures:
+            module_logger.error(f"Session launch failed while starting pool: {type(failure).__name__} - {failure}")
+        return launched
+
+    def _take_idle(self, notebook_id: str | None) -> BrowserSession:
+        # Prefer a session with a tab already showing the notebook, then one on the
+        # notebook's nodes in ring order, then the most recently used.
+        if notebook_id is not None:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i].has_notebook(notebook_id):
+                    return self._idle.pop(i)
+            for node in self.registry.route(notebook_id):
+                for i in range(len(self._idle) - 1, -1, -1):
+                    if self._idle[i].node is node:
+                        return self._idle.pop(i)
+        return self._idle.pop()
+
+    async def checkout(self, timeout: float | None = None, notebook_id: str | None = None) -> BrowserSession:
+        """Hand out an idle, healthy session, growing the pool up to max_size if needed."""
+        if not self._started:
+            raise PoolNotStartedError("Driver pool not initialized. Please call /driver/setup first.")
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            launch = False
+            async with self._cond:
+                while not self._idle and self.size >= self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhaustedError(f"No browser session became available within {timeout} seconds.")
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        raise PoolExhaustedError(f"No browser session became available within {timeout} seconds.")
+                if self._idle:
+                    session = self._take_idle(notebook_id)
+                    self._in_use[session.session_id] = session
+                else:
+                    self._launching += 1
+                    launch = True
+
+            if launch:
+                return await self._checkout_launch(notebook_id, deadline, timeout)
+
+            if time.monotonic() - session.last_used_at < self.health_probe_interval:
+                return session
+            if await session.run(session.probe):
+                return session
+            await self.evict(session)
+
+    async def _checkout_launch(self, notebook_id: str | None, deadline: float, timeout: float) -> BrowserSession:
+        # The caller has counted the launch in _launching. The launch runs as its own task so a
+        # caller giving up (deadline or cancellation) leaves the new session to the pool, not orphaned.
+        claim = {"abandoned": False, "session": None}
+        task = asyncio.create_task(self._launch_for_checkout(notebook_id, self._generation, claim))
+        self._launch_tasks.add(task)
+        task.add_done_callback(self._launch_done)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            claim["abandoned"] = True
+            if claim["session"] is not None:
+                asyncio.create_task(self.checkin(claim["session"]))
+            raise
+        if task in done:
+            return task.result()
+        claim["abandoned"] = True
+        if claim["session"] is not None:
+            return claim["session"]
+        raise PoolExhaustedError(f"No browser session became available within {timeout} seconds.")
+
+    def _launch_done(self, task: asyncio.Task):
+        self._launch_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so a launch its caller gave up on does not log "exception was never retrieved".
+            module_logger.debug(f"Session launch failed: {task.exception()!r}")
+
+    async def _launch_for_checkout(self, notebook_id: str | None, generation: int, claim: dict) -> BrowserSession:
+        try:
+            session = await self._launch(notebook_id)
+        except BaseException:
+            async with self._cond:
+                if generation == self._generation:
+                    self._launching -= 1
+                self._cond.notify_all()
+            raise
+        # Counting the launch out and the session in happen together, so size never dips in between.
+        async with self._cond:
+            current = generation == self._generation and self._started
+            if generation == self._generation:
+                self._launching -= 1
+            if current and claim["abandoned"]:
+                session.last_used_at = time.monotonic()
+                self._idle.append(session)
+            elif current:
+                self._in_use[session.session_id] = session
+                claim["session"] = session
+            self._cond.notify_all()
+        if not current:
+            module_logger.info(f"Pool closed while {session.session_id} was launching; quitting it.")
+            await self._quit(session)
+            raise PoolNotStartedError("Driver pool was closed while the session launched.")
+        return session
+
+    async def checkin(self, session: BrowserSession, broken: bool = False):
+        """Return a session to the pool; broken sessions are evicted instead of reused."""
+        if broken or session.broken:
+            await self.evict(session)
+            return
+        async with self._cond:
+            self._in_use.pop(session.session_id, None)
+            session.last_used_at = time.monotonic()
+            self._idle.append(session)
+            self._cond.notify()
+
+    @asynccontextmanager
+    async def session(self, timeout: float | None = None):
+        session = await self.checkout(timeout)
+        try:
+            yield session
+        except BaseException:
+            session.broken = session.broken or not await session.run(session.probe)
+            raise
+        finally:
+            await self.checkin(session)
+
+    async def evict(self, session: BrowserSession):
+        async with self._cond:
+            self._in_use.pop(session.session_id, None)
+            if session in self._idle:
+                self._idle.remove(session)
+            self.evictions += 1
+            self._cond.notify_all()
+        module_logger.warning(f"Evicting browser session {session.session_id}.")
+        await self._quit(session)
+
+    async def close_session(self, session_id: str):
+        """Close one idle session by id; sessions serving a query are marked to be evicted on checkin."""
+        async with self._cond:
+            for session in self._idle:
+                if session.session_id == session_id:
+                    self._idle.remove(session)
+                    break
+            else:
+                if session_id in self._in_use:
+                    self._in_use[session_id].broken = True
+                    return False
+                raise SessionNotFoundError(session_id)
+            self._cond.notify_all()
+        await self._quit(session)
+        return True
+
+    async def close(self) -> int:
+        """Quit every idle session and stop the pool. Busy sessions are quit when checked in."""
+        async with self._cond:
+            idle, self._idle = self._idle, []
+            for session in self._in_use.values():
+                session.broken = True
+            self._started = False
+            # Sessions still launching are quit when they finish (see _launch_for_checkout and start).
+            self._generation += 1
+            self._launching = 0
+            self._cond.notify_all()
+        for task in (self._node_watcher, self._log_drainer):
+            if task is not None:
+                task.cancel()
+        self._node_watcher = self._log_drainer = None
+        await asyncio.gather(*(self._quit(s) for s in idle))
+        await asyncio.to_thread(profile_stager.discard_spares)
+        return len(idle)
+
+    def stats(self) -> dict:
+        return {
+            "started": self._started,
+            "notebook_id": self.notebook_id,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "idle": len(self._idle),
+            "in_use": len(self._in_use),
+            "launching": self._launching,
+            "evictions": self.evictions,
+            "sessions": [s.describe() for s in self._idle + list(self._in_use.values())],
+            "profile_staging": profile_stager.stats(),
+            "nodes": self.registry.stats(),
+        }
+
+    def browser_pids(self) -> list[int]:
+        """chromedriver pids of the pool's sessions on this host, for memory accounting."""
+        sessions = self._idle + list(self._in_use.values())
+        return [pid for pid in (s.browser_pid for s in sessions) if pid is not None]
+
+    async def _drop_node_sessions(self, node: WebDriverNode):
+        """Evict the node's idle sessions; busy ones are marked broken and evicted on checkin."""
+        async with self._cond:
+            idle = [s for s in self._idle if s.node is node]
+            for session in idle:
+                self._idle.remove(session)
+            for session in self._in_use.values():
+                if session.node is node:
+                    session.broken = True
+            self.evictions += len(idle)
+            self._cond.notify_all()
+        if idle:
+            module_logger.warning(f"Evicting {len(idle)} idle session(s) on WebDriver node {node.name}.")
+        await asyncio.gather(*(self._quit(s) for s in idle))
+
+    async def _watch_nodes(self):
+        """Probe remote nodes; move sessions off nodes that go down and refill the pool elsewhere."""
+        while True:
+            await asyncio.sleep(NODE_HEALTH_INTERVAL_SECONDS)
+            try:
+                for node in await asyncio.to_thread(self.registry.check_all):
+                    await self._drop_node_sessions(node)
+                if self._started and self.size < self.min_size:
+                    await self.start(self.notebook_id)
+            except Exception as e:
+                module_logger.error(f"Rebalancing after a node health check failed: {type(e).__name__} - {e}")
+
+    async def _drain_logs(self):
+        """Empty every session's chromedriver log buffers so they stay bounded between queries."""
+        while True:
+            await asyncio.sleep(PERF_LOG_DRAIN_SECONDS)
+            # Drains are queued on each session's worker, so they run between that session's WebDriver calls.
+            sessions = self._idle + list(self._in_use.values())
+            results = await asyncio.gather(*(s.run(s.perf_log.drain) for s in sessions), return_exceptions=True)
+            for session, result in zip(sessions, results):
+                if isinstance(result, Exception):
+                    module_logger.debug(f"[{session.session_id}] Log drain failed: {type(result).__name__} - {result}")
+
+    def waterfalls(self, session_id: str | None = None, limit: int | None = None, requests: bool = True) -> dict:
+        """Recent navigation and query waterfalls per session (newest first); raises SessionNotFoundError."""
+        sessions = {s.session_id: s for s in self._idle + list(self._in_use.values())}
+        if session_id is not None:
+            if session_id not in sessions:
+                raise SessionNotFoundError(session_id)
+            sessions = {session_id: sessions[session_id]}
+        return {sid: s.perf_log.describe(limit, requests) for sid, s in sessions.items()}
+
+    async def add_node(self, name: str, url: str, max_sessions: int | None = NODE_MAX_SESSIONS) -> dict:
+        """Register a remote WebDriver node; raises ValueError if the name is taken or it does not answer /status."""
+        node = WebDriverNode(name, url, max_sessions)
+        try:
+            await asyncio.to_thread(node.probe)
+        except (OSError, ValueError, RuntimeError) as e:
+            raise ValueError(f"WebDriver node {url} did not answer /status: {e}") from e
+        self.registry.add(node)
+        async with self._cond:
+            self._cond.notify_all()
+        if self._started and self._node_watcher is None:
+            self._node_watcher = asyncio.create_task(self._watch_nodes(), context=contextvars.Context())
+        return node.describe()
+
+    async def remove_node(self, name: str) -> dict:
+        """Unregister a node and evict its sessions; raises NodeNotFoundError."""
+        node = self.registry.remove(name)
+        await self._drop_node_sessions(node)
+        return node.describe()
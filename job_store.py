@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+module_logger = logging.getLogger("app.job_store")
+
+# --- Job Configuration ---
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "jobs.sqlite3")
+# Finished jobs are kept this long, then pruned when new jobs are created.
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", str(7 * 86400)))
+# Upper bound on GET /jobs/{id}?wait=...
+JOB_MAX_WAIT_SECONDS = float(os.environ.get("JOB_MAX_WAIT_SECONDS", "60"))
+# How often a long poll re-reads a job that is running in another web worker.
+JOB_POLL_SECONDS = 0.5
+WEBHOOK_TIMEOUT_SECONDS = 10
+WEBHOOK_ATTEMPTS = 3
+
+JOB_PENDING = "pending"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    notebook_id TEXT NOT NULL,
+    llmquery TEXT NOT NULL,
+    params TEXT NOT NULL,
+    webhook_url TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT,
+    webhook_status TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+"""
+
+
+def _process_owner(pid: int) -> str:
+    """pid plus its start time, so a recycled pid (e.g. after a container restart) does not look like the same process."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f"{pid}:{f.read().rsplit(')', 1)[1].split()[19]}"
+    except (OSError, IndexError):
+        return str(pid)
+
+
+def _owner_alive(owner: str | None) -> bool:
+    if not owner:
+        return False
+    pid = int(owner.split(":", 1)[0])
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return _process_owner(pid) == owner
+
+
+class JobStore:
+    """
+    SQLite record of submitted query jobs and their outcomes.
+
+    Thread-safe; every call is a short blocking SQLite transaction, so async
+    callers should go through asyncio.to_thread. Several web workers may share
+    one store: each job records the process running it, and pending jobs whose
+    process has died are failed when a store is opened.
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH, retention_seconds: float = JOB_RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        if "owner" not in [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self.owner = _process_owner(os.getpid())
+        with self._lock:
+            orphaned = [job_id for job_id, owner in self._conn.execute(
+                "SELECT id, owner FROM jobs WHERE status = ?", (JOB_PENDING,)).fetchall() if not _owner_alive(owner)]
+            interrupted = 0
+            for job_id in orphaned:
+                interrupted += self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ? AND status = ?",
+                    (JOB_FAILED, time.time(),
+                     json.dumps({"status_code": 503, "detail": "The service restarted before this job finished; submit it again."}),
+                     job_id, JOB_PENDING),
+                ).rowcount
+        if interrupted:
+            module_logger.warning(f"Marked {interrupted} job(s) interrupted by a restart as failed.")
+
+    def create(self, notebook_id: str, llmquery: str, params: dict, webhook_url: str | None = None) -> dict:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, notebook_id, llmquery, params, webhook_url, created_at, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_PENDING, notebook_id, llmquery, json.dumps(params), webhook_url, now, self.owner),
+            )
+            pruned = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - self.retention_seconds,),
+            ).rowcount
+        if pruned:
+            module_logger.info(f"Pruned {pruned} expired job(s).")
+        return self.get(job_id)
+
+    def finish(self, job_id: str, result: dict | None = None, error: dict | None = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+                (JOB_FAILED if error is not None else JOB_SUCCEEDED, time.time(),
+                 json.dumps(result) if result is not None else None,
+                 json.dumps(error) if error is not None else None, job_id),
+            )
+
+    def set_webhook_status(self, job_id: str, webhook_status: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (webhook_status, job_id))
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, notebook_id, llmquery, params, webhook_url, created_at, finished_at, result, error, webhook_status "
+                "FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row[0],
+            "status": row[1],
+            "notebook_id": row[2],
+            "llmquery": row[3],
+            "params": json.loads(row[4]),
+            "webhook_url": row[5],
+            "created_at": row[6],
+            "finished_at": row[7],
+            "webhook_status": row[10],
+        }
+        if row[8] is not None:
+            job["result"] = json.loads(row[8])
+        if row[9] is not None:
+            job["error"] = json.loads(row[9])
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"path": self.path, "retention_seconds": self.retention_seconds,
+                **{status: counts.get(status, 0) for status in (JOB_PENDING, JOB_SUCCEEDED, JOB_FAILED)}}
+
+
+def deliver_webhook(url: str, payload: dict) -> str:
+    """POST payload as JSON, retrying with backoff. Blocking. Returns a short status for the job record."""
+    body = json.dumps(payload).encode("utf-8")
+    outcome = "not attempted"
+    for attempt in range(1, WEBHOOK_ATTEMPTS + 1):
+        request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT_SECONDS) as response:
+                return f"delivered ({response.status})"
+        except urllib.error.HTTPError as e:
+            outcome = f"failed ({e.code})"
+            if e.code < 500:
+                break
+        except (urllib.error.URLError, OSError) as e:
+            outcome = f"failed ({type(e).__name__}: {e})"
+        module_logger.warning(f"Webhook delivery to {url} attempt {attempt} {outcome}.")
+        if attempt < WEBHOOK_ATTEMPTS:
+            time.sleep(2 ** attempt)
+    return outcome
@@ -0,0 +1,137 @@
+"""
+Logging profiles: where records go, how they are formatted and how much debug output survives.
+
+Every record is handed to a bounded queue on the calling thread and formatted and
+written by one listener thread, so request handlers and session workers never wait
+on stderr. If the queue is full the record is dropped and counted instead.
+
+    LOG_PROFILE=debug       DEBUG, text lines, verbose Chrome and chromedriver output (the default)
+    LOG_PROFILE=production  INFO, one JSON object per line, LOG_DEBUG_SAMPLE_RATE of requests keep their
+                            DEBUG records, Chrome and chromedriver logging off
+
+Records carry the id of the request they were logged for (the X-Request-Id header,
+or a generated one), including records from session worker threads and the broker.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import zlib
+from datetime import datetime, timezone
+
+from metrics import Counter
+
+# --- Logging Configuration ---
+LOG_PROFILE = os.environ.get("LOG_PROFILE", "debug")
+_PRODUCTION = LOG_PROFILE == "production"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO" if _PRODUCTION else "DEBUG").upper()
+# "text" or "json".
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json" if _PRODUCTION else "text")
+# Share of requests whose DEBUG records are written when LOG_LEVEL is above DEBUG (0 to 1).
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.01" if _PRODUCTION else "0"))
+# Records waiting for the writer thread; beyond this they are dropped rather than blocking the caller.
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Chrome's --enable-logging/--v=1 and chromedriver's own log on stdout.
+BROWSER_LOG_VERBOSE = os.environ.get("BROWSER_LOG_VERBOSE", "0" if _PRODUCTION else "1") == "1"
+# Parent of this service's loggers ("app.main", "app.driver_pool", ...); only their DEBUG records are sampled.
+APP_LOGGER = "app"
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(threadName)s - [%(request_id)s] %(message)s"
+
+request_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+
+DROPPED_RECORDS = Counter("notebooklm_log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the current request id and keeps the app's DEBUG records only for sampled requests."""
+
+    def __init__(self, level: int, sample_rate: float):
+        super().__init__()
+        self.level = level
+        self.sample_rate = sample_rate
+
+    def sampled(self, request_id: str | None) -> bool:
+        if self.sample_rate <= 0:
+            return False
+        if request_id is None:
+            return random.random() < self.sample_rate
+        # Decided by the id, so a sampled request keeps its whole debug trail.
+        return zlib.crc32(request_id.encode("utf-8")) % 10000 < self.sample_rate * 10000
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = request_id_var.get()
+        record.request_id = request_id or "-"
+        if record.levelno >= self.level:
+            return True
+        return (record.name == APP_LOGGER or record.name.startswith(APP_LOGGER + ".")) and self.sampled(request_id)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments here; formatting (tracebacks included) happens on the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORDS.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging():
+    """Route all logging through the queue for the selected profile. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    level = logging.getLevelName(LOG_LEVEL)
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    records: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = _DroppingQueueHandler(records)
+    handler.addFilter(RequestContextFilter(level, LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # Only the app's loggers let DEBUG through for sampled requests; the filter drops the rest.
+    # Third-party loggers stay at the configured level, so their DEBUG records are never even created.
+    logging.getLogger(APP_LOGGER).setLevel(logging.DEBUG if LOG_DEBUG_SAMPLE_RATE > 0 else level)
+    # Uvicorn installs its own stderr handlers; send its records through the queue too.
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    # Selenium logs every WebDriver command at DEBUG; only the debug profile wants that.
+    logging.getLogger("selenium.webdriver.remote.remote_connection").setLevel(logging.INFO if not _PRODUCTION else logging.WARNING)
+    logging.getLogger("selenium.webdriver.common").setLevel(logging.DEBUG if not _PRODUCTION else logging.WARNING)
+    logging.getLogger("urllib3").setLevel(logging.INFO if not _PRODUCTION else logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
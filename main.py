@@ -1,469 +1,605 @@
-import tempfile
-from fastapi.responses import JSONResponse
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from fastapi import FastAPI, HTTPException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, ElementClickInterceptedException # Import specific exceptions
-from selenium.webdriver.support import expected_conditions as EC
-import shutil # Import shutil for directory removal
-import time
-import os # Import os for path manipulation
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+import asyncio
+import json
 import logging # Added for robust logging
-import subprocess # Added for robust logging
+import uuid
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from answer_cache import ANSWER_CACHE_ENABLED, CACHE_MODES, AnswerCache, normalize_notebook, normalize_query
+from batch_runner import parse_batch_lines, run_batch
+from broker_client import BROWSER_BROKER_SOCKET, BrokerClient, BrokerUnavailableError
+from driver_pool import DriverPool, PoolExhaustedError, PoolNotStartedError, SessionNotFoundError
+from metrics import CONTENT_TYPE, render_pool_metrics
+from log_pipeline import configure_logging, request_id_var
+from job_store import JOB_MAX_WAIT_SECONDS, JOB_PENDING, JOB_POLL_SECONDS, JobStore, deliver_webhook
+from node_registry import NODE_MAX_SESSIONS, NodeNotFoundError
+from notebook_query import QueryError
+from scheduler import PRIORITIES, DeadlineExceededError, QueueFullError, Scheduler
+from single_flight import SingleFlight
+from warmup import Warmup
 
 # --- Configure Logging ---
-# Configure root logger for basic output.
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(name)s - %(threadName)s - %(message)s',
-    handlers=[logging.StreamHandler()]) # Added a StreamHandler here
+# LOG_PROFILE picks level, format and debug sampling; records are written off the request path (see log_pipeline.py).
+configure_logging()
 
 # Specific logger for this application
 module_logger = logging.getLogger("app.main")
-module_logger.setLevel(logging.DEBUG)
-
-# Configure Selenium's own loggers for more detail
-selenium_connection_logger = logging.getLogger('selenium.webdriver.remote.remote_connection')
-selenium_connection_logger.setLevel(logging.INFO) # Use DEBUG for very verbose wire logs
-selenium_client_logger = logging.getLogger('selenium.webdriver.common')
-selenium_client_logger.setLevel(logging.DEBUG)
 
 
 # --- Global Variables ---
-driver: webdriver.Chrome | None = None
-# Store the user_data_dir created for the current driver session
-current_user_data_dir: str | None = None
-# temp_user_data_dir_manager is not used globally in this version
-# as current_user_data_dir is managed directly.
-
-app = FastAPI()
+if BROWSER_BROKER_SOCKET:
+    # Browsers live in the broker process (broker.py); this worker is a stateless front end and may be one of many.
+    driver_pool = None
+    scheduler = BrokerClient(BROWSER_BROKER_SOCKET)
+else:
+    # Warm Chrome sessions shared by all requests; sized by /driver/setup or DRIVER_POOL_* env vars.
+    driver_pool = DriverPool()
+    # Every browser use is admitted through here: bounded queue, priorities, fairness, deadlines.
+    scheduler = Scheduler(driver_pool)
+# Answers persisted across requests and restarts; None when ANSWER_CACHE_ENABLED=0.
+answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+# Launches the pool at startup when WARMUP_NOTEBOOKS is set; with a broker, the broker warms its own pool.
+warmup = Warmup(driver_pool, scheduler, cache=answer_cache) if driver_pool is not None else None
+# Streaming queries and jobs keep running after a client disconnects so their session is checked in cleanly.
+_background_tasks: set[asyncio.Task] = set()
+# Submitted jobs survive disconnects and restarts of the caller; see POST /jobs.
+job_store = JobStore()
+# Set when the job with that id finishes; lets GET /jobs/{id}?wait=... return immediately.
+_job_done: dict[str, asyncio.Event] = {}
+# Identical /execute/query requests arriving while one is running share its browser run.
+query_flights = SingleFlight()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the server (and /ready) answers while Chrome starts.
+    warmup_task = asyncio.create_task(warmup.run()) if warmup is not None else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    if driver_pool is not None and (driver_pool.started or driver_pool.size):
+        module_logger.info("Shutting down; closing the driver pool.")
+        await driver_pool.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    # Every log record written while serving the request (worker threads and broker included) carries this id.
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+    request_id_var.set(request_id)
+    response = await call_next(request)
+    response.headers["X-Request-Id"] = request_id
+    return response
 
 @app.post("/test")
 async def root():
     return {"message": "Hello from your FastAPI app!"}
 
 @app.get("/driver/setup")
-async def setup_driver(notebook_id: str):
-    global driver, current_user_data_dir
-
-    if driver:
-        raise HTTPException(status_code=400, detail="Driver already initialized. Call /driver/close first if you want to re-initialize.")
-    
-    # Create a temporary user data directory and copy contents from the persistent one
-    source_user_data_dir = "/home/seluser/chrome-profile"
-    current_user_data_dir = tempfile.mkdtemp()
-    module_logger.info(f"Created temporary user data directory: {current_user_data_dir}")
-
-    try:
-        module_logger.info(f"Copying contents from {source_user_data_dir} to {current_user_data_dir}")
-        for item in os.listdir(source_user_data_dir):
-            s = os.path.join(source_user_data_dir, item)
-            d = os.path.join(current_user_data_dir, item)
-            if os.path.isdir(s):
-                shutil.copytree(s, d, symlinks=True, ignore_dangling_symlinks=True)
-            else:
-                shutil.copy2(s, d)
-        module_logger.info("Contents copied successfully.")
-    except Exception as copy_error:
-        module_logger.error(f"Error copying user data directory: {copy_error}", exc_info=True)
-        # Clean up the temporary directory if copying failed
-        if os.path.exists(current_user_data_dir):
-            try:
-                shutil.rmtree(current_user_data_dir)
-                module_logger.info(f"Cleaned up temporary directory {current_user_data_dir} after copy failure.")
-            except Exception as cleanup_error:
-                module_logger.error(f"Error during cleanup of temporary directory after copy failure: {cleanup_error}", exc_info=True)
-        current_user_data_dir = None
-        raise HTTPException(status_code=500, detail=f"Failed to copy user profile data: {copy_error}")
-
-
-    module_logger.info("Setting up new driver instance (headless mode)...")
-    options = Options()
-    module_logger.debug("ChromeOptions instantiated.")
-
-    # Essential arguments for Docker/headless operation
-    options.add_argument("--headless=new")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--disable-extensions")
-
-    # Arguments for enabling Chrome's own verbose logging
-    options.add_argument("--enable-logging=stderr")
-    options.add_argument("--v=1") # Chrome's own verbosity level
-
-    # User's existing experimental options
-    options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    options.add_argument('--disable-blink-features=AutomationControlled')
-    options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
-    
-    # Pass the temporary user data directory to Chrome
-    options.add_argument(f"--user-data-dir={current_user_data_dir}") # Use the temporary user data directory
-    
-    # Capability to enable browser console log retrieval via Selenium client
-    options.set_capability("goog:loggingPrefs", {
-        "browser": "ALL",
-        "driver": "ALL",
-        "performance": "ALL"
-    })
-    module_logger.debug(f"ChromeOptions arguments configured: {options.arguments}")
-    module_logger.debug(f"ChromeOptions capabilities configured: {options.capabilities}")
-
-    # --- ChromeDriver Service ---
-    chromedriver_executable = "/opt/selenium/chromedriver" # Assumes chromedriver is in PATH
-    service_args = [] # No specific extra service args needed for now
-    
-    service = Service(
-        executable_path=chromedriver_executable,
-        service_args=service_args,
-        log_output=subprocess.STDOUT # Directs ChromeDriver's own logs to stdout
-    )
-    module_logger.info(f"ChromeDriver service configured with executable: {chromedriver_executable}, args: {service_args}, and log_output to STDOUT.")
+async def setup_driver(notebook_id: str, min_size: int | None = None, max_size: int | None = None):
+    """
+    Start the driver pool, or resize it if it is already running.
 
+    Launches sessions in parallel until at least min_size are live, each one
+    navigated to notebook_id. Further sessions are started on demand up to max_size.
+    """
     try:
-        module_logger.info("Attempting to instantiate webdriver.Chrome with configured service and options.")
-        driver = webdriver.Chrome(service=service, options=options)
-        
-        # Navigate to a dummy page to set cookies
-        driver.get("about:blank")
-
-        module_logger.info(f"webdriver.Chrome instantiated successfully. Driver session ID: {driver.session_id if driver.session_id else 'N/A'}")
-
-        driver.set_page_load_timeout(200)
-
-        # --- Read and Set Cookies ---
-        # This section is no longer strictly needed if user-data-dir contains the profile,
-        # but keeping it as a fallback or if cookies are stored separately.
-        cookies_file_path = os.path.join(current_user_data_dir, "cookies.json") # Assuming cookies.json is in the user data directory
-        if os.path.exists(cookies_file_path):
-            module_logger.info(f"Found cookies file at {cookies_file_path}. Attempting to load and set cookies.")
-            try:
-                with open(cookies_file_path, 'r') as f:
-                    cookies = json.load(f)
-                for cookie in cookies:
-                    # Add domain and path if missing, as required by add_cookie
-                    if 'domain' not in cookie:
-                         module_logger.warning(f"Cookie with name '{cookie.get('name', 'N/A')}' is missing 'domain'. Skipping add_cookie for this entry.")
-                         continue # Skip cookies without a domain
-                    if 'path' not in cookie:
-                        cookie['path'] = '/'
-                    # add_cookie requires a domain, but we need to be on that domain to add the cookie.
-                    # We'll rely on the user-data-dir for persistent cookies.
-                    # This manual cookie setting might be problematic for cross-domain cookies.
-                    # For simplicity, we rely on user-data-dir persistence primarily.
-                    try:
-                        driver.add_cookie(cookie)
-                        module_logger.debug(f"Successfully added cookie: {cookie.get('name', 'N/A')}")
-                    except Exception as cookie_add_error:
-                        module_logger.warning(f"Could not add cookie {cookie.get('name', 'N/A')}: {cookie_add_error}", exc_info=False)
-
-                module_logger.info("Attempted to load and set cookies (primary reliance on user-data-dir).")
-            except Exception as cookie_load_error:
-                module_logger.warning(f"Error loading or processing cookies file: {cookie_load_error}", exc_info=True)
+        if driver_pool is None:
+            setup = await scheduler.setup(notebook_id, min_size=min_size, max_size=max_size)
         else:
-            module_logger.info(f"No cookies file found at {cookies_file_path}. Proceeding without manually setting cookies.")
+            launched = await driver_pool.start(notebook_id, min_size=min_size, max_size=max_size)
+            warmup.mark_setup()
+            setup = {"launched_sessions": [s.session_id for s in launched], "pool": driver_pool.stats()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BrokerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        module_logger.error(f"Driver pool setup failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Driver setup failed: {type(e).__name__} - {str(e)}")
 
-        module_logger.info(f"Navigating to: {notebook_id}")
-        driver.get(notebook_id)
-        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-        module_logger.info("Page body loaded.")
+    return JSONResponse({
+        "message": f"Driver pool ready; launched {len(setup['launched_sessions'])} new session(s) navigated to notebook.",
+        **setup,
+    })
 
-        # Retrieve and Log Initial Browser Console Logs
+@app.get("/ready")
+async def ready():
+    """200 once browsers are warmed up (see warmup.py) or the pool was set up, 503 until then."""
+    if warmup is None:
         try:
-            module_logger.debug("Attempting to retrieve initial browser console logs using driver.get_log('browser').")
-            browser_logs = driver.get_log("browser")
-            if browser_logs:
-                module_logger.info("--- Initial Browser Console Logs ---")
-                for entry in browser_logs:
-                    module_logger.info(
-                        f"  LEVEL: {entry.get('level', 'N/A')} - "
-                        f"TIMESTAMP: {entry.get('timestamp', 'N/A')} - "
-                        f"MESSAGE: {entry.get('message', 'N/A')}"
-                    )
-                module_logger.info("--- End of Initial Browser Console Logs ---")
-            else:
-                module_logger.info("No initial browser console logs were found via driver.get_log('browser').")
-        except Exception as log_exc:
-            module_logger.warning(f"Could not retrieve initial browser logs via driver.get_log('browser'): {log_exc}", exc_info=True)
-
-        return JSONResponse({"message": "Driver setup successful and navigated to notebook."})
-    
-    except Exception as e:
-        module_logger.error(f"Driver setup failed: {e}", exc_info=True)
-        if driver:
-            try:
-                driver.quit()
-            except Exception as quit_error:
-                module_logger.error(f"Error during driver quit after setup failure: {quit_error}", exc_info=True)
-            driver = None
-
-        # Clean up the temporary directory if setup failed
-        if current_user_data_dir and os.path.exists(current_user_data_dir):
-            try:
-                shutil.rmtree(current_user_data_dir)
-                module_logger.info(f"Cleaned up temporary directory {current_user_data_dir} after driver setup failure.")
-            except Exception as cleanup_error:
-                module_logger.error(f"Error during cleanup of temporary directory after driver setup failure: {cleanup_error}", exc_info=True)
-        current_user_data_dir = None
-
+            status = await scheduler.ready()
+        except BrokerUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    else:
+        status = warmup.describe()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
-        raise HTTPException(status_code=500, detail=f"Driver setup failed: {type(e).__name__} - {str(e)}")
+async def _driver_status() -> dict:
+    """Pool and scheduler stats, from this process or from the broker."""
+    if driver_pool is None:
+        try:
+            return await scheduler.status()
+        except BrokerUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return {**driver_pool.stats(), "scheduler": scheduler.stats()}
+
+@app.get("/driver/status")
+async def driver_status():
+    return await _driver_status()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: phase latency histograms, timeout and stale-element counters, sessions, queue depth, Chrome RSS."""
+    if driver_pool is None:
+        try:
+            text = await scheduler.metrics()
+        except BrokerUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    else:
+        text = await render_pool_metrics(driver_pool, scheduler)
+    return Response(text, media_type=CONTENT_TYPE)
+
+@app.get("/debug/waterfalls")
+async def debug_waterfalls(session_id: str | None = None, limit: int = 5, requests: bool = True):
+    """
+    Recent page-load and query waterfalls from Chrome's performance log, newest first, per session.
+
+    Each lists its requests with start offset, duration, time to first byte,
+    size and status, plus the slowest few. requests=false returns only the summaries.
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    try:
+        if driver_pool is None:
+            sessions = await scheduler.waterfalls(session_id, limit, requests)
+        else:
+            sessions = driver_pool.waterfalls(session_id, limit, requests)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown session id: {session_id}")
+    except BrokerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"sessions": sessions}
+
+def _client_id(request: Request) -> str:
+    # Fairness is per caller: an explicit X-Client-Id header, else the peer address.
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+
+def _check_scheduling(priority: str, deadline: float | None):
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(PRIORITIES)}")
+    if deadline is not None and deadline <= 0:
+        raise HTTPException(status_code=400, detail="deadline must be a positive number of seconds")
+
+# Failures to get a browser at all; _scheduling_error() maps them to HTTP statuses.
+_SCHEDULING_ERRORS = (PoolNotStartedError, PoolExhaustedError, QueueFullError, DeadlineExceededError, BrokerUnavailableError)
+
+def _scheduling_error(e: Exception) -> HTTPException:
+    if isinstance(e, PoolNotStartedError):
+        return HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, QueueFullError):
+        return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if isinstance(e, DeadlineExceededError):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=503, detail=str(e))
 
 @app.get("/execute/capture")
-async def capture_page_title():
-    global driver
-    if not driver:
-        raise HTTPException(status_code=400, detail="Driver not initialized. Please call /driver/setup first.")
-    return {"page_title": driver.title}
+async def capture_page_title(request: Request):
+    try:
+        async with scheduler.session(None, _client_id(request)) as (session, ticket):
+            page_title = await session.page_title()
+    except _SCHEDULING_ERRORS as e:
+        raise _scheduling_error(e)
+    return {"page_title": page_title, "session_id": session.session_id}
+
+def _timing(result: dict, ticket) -> dict:
+    # The session reports its phases in result["timing"]; the ticket adds queue wait and browser time.
+    return {**ticket.timing(), "phases": result.get("timing", {}).get("phases", {})}
+
+def _from_cache(result: dict, age_seconds: float, timing: dict) -> dict:
+    result["session_id"] = None
+    result["timing"] = {**timing, "phases": {}}
+    result["cache"] = {"status": "hit", "age_seconds": round(age_seconds, 3)}
+    return result
+
+async def _cache_lookup(notebook_id: str, llmquery: str) -> tuple[str | None, dict | None]:
+    """(fingerprint, cached result) without a browser; the fingerprint is None when the sources need re-reading."""
+    fingerprint = await asyncio.to_thread(answer_cache.fingerprint, notebook_id)
+    if fingerprint is None:
+        return None, None
+    hit = await asyncio.to_thread(answer_cache.get, notebook_id, llmquery, fingerprint)
+    return fingerprint, _from_cache(*hit, {"queue_wait_seconds": 0.0, "browser_seconds": 0.0}) if hit else None
+
+async def _cache_recheck(session, ticket, notebook_id: str, llmquery: str) -> dict | None:
+    # Sources not checked recently: re-read them (cheap once the notebook is open) before deciding.
+    fingerprint = await session.source_fingerprint(notebook_id)
+    await asyncio.to_thread(answer_cache.record_fingerprint, notebook_id, fingerprint)
+    hit = await asyncio.to_thread(answer_cache.get, notebook_id, llmquery, fingerprint)
+    return _from_cache(*hit, ticket.timing()) if hit else None
+
+async def _cache_store(notebook_id: str, llmquery: str, cache_mode: str, result: dict):
+    """Write a fresh browser answer to the cache as cache_mode says and record the outcome in result["cache"]."""
+    if answer_cache is None or cache_mode == "bypass":
+        result["cache"] = {"status": "disabled" if answer_cache is None else "bypass"}
+        return
+    await asyncio.to_thread(answer_cache.store_result, notebook_id, llmquery, result)
+    result["cache"] = {"status": "miss" if cache_mode == "use" else "refresh"}
+
+async def _answer_query(notebook_id: str, llmquery: str, cache_mode: str = "use", client_id: str = "anonymous",
+                        priority: str = "interactive", deadline: float | None = None,
+                        copy_to_clipboard: bool = False) -> dict:
+    """Serve the answer from the cache when its notebook's sources are unchanged, otherwise run it on a pooled session."""
+    if copy_to_clipboard and cache_mode == "use":
+        # Clicking Copy needs the answer on the page, so the browser has to run; the cache is still refreshed.
+        cache_mode = "refresh"
+    use_cache = answer_cache is not None and cache_mode == "use"
+    fingerprint = None
+    if use_cache:
+        fingerprint, hit = await _cache_lookup(notebook_id, llmquery)
+        if hit:
+            return hit
+
+    async with scheduler.session(notebook_id, client_id, priority, deadline) as (session, ticket):
+        if use_cache and fingerprint is None:
+            hit = await _cache_recheck(session, ticket, notebook_id, llmquery)
+            if hit:
+                return hit
+        result = await session.query(notebook_id, llmquery, copy_to_clipboard=copy_to_clipboard)
+        result["timing"] = _timing(result, ticket)
+    await _cache_store(notebook_id, llmquery, cache_mode, result)
+    return result
 
 @app.get("/execute/query")
-async def execute_query(notebook_id: str, llmquery: str):
-    global driver
-    if not driver:
-        raise HTTPException(status_code=400, detail="Driver not initialized. Please call /driver/setup first.")
-      
-    extracted_response_text = None # Initialize variable to hold the extracted text
+async def execute_query(request: Request, notebook_id: str, llmquery: str, cache: str = "use",
+                        priority: str = "interactive", deadline: float | None = None, copy_to_clipboard: bool = False,
+                        phases: bool = False):
+    """
+    Ask a notebook a question and return the scraped answer.
+
+    cache: "use" (default) serves a cached answer if the notebook's sources are
+    unchanged, "refresh" always asks NotebookLM and overwrites the cached answer,
+    "bypass" neither reads nor writes the cache. The response's `cache.status`
+    reports hit, miss, refresh, bypass or disabled.
+
+    Concurrent identical requests (same notebook, query and cache mode) are
+    coalesced onto one run; `coalesced` is true for the requests that joined it.
+
+    priority ("interactive" or "batch") and deadline (seconds to wait for a
+    browser) are passed to the scheduler: 429 with Retry-After when its queue is
+    full, 504 when the deadline passes first. `timing` splits queue_wait_seconds
+    from browser_seconds; with phases=true it also carries `phases`, the seconds
+    spent navigating, typing, submitting, waiting for and extracting the answer.
+
+    The answer is read in the same browser call that detects it. copy_to_clipboard
+    additionally scrolls to and clicks the answer's Copy button (slower, and never
+    served from the cache).
+    """
+    if cache not in CACHE_MODES:
+        raise HTTPException(status_code=400, detail=f"cache must be one of {', '.join(CACHE_MODES)}")
+    _check_scheduling(priority, deadline)
+    try:
+        return await _coalesced_answer(notebook_id, llmquery, cache, _client_id(request), priority, deadline,
+                                       copy_to_clipboard, phases)
+    except _SCHEDULING_ERRORS as e:
+        raise _scheduling_error(e)
+    except QueryError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+async def _coalesced_answer(notebook_id: str, llmquery: str, cache_mode: str, client_id: str,
+                            priority: str, deadline: float | None, copy_to_clipboard: bool = False,
+                            phases: bool = False) -> dict:
+    # Same normalization as the cache key, so "?authuser=0" or case/whitespace variants coalesce too.
+    key = (normalize_notebook(notebook_id), normalize_query(llmquery), cache_mode, copy_to_clipboard)
+    result, shared = await query_flights.do(
+        key, lambda: _answer_query(notebook_id, llmquery, cache_mode, client_id, priority, deadline, copy_to_clipboard))
+    return _shape_result(result, phases, shared)
+
+def _shape_result(result: dict, phases: bool, coalesced: bool) -> dict:
+    # Always a copy: the same result object is handed to every request coalesced onto one run.
+    timing = result.get("timing", {})
+    if not phases:
+        timing = {k: v for k, v in timing.items() if k != "phases"}
+    return {**result, "timing": timing, "coalesced": coalesced}
+
+@app.get("/execute/stats")
+async def execute_stats():
+    """Single-flight counters: `runs` queries actually executed, `coalesced` browser runs saved by sharing one."""
+    return {"single_flight": query_flights.stats()}
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+async def _single_event(event: str, payload: dict):
+    yield _sse(event, payload)
+
+def _sse_response(stream) -> StreamingResponse:
+    return StreamingResponse(stream, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/execute/query/stream")
+async def execute_query_stream(request: Request, notebook_id: str, llmquery: str, cache: str = "use",
+                               priority: str = "interactive", deadline: float | None = None, phases: bool = False):
+    """
+    Server-Sent Events variant of /execute/query.
+
+    Emits `delta` events ({"delta": "..."}; "replace": true means start over) while
+    the answer renders, then one `final` event carrying the /execute/query JSON,
+    or an `error` event with status_code and detail. A cache hit is a single
+    `final` event. cache, phases and scheduling (priority, deadline, 429/504)
+    work as for /execute/query; scheduling happens before the stream opens.
+    Streams are never coalesced.
+    """
+    if cache not in CACHE_MODES:
+        raise HTTPException(status_code=400, detail=f"cache must be one of {', '.join(CACHE_MODES)}")
+    _check_scheduling(priority, deadline)
+    use_cache = answer_cache is not None and cache == "use"
+    fingerprint = None
+    if use_cache:
+        fingerprint, hit = await _cache_lookup(notebook_id, llmquery)
+        if hit:
+            return _sse_response(_single_event("final", _shape_result(hit, phases, False)))
+    try:
+        session, ticket = await scheduler.acquire(notebook_id, _client_id(request), priority, deadline)
+    except _SCHEDULING_ERRORS as e:
+        raise _scheduling_error(e)
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def emit(item):
+        # Deltas come from the session's worker thread (or the loop itself with a broker); queue every
+        # event through the loop's callback FIFO so the final event can never overtake a delta.
+        loop.call_soon_threadsafe(events.put_nowait, item)
 
+    def on_delta(delta: dict):
+        emit(("delta", delta))
+
+    async def produce():
+        try:
+            if use_cache and fingerprint is None:
+                hit = await _cache_recheck(session, ticket, notebook_id, llmquery)
+                if hit:
+                    emit(("final", _shape_result(hit, phases, False)))
+                    return
+            result = await session.query(notebook_id, llmquery, on_delta=on_delta)
+            result["timing"] = _timing(result, ticket)
+            await _cache_store(notebook_id, llmquery, cache, result)
+            emit(("final", _shape_result(result, phases, False)))
+        except QueryError as e:
+            session.broken = not await session.healthy()
+            emit(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            module_logger.error(f"Streaming query failed: {e}", exc_info=True)
+            session.broken = True
+            emit(("error", {"status_code": 500, "detail": f"{type(e).__name__} - {e}"}))
+        finally:
+            await scheduler.release(ticket, session)
+            emit(None)
+
+    task = asyncio.create_task(produce())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    async def event_stream():
+        while (item := await events.get()) is not None:
+            yield _sse(*item)
+
+    return _sse_response(event_stream())
+
+@app.post("/execute/batch")
+async def execute_batch(request: Request, concurrency: int | None = None, deadline: float | None = None):
+    """
+    Run a JSONL batch of queries across the pool and stream JSONL results back in completion order.
+
+    The body is either raw JSONL or a multipart upload with a `file` field. Each
+    line is {"notebook_id": ..., "llmquery": ..., "id": optional}; each result line
+    echoes index/id/notebook_id/llmquery with status "ok" (and `result`) or
+    "error" (with status_code and detail). concurrency defaults to the pool's max size.
+    Items run at batch priority and yield sessions to waiting interactive requests;
+    deadline bounds each wait for a session.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart batch uploads must include a 'file' field.")
+        raw = await upload.read()
+    else:
+        raw = await request.body()
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Batch body must be UTF-8 encoded JSONL: {e}")
+
+    items, errors = parse_batch_lines(text)
+    pool = await _driver_status()
+    if items and not pool["started"]:
+        raise HTTPException(status_code=400, detail="Driver pool not initialized. Please call /driver/setup first.")
+    if concurrency is not None and concurrency < 1:
+        raise HTTPException(status_code=400, detail="concurrency must be at least 1")
+    _check_scheduling("batch", deadline)
+    client_id = _client_id(request)
+
+    async def result_lines():
+        for error in errors:
+            yield json.dumps(error) + "\n"
+        if items:
+            async for line in run_batch(scheduler, items, concurrency or pool["max_size"], answer_cache,
+                                        client_id, deadline):
+                yield json.dumps(line) + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+async def _run_job(job: dict, client_id: str):
+    """Answer a job's query, record the outcome and call its webhook. Runs detached from the submitting request."""
+    job_id = job["job_id"]
+    params = job["params"]
+    result = error = None
+    try:
+        result = await _coalesced_answer(job["notebook_id"], job["llmquery"], params["cache"], client_id,
+                                         params["priority"], params["deadline"])
+    except _SCHEDULING_ERRORS as e:
+        http_error = _scheduling_error(e)
+        error = {"status_code": http_error.status_code, "detail": http_error.detail}
+    except QueryError as e:
+        error = {"status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        module_logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+        error = {"status_code": 500, "detail": f"{type(e).__name__} - {e}"}
+    try:
+        await asyncio.to_thread(job_store.finish, job_id, result, error)
+    finally:
+        _job_done.pop(job_id).set()
+    if job["webhook_url"]:
+        finished = await asyncio.to_thread(job_store.get, job_id)
+        webhook_status = await asyncio.to_thread(deliver_webhook, job["webhook_url"], finished)
+        await asyncio.to_thread(job_store.set_webhook_status, job_id, webhook_status)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: Request, notebook_id: str, llmquery: str, cache: str = "use",
+                     priority: str = "interactive", deadline: float | None = None, webhook_url: str | None = None):
+    """
+    Queue a query and return its job id at once; the answer is fetched later from GET /jobs/{job_id}.
+
+    Takes the same parameters as /execute/query. The job keeps running if the
+    client disconnects, and its result is stored so it can be read any number of
+    times. With webhook_url, the finished job is POSTed there as JSON.
+    """
+    if cache not in CACHE_MODES:
+        raise HTTPException(status_code=400, detail=f"cache must be one of {', '.join(CACHE_MODES)}")
+    _check_scheduling(priority, deadline)
+    if webhook_url is not None and urlsplit(webhook_url).scheme not in ("http", "https"):
+        raise HTTPException(status_code=400, detail="webhook_url must be an http or https URL")
+    if not (await _driver_status())["started"]:
+        raise HTTPException(status_code=400, detail="Driver pool not initialized. Please call /driver/setup first.")
+
+    params = {"cache": cache, "priority": priority, "deadline": deadline}
+    job = await asyncio.to_thread(job_store.create, notebook_id, llmquery, params, webhook_url)
+    _job_done[job["job_id"]] = asyncio.Event()
+    task = asyncio.create_task(_run_job(job, _client_id(request)))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return JSONResponse(job, status_code=202, headers={"Location": f"/jobs/{job['job_id']}"})
+
+@app.get("/jobs/stats")
+async def job_stats():
+    return await asyncio.to_thread(job_store.stats)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Return a job's status, and its `result` or `error` once finished.
+
+    wait > 0 long-polls: the call returns as soon as the job finishes, or after
+    `wait` seconds (capped at JOB_MAX_WAIT_SECONDS) with the job still pending.
+    """
+    done = _job_done.get(job_id)
+    if done is not None and wait > 0:
+        try:
+            await asyncio.wait_for(done.wait(), min(wait, JOB_MAX_WAIT_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if done is None and wait > 0:
+        # Running in another web worker (or not at all): poll the shared store instead.
+        give_up = asyncio.get_running_loop().time() + min(wait, JOB_MAX_WAIT_SECONDS)
+        while job is not None and job["status"] == JOB_PENDING and asyncio.get_running_loop().time() < give_up:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job id: {job_id}")
+    return job
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(answer_cache.stats)}
+
+@app.post("/cache/clear")
+async def clear_cache():
+    if answer_cache is None:
+        raise HTTPException(status_code=400, detail="Answer cache is disabled (ANSWER_CACHE_ENABLED=0).")
+    removed = await asyncio.to_thread(answer_cache.clear)
+    return {"message": f"Removed {removed} cached answer(s)."}
+
+@app.get("/nodes")
+async def list_nodes():
+    """The WebDriver nodes sessions run on, with their health and session counts."""
+    return JSONResponse({"nodes": (await _driver_status())["nodes"]})
+
+@app.post("/nodes")
+async def add_node(name: str, url: str, max_sessions: int = NODE_MAX_SESSIONS):
+    """Register a remote WebDriver node (e.g. http://10.0.0.7:4444); it must answer /status."""
+    if urlsplit(url).scheme not in ("http", "https"):
+        raise HTTPException(status_code=400, detail="url must be an http or https URL")
+    if max_sessions < 1:
+        raise HTTPException(status_code=400, detail="max_sessions must be at least 1")
     try:
-        current_page_url = driver.current_url
-        if notebook_id not in current_page_url:
-            print(f"Current URL is '{current_page_url}'. Navigating to: {notebook_id}")
-            driver.get(notebook_id)
-            WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            print(f"Successfully navigated to {notebook_id}.")
+        if driver_pool is None:
+            node = await scheduler.add_node(name, url, max_sessions)
         else:
-            print(f"Already on a page related to notebook URL: {notebook_id} (Current: {current_page_url})")
-
-        text_input_selector = (By.XPATH, "//input[@placeholder='Start typing...'] | //textarea[@placeholder='Start typing...']")
-        wait = WebDriverWait(driver, 30)
-        print(f"Attempting to find input field with placeholder 'Start typing...'")
-        input_field = wait.until(EC.element_to_be_clickable(text_input_selector))
-        print(f"Input field found. Clearing and entering query: '{llmquery}'")
-        input_field.clear()
-        input_field.send_keys(llmquery)
-        print("Query entered into the text field successfully.")
-
-        generic_copy_button_selector = (By.XPATH, "//button[contains(@aria-label, 'Copy')]")
-        initial_copy_buttons = driver.find_elements(*generic_copy_button_selector)
-        initial_count = len(initial_copy_buttons)
-        print(f"Initial 'Copy' button count: {initial_count}")
-
-        submit_button_selector = (By.XPATH, "//button[@aria-label='Submit' or @type='submit' or @aria-label='Send' or contains(@class,'send-button-class')]")
-        print(f"Attempting to find and click the submit button using selector: {submit_button_selector}")
-        submit_button_element = wait.until(EC.element_to_be_clickable(submit_button_selector))
-        submit_button_element.click()
-        print("Submit button clicked.")
-
-        print("Waiting for the number of 'Copy' buttons to increase (indicates new response)...")
-        def _check_copy_button_increase(d):
-            elements = d.find_elements(*generic_copy_button_selector)
-            if len(elements) > initial_count:
-                return elements
-            return False
-
-        all_generic_copy_buttons_after_increase = WebDriverWait(driver, 60, poll_frequency=1).until(
-            _check_copy_button_increase,
-            message=f"Timeout: Number of generic 'Copy' buttons did not increase from {initial_count} within 60 seconds. A new response might not have appeared."
-        )
-
-        current_generic_button_count = len(all_generic_copy_buttons_after_increase)
-        print(f"Number of generic 'Copy' buttons has increased from {initial_count} to: {current_generic_button_count}. New response detected.")
-
-        action_message = f"Query submitted, new response detected. Generic copy button count changed from {initial_count} to {current_generic_button_count}."
-        new_button_details = {}
-
-        # JavaScript to get XPath (defined here as it will be used once for the final log)
-        js_get_xpath = """
-        function getElementXPath(elt) {
-            let path = "";
-            for (; elt && elt.nodeType === Node.ELEMENT_NODE; elt = elt.parentNode) {
-                let idx = 0;
-                let sibling = elt.previousSibling;
-                while (sibling) {
-                    if (sibling.nodeType === Node.ELEMENT_NODE && sibling.tagName === elt.tagName) {
-                        idx++;
-                    }
-                    sibling = sibling.previousSibling;
-                }
-                let nodeName = elt.tagName.toLowerCase();
-                let hasNextSiblingWithSameTag = false;
-                sibling = elt.nextSibling;
-                while (sibling) {
-                    if (sibling.nodeType === Node.ELEMENT_NODE && sibling.tagName === elt.tagName) {
-                        hasNextSiblingWithSameTag = true;
-                        break;
-                    }
-                    sibling = sibling.nextSibling;
-                }
-                if (idx > 0 || (idx === 0 && hasNextSiblingWithSameTag)) {
-                    nodeName += "[" + (idx + 1) + "]";
-                }
-                path = "/" + nodeName + path;
-            }
-            return path;
-        }
-        return getElementXPath(arguments[0]);
-        """
-
-        if all_generic_copy_buttons_after_increase:
-            # The newly added button is typically the last one in the list
-            new_button = all_generic_copy_buttons_after_increase[-1]
-            print("\n--- Processing the newly added 'Copy' button ---")
-
-            try:
-                button_aria_label = new_button.get_attribute('aria-label')
-                button_text_content = new_button.text.strip()
-                print(f"  Name (Aria-Label): {button_aria_label if button_aria_label else 'N/A'}")
-                if button_text_content:
-                    print(f"  Name (Inner Text): '{button_text_content}'")
-                new_button_details['aria_label'] = button_aria_label
-                new_button_details['text_content'] = button_text_content
-
-                button_xpath = driver.execute_script(js_get_xpath, new_button)
-                print(f"  Generated XPath: {button_xpath if button_xpath else 'N/A'}")
-                new_button_details['xpath'] = button_xpath
-
-                # Scroll the new button into view, using 'false' to align to bottom
-                print(f"  Scrolling to make button '{button_aria_label if button_aria_label else 'newly added Copy button'}' visible...")
-                driver.execute_script("arguments[0].scrollIntoView(false);", new_button)
-                time.sleep(1) # Small pause after scroll to allow rendering
-
-                # Wait for the button to be clickable explicitly before attempting to click
-                print("  Waiting for the new copy button to be clickable...")
-                wait.until(EC.element_to_be_clickable(new_button))
-                print("  New copy button is now clickable.")
-
-                is_displayed_after_scroll = new_button.is_displayed()
-                is_clickable_after_scroll = True # Confirmed by WebDriverWait
-
-                print(f"  Is Displayed (after scroll): {is_displayed_after_scroll}")
-                print(f"  Is Clickable (after scroll): {is_clickable_after_scroll}")
-
-                new_button_details['is_displayed_after_scroll'] = is_displayed_after_scroll
-                new_button_details['is_clickable_after_scroll'] = is_clickable_after_scroll
-
-                # --- Attempt to extract the actual response text directly from the DOM ---
-                try:
-                    # Using a RELATIVE XPath from new_button to its ancestor mat-card, then to mat-card-content
-                    # This is generally more robust than absolute XPaths for dynamic content.
-                    text_content_xpath_relative = "./ancestor::mat-card[1]/mat-card-content"
-                    print(f"  Attempting to extract text using relative XPath: {text_content_xpath_relative}")
-                    # Wait for the text element to be present within the new_button's context
-                    response_text_element = new_button.find_element(By.XPATH, text_content_xpath_relative)
-                    extracted_response_text = response_text_element.text.strip()
-                    print(f"  Extracted response text from DOM: '{extracted_response_text[:100]}...'") # Print first 100 chars
-                except Exception as text_extract_err:
-                    print(f"  Warning: Could not extract response text directly from DOM using relative XPath: {text_extract_err}")
-                    extracted_response_text = None # Ensure it's None if extraction fails
-
-
-                if is_displayed_after_scroll and is_clickable_after_scroll:
-                    print("  Button is visible and clickable. Attempting to click...")
-                    try:
-                        new_button.click() # Attempt standard click first
-                        print("  New copy button clicked successfully (native click).")
-                        action_message += " Newly added copy button details printed, scrolled into view, and clicked."
-                    except ElementClickInterceptedException as click_err:
-                        print(f"  Native click intercepted: {click_err.msg}. Attempting JavaScript click...")
-                        driver.execute_script("arguments[0].click();", new_button)
-                        print("  New copy button clicked successfully (JavaScript click).")
-                        action_message += " Newly added copy button details printed, scrolled into view, and clicked (via JS)."
-                        new_button_details['error'] = f"ElementClickInterceptedException (resolved with JS click): {click_err.msg}"
-                    except Exception as generic_click_error:
-                        print(f"  Error during click: {type(generic_click_error).__name__} - {generic_click_error}. Not clicked.")
-                        action_message += f" Newly added copy button details printed and scrolled into view, but click failed: {type(generic_click_error).__name__}."
-                        new_button_details['error'] = f"Error during click: {type(generic_click_error).__name__} - {generic_click_error}"
-                else:
-                    print("  Warning: Button might not be fully visible or clickable after scroll attempt. Not clicking.")
-                    action_message += " Newly added copy button details printed; scroll attempt made but not clicked due to visibility/clickability."
-
-            except StaleElementReferenceException:
-                stale_msg = "Error: The new copy button became stale before it could be processed or clicked."
-                print(f"  {stale_msg}")
-                action_message += f" {stale_msg}"
-                new_button_details['error'] = stale_msg
-            except Exception as e_attr:
-                attr_err_msg = f"Error processing/clicking button: {type(e_attr).__name__} - {e_attr}"
-                print(f"  {attr_err_msg}")
-                action_message += f" {attr_err_msg}"
-                new_button_details['error'] = attr_err_msg
-            print("--- End of new button details ---\n")
+            node = await driver_pool.add_node(name, url, max_sessions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BrokerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse({"message": f"Node {name} registered.", "node": node})
+
+@app.delete("/nodes/{name}")
+async def remove_node(name: str):
+    """Unregister a node; its idle sessions are quit now and busy ones when their query finishes."""
+    try:
+        if driver_pool is None:
+            node = await scheduler.remove_node(name)
         else:
-            action_message += " No new copy buttons found in the list to detail (this shouldn't happen if count increased)."
-
-        # Return the extracted text along with other details
-        return {
-            "message": action_message,
-            "initial_generic_copy_button_count": initial_count,
-            "final_generic_copy_button_count": current_generic_button_count,
-            "query_submitted": llmquery,
-            "new_button_details": new_button_details,
-            "extracted_response_text": extracted_response_text # This will now contain the scraped text
-        }
-
-    except TimeoutException as te:
-        error_message = f"Timeout occurred during query execution: {str(te)}"
-        print(error_message)
-        raise HTTPException(status_code=408, detail=error_message)
-    except Exception as e:
-        error_message = f"An error occurred during query execution: {type(e).__name__} - {str(e)}"
-        print(error_message)
-        raise HTTPException(status_code=500, detail=error_message)
+            node = await driver_pool.remove_node(name)
+    except NodeNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown node: {name}")
+    except BrokerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse({"message": f"Node {name} removed.", "node": node})
 
 @app.get("/driver/close")
-async def close_driver():
-    global driver, current_user_data_dir
-    closed_driver = False
-    if driver:
-        module_logger.info("Closing WebDriver...")
-        try:
-            driver.quit()
-            driver = None
-            closed_driver = True
-            module_logger.info("WebDriver closed successfully.")
-        except Exception as e:
-            module_logger.error(f"Error during driver.quit(): {e}", exc_info=True)
-            driver = None # Ensure driver is set to None even if quit fails
-    
-    # Clean up the temporary directory after closing the driver
-    if current_user_data_dir and os.path.exists(current_user_data_dir):
-        module_logger.info(f"Cleaning up temporary user data directory: {current_user_data_dir}")
+async def close_driver(session_id: str | None = None):
+    """Close one session (session_id given) or shut the whole pool down."""
+    if session_id:
         try:
-            shutil.rmtree(current_user_data_dir)
-            module_logger.info("Temporary user data directory cleaned up successfully.")
-        except Exception as e:
-            module_logger.error(f"Error removing temporary user data directory {current_user_data_dir}: {e}", exc_info=True)
-        current_user_data_dir = None # Reset global variable after cleanup attempt
-
+            if driver_pool is None:
+                outcome = await scheduler.close(session_id)
+            else:
+                outcome = {"closed_now": await driver_pool.close_session(session_id), "pool": driver_pool.stats()}
+        except SessionNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Unknown session id: {session_id}")
+        except BrokerUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        if outcome["closed_now"]:
+            message = f"Session {session_id} closed and temporary profile cleaned up."
+        else:
+            message = f"Session {session_id} is serving a query; it will be closed when the query finishes."
+        return JSONResponse({"message": message, "pool": outcome["pool"]})
 
-    if closed_driver:
-        return JSONResponse({"message": "Driver closed and temporary profile cleaned up."})
+    if driver_pool is None:
+        try:
+            outcome = await scheduler.close()
+        except BrokerUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    elif not driver_pool.started and not driver_pool.size:
+        outcome = {"was_running": False}
     else:
-        # Even if driver wasn't initialized, attempt to clean up any leftover temp dir
-        message = "Driver was not initialized or already closed."
-        if current_user_data_dir and os.path.exists(current_user_data_dir):
-             module_logger.info(f"Attempting to clean up leftover temporary user data directory: {current_user_data_dir}")
-             try:
-                 shutil.rmtree(current_user_data_dir)
-                 module_logger.info("Leftover temporary user data directory cleaned up successfully.")
-                 message += " Leftover temporary profile cleaned up."
-             except Exception as e:
-                 module_logger.error(f"Error removing leftover temporary user data directory {current_user_data_dir}: {e}", exc_info=True)
-                 message += f" Failed to clean up leftover temporary profile: {e}"
-             current_user_data_dir = None
-             
-        return JSONResponse({"message": message})
+        outcome = {"was_running": True, "closed": await driver_pool.close(), "pool": driver_pool.stats()}
+    if not outcome["was_running"]:
+        return JSONResponse({"message": "Driver was not initialized or already closed."})
+
+    return JSONResponse({
+        "message": f"Driver pool closed; {outcome['closed']} idle session(s) quit and temporary profiles cleaned up.",
+        "pool": outcome["pool"],
+    })
 
 if __name__ == "__main__":
     import uvicorn
-    # Basic logging config for uvicorn if not already handled by a richer config
-    uvicorn_log_config = uvicorn.config.LOGGING_CONFIG
-    uvicorn_log_config["formatters"]["default"]["fmt"] = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
-    uvicorn_log_config["formatters"]["access"]["fmt"] = '%(asctime)s - %(levelname)s - %(client_addr)s - "%(request_line)s" %(status_code)s'
-    
     module_logger.info("Starting FastAPI application with Uvicorn...")
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=False, log_config=uvicorn_log_config)
\ No newline at end of file
+    # Logging is already configured by configure_logging(); uvicorn's records go through the same queue.
+    uvicorn.run(app, host="0.0.0.0", port=8000, reload=False, log_config=None)
\ No newline at end of file
@@ -0,0 +1,251 @@
+"""
+Prometheus metrics for GET /metrics, rendered in the text exposition format.
+
+Counters, gauges and histograms are kept in this process and are safe to update
+from the session worker threads. Phase histograms are fed by PhaseTimer, which
+also gives /execute/query its per-request `timing.phases`. Gauges describing the
+pool are refreshed from the DriverPool and Scheduler at scrape time.
+"""
+import asyncio
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Metrics Configuration ---
+# Upper bounds (seconds) of the phase histogram buckets: from single script calls up to a slow answer.
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_REGISTRY: list["_Metric"] = []
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], object] = {}
+        if not self.labelnames and not isinstance(self, Histogram):
+            # Unlabelled counters and gauges are exported as 0 before their first update.
+            self._values[()] = 0
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self, key: tuple[str, ...], value) -> list[str]:
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}"]
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, value if not isinstance(value, list) else list(value)) for key, value in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in items:
+            lines += self._samples(key, value)
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = PHASE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # Per-bucket counts (not cumulative), then the +Inf overflow, the sum and the count.
+            state = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0, 0])
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self, key: tuple[str, ...], state: list) -> list[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), state):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._labels(key, (('le', _format_value(bound)),))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(state[-2])}")
+        lines.append(f"{self.name}_count{self._labels(key)} {state[-1]}")
+        return lines
+
+
+PHASE_SECONDS = Histogram("notebooklm_phase_seconds",
+                          "Time spent in each phase of launching a session, answering a query or closing a session.",
+                          ("phase",))
+QUERIES = Counter("notebooklm_queries_total", "Browser queries run, by outcome (ok, timeout or error).", ("outcome",))
+TIMEOUTS = Counter("notebooklm_timeouts_total", "Browser operations that timed out, by operation.", ("operation",))
+STALE_ELEMENT_ERRORS = Counter("notebooklm_stale_element_errors_total",
+                               "Page elements that went stale between being found and being used.")
+SESSIONS = Gauge("notebooklm_sessions", "Browser sessions in the pool, by state.", ("state",))
+QUEUE_DEPTH = Gauge("notebooklm_queue_depth", "Requests waiting for a browser session, by priority.", ("priority",))
+CONVERSATION_RESETS = Counter("notebooklm_conversation_resets_total",
+                              "Notebook tabs reloaded or replaced to start a fresh conversation, by reason (turns, dom_nodes or unrendered_answer).",
+                              ("reason",))
+STARTUP_SECONDS = Gauge("notebooklm_startup_seconds",
+                        "Seconds from container start (this process's start outside a container) to each startup "
+                        "milestone: ready (browsers warmed) and first_answer.", ("milestone",))
+CHROME_RSS = Gauge("notebooklm_chrome_rss_bytes",
+                   "Resident memory of the chromedriver and Chrome processes of this host's sessions.")
+
+
+class PhaseTimer:
+    """Times the phases of one launch, query or close; every phase is also observed in PHASE_SECONDS."""
+
+    def __init__(self):
+        self._seconds: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._seconds[name] = self._seconds.get(name, 0.0) + elapsed
+            PHASE_SECONDS.observe(elapsed, phase=name)
+
+    def as_dict(self) -> dict:
+        return {name: round(seconds, 3) for name, seconds in self._seconds.items()}
+
+
+def _children_by_parent() -> dict[int, list[int]]:
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The parent pid is the second field after the parenthesised command name.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def process_tree(*pids: int) -> list[int]:
+    """Every process below the given pids (Linux /proc), not including them."""
+    if not pids:
+        return []
+    children = _children_by_parent()
+    descendants = []
+    stack = [child for pid in pids for child in children.get(pid, [])]
+    while stack:
+        child = stack.pop()
+        descendants.append(child)
+        stack.extend(children.get(child, []))
+    return descendants
+
+
+def process_tree_rss(*pids: int) -> int:
+    """Resident set size in bytes of every process below the given pids (Linux /proc). Shared pages are counted per process."""
+    total = 0
+    for child in process_tree(*pids):
+        try:
+            with open(f"/proc/{child}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+def process_start_time(pid: int) -> float:
+    """Wall-clock time a process started at (Linux /proc)."""
+    with open("/proc/stat") as f:
+        boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime "))
+    with open(f"/proc/{pid}/stat") as f:
+        # Field 22, the start time in clock ticks after boot, counted after the parenthesised command name.
+        start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+    return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def _startup_reference() -> float:
+    # In a container PID 1 is start.sh (or what it exec'd), so its start is the container's.
+    try:
+        return process_start_time(1 if os.path.exists("/.dockerenv") else os.getpid())
+    except (OSError, StopIteration, IndexError, ValueError):
+        return time.time()
+
+
+_STARTED_AT = _startup_reference()
+
+
+def record_startup(milestone: str):
+    """Set notebooklm_startup_seconds{milestone} the first time the milestone is reached."""
+    with STARTUP_SECONDS._lock:
+        if (milestone,) in STARTUP_SECONDS._values:
+            return
+        STARTUP_SECONDS._values[(milestone,)] = round(time.time() - _STARTED_AT, 3)
+
+
+def render() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+async def render_pool_metrics(pool, scheduler) -> str:
+    """Refresh the pool gauges from a DriverPool and its Scheduler, then render every metric."""
+    stats = pool.stats()
+    for state in ("idle", "in_use", "launching"):
+        SESSIONS.set(stats[state], state=state)
+    for priority, depth in scheduler.stats()["queued"].items():
+        QUEUE_DEPTH.set(depth, priority=priority)
+    CHROME_RSS.set(await asyncio.to_thread(process_tree_rss, *pool.browser_pids()))
+    return render()
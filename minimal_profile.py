@@ -0,0 +1,261 @@
+"""
+Derive a minimal logged-in Chrome profile from the full chrome-profile.
+
+Only what keeps the Google session alive is kept: cookies, Local State and
+the login/session storage of the Default profile. Component downloads, model
+stores, shader caches and Safe Browsing lists are dropped; Chrome recreates
+what it needs on demand.
+
+    python minimal_profile.py --source chrome-profile --output chrome-profile-minimal --verify
+"""
+import argparse
+import http.server
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+module_logger = logging.getLogger("app.minimal_profile")
+
+# Paths relative to the profile root that survive pruning.
+KEEP_ENTRIES = (
+    "Local State",
+    "First Run",
+    "Last Version",
+    "Default/Cookies",
+    "Default/Cookies-journal",
+    "Default/Preferences",
+    "Default/Secure Preferences",
+    "Default/Login Data",
+    "Default/Login Data-journal",
+    "Default/Login Data For Account",
+    "Default/Login Data For Account-journal",
+    "Default/Local Storage",
+    "Default/Session Storage",
+    "Default/IndexedDB",
+)
+# Google session cookies; at least one of REQUIRED_AUTH_COOKIES must be present and unexpired.
+AUTH_COOKIE_NAMES = ("SID", "HSID", "SSID", "SAPISID", "__Secure-1PSID", "__Secure-3PSID")
+REQUIRED_AUTH_COOKIES = ("SID", "__Secure-1PSID")
+AUTH_COOKIE_DOMAIN = ".google.com"
+VERIFY_HOST = "notebooklm.google.com"
+# Chrome stores timestamps as microseconds since 1601-01-01.
+_CHROME_EPOCH_OFFSET_SECONDS = 11644473600
+
+
+def _tree_stats(path: str) -> dict:
+    files = size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            f = os.path.join(root, name)
+            if not os.path.islink(f):
+                files += 1
+                size += os.path.getsize(f)
+    return {"files": files, "bytes": size}
+
+
+def build_minimal_profile(source_dir: str, output_dir: str) -> dict:
+    """Copy KEEP_ENTRIES from source_dir into a fresh output_dir and return before/after sizes."""
+    if not os.path.isdir(source_dir):
+        raise FileNotFoundError(f"Source profile not found: {source_dir}")
+
+    staging_dir = tempfile.mkdtemp(prefix=".minimal_profile_", dir=os.path.dirname(os.path.abspath(output_dir)))
+    try:
+        for rel in KEEP_ENTRIES:
+            s = os.path.join(source_dir, rel)
+            d = os.path.join(staging_dir, rel)
+            if not os.path.exists(s):
+                continue
+            os.makedirs(os.path.dirname(d), exist_ok=True)
+            if os.path.isdir(s):
+                shutil.copytree(s, d, symlinks=True, ignore_dangling_symlinks=True)
+            else:
+                shutil.copy2(s, d)
+        # Swap the finished profile in so a running pool never sees a half-built template.
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(staging_dir, output_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    before = _tree_stats(source_dir)
+    after = _tree_stats(output_dir)
+    module_logger.info(f"Built minimal profile {output_dir}: {after['bytes']} bytes in {after['files']} files (source: {before['bytes']} bytes in {before['files']} files).")
+    return {"source": before, "minimal": after}
+
+
+def ensure_minimal_profile(source_dir: str, output_dir: str) -> str:
+    """Build output_dir unless it already exists and is newer than the source cookies."""
+    source_cookies = os.path.join(source_dir, "Default", "Cookies")
+    output_cookies = os.path.join(output_dir, "Default", "Cookies")
+    if os.path.exists(output_cookies) and (
+            not os.path.exists(source_cookies) or os.path.getmtime(output_cookies) >= os.path.getmtime(source_cookies)):
+        return output_dir
+    build_minimal_profile(source_dir, output_dir)
+    return output_dir
+
+
+def check_auth_cookies(profile_dir: str) -> dict:
+    """Read the Cookies database (read-only) and report which Google session cookies are present and unexpired."""
+    cookies_path = os.path.join(profile_dir, "Default", "Cookies")
+    if not os.path.exists(cookies_path):
+        return {"ok": False, "present": [], "expired": [], "missing": list(AUTH_COOKIE_NAMES), "error": "Default/Cookies not found"}
+
+    now_chrome = int((time.time() + _CHROME_EPOCH_OFFSET_SECONDS) * 1_000_000)
+    conn = sqlite3.connect(f"file:{cookies_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT name, has_expires = 0 OR expires_utc > ? FROM cookies WHERE host_key = ?",
+            (now_chrome, AUTH_COOKIE_DOMAIN),
+        ).fetchall()
+    finally:
+        conn.close()
+    live = {name for name, valid in rows if valid}
+    expired = {name for name, valid in rows if not valid} - live
+    return {
+        "ok": any(n in live for n in REQUIRED_AUTH_COOKIES),
+        "present": [n for n in AUTH_COOKIE_NAMES if n in live],
+        "expired": [n for n in AUTH_COOKIE_NAMES if n in expired],
+        "missing": [n for n in AUTH_COOKIE_NAMES if n not in live and n not in expired],
+    }
+
+
+class _CookieRecordingHandler(http.server.BaseHTTPRequestHandler):
+    received_cookie_names: list[str] = []
+
+    def do_GET(self):
+        header = self.headers.get("Cookie", "")
+        names = [part.split("=", 1)[0].strip() for part in header.split(";") if "=" in part]
+        type(self).received_cookie_names.extend(names)
+        body = b"<html><head><title>NotebookLM mock</title></head><body>ok</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        module_logger.debug(f"mock auth server: {format % args}")
+
+
+def _self_signed_cert(workdir: str, host: str) -> tuple[str, str]:
+    cert = os.path.join(workdir, "cert.pem")
+    key = os.path.join(workdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", f"/CN={host}", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def verify_with_mock(profile_dir: str, host: str = VERIFY_HOST) -> dict:
+    """
+    Launch Chrome on a throwaway copy of profile_dir, resolve `host` to a local
+    HTTPS mock and check that the Google session cookies are decrypted and sent.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    from driver_pool import CHROMEDRIVER_EXECUTABLE, build_chrome_options
+    from profile_staging import ProfileStager
+
+    if not shutil.which("openssl"):
+        return {"authenticated": None, "skipped": "openssl not available to create the mock's certificate"}
+
+    workdir = tempfile.mkdtemp(prefix="minimal_profile_verify_")
+    stager = ProfileStager(profile_dir, mode="copy", spares=0)
+    user_data_dir = None
+    server = None
+    driver = None
+    try:
+        cert, key = _self_signed_cert(workdir, host)
+        _CookieRecordingHandler.received_cookie_names = []
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _CookieRecordingHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, name="mock-auth-server", daemon=True).start()
+
+        user_data_dir = stager.stage()
+        options = build_chrome_options(user_data_dir)
+        options.add_argument(f"--host-resolver-rules=MAP {host} 127.0.0.1:{port}")
+        options.add_argument("--ignore-certificate-errors")
+
+        started = time.monotonic()
+        driver = webdriver.Chrome(service=Service(executable_path=CHROMEDRIVER_EXECUTABLE), options=options)
+        launch_seconds = time.monotonic() - started
+        driver.get(f"https://{host}/")
+        sent = sorted(set(_CookieRecordingHandler.received_cookie_names))
+        return {
+            "authenticated": any(n in sent for n in REQUIRED_AUTH_COOKIES),
+            "auth_cookies_sent": [n for n in AUTH_COOKIE_NAMES if n in sent],
+            "chrome_launch_seconds": round(launch_seconds, 3),
+        }
+    finally:
+        if driver:
+            driver.quit()
+        if server:
+            server.shutdown()
+        if user_data_dir:
+            stager.release(user_data_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def measure_staging_seconds(profile_dir: str, repeats: int = 3) -> float:
+    """Best-of-N time to make the full per-session copy of profile_dir."""
+    from profile_staging import ProfileStager
+
+    stager = ProfileStager(profile_dir, mode="copy", spares=0)
+    best = None
+    for _ in range(repeats):
+        started = time.monotonic()
+        path = stager.stage()
+        elapsed = time.monotonic() - started
+        stager.release(path)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a minimal authenticated Chrome profile.")
+    parser.add_argument("--source", default=os.environ.get("CHROME_PROFILE_DIR", "/home/seluser/chrome-profile"))
+    parser.add_argument("--output", default=os.environ.get("CHROME_MINIMAL_PROFILE_DIR", "/home/seluser/chrome-profile-minimal"))
+    parser.add_argument("--verify", action="store_true", help="Launch Chrome against a local HTTPS mock to check the session cookies are sent.")
+    parser.add_argument("--verify-host", default=VERIFY_HOST)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    report = build_minimal_profile(args.source, args.output)
+    report["reduction"] = {
+        "bytes": report["source"]["bytes"] - report["minimal"]["bytes"],
+        "files": report["source"]["files"] - report["minimal"]["files"],
+    }
+    full_seconds = measure_staging_seconds(args.source)
+    minimal_seconds = measure_staging_seconds(args.output)
+    report["setup_copy_seconds"] = {
+        "source": round(full_seconds, 4),
+        "minimal": round(minimal_seconds, 4),
+        "saved": round(full_seconds - minimal_seconds, 4),
+    }
+    report["auth_cookies"] = check_auth_cookies(args.output)
+    if args.verify:
+        report["mock_verification"] = verify_with_mock(args.output, args.verify_host)
+
+    print(json.dumps(report, indent=2))
+    verified = report.get("mock_verification", {}).get("authenticated", True)
+    if not report["auth_cookies"]["ok"] or verified is False:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
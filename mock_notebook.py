@@ -0,0 +1,252 @@
+"""
+A local stand-in for a NotebookLM notebook, for benchmarking without a Google account or network.
+
+Serves /notebook/<id> with the parts of the page run_query relies on: the
+"Start typing..." query box, the Submit button, source titles, and one
+mat-card > mat-card-content per answer. The answer text streams in from
+/rpc/GenerateFreeFormStreamed (which ANSWER_EXTRACTION=network can also parse),
+and the card's Copy button appears --copy-delay-ms after the last chunk.
+
+    python mock_notebook.py --port 8765 --first-token-ms 800 --chunk-ms 50
+    # then use http://127.0.0.1:8765/notebook/<any id> as the notebook URL
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+module_logger = logging.getLogger("app.mock_notebook")
+
+# --- Mock Configuration ---
+# Defaults roughly follow a short NotebookLM answer: a wait before the first words, then steady streaming.
+MOCK_FIRST_TOKEN_MS = 1000
+MOCK_CHUNK_MS = 60
+MOCK_WORDS_PER_CHUNK = 4
+MOCK_ANSWER_WORDS = 120
+MOCK_COPY_DELAY_MS = 300
+MOCK_SOURCE_COUNT = 3
+ANSWER_RPC_PATH = "/rpc/GenerateFreeFormStreamed"
+# Cited in every answer payload, like NotebookLM's source UUIDs.
+MOCK_SOURCE_ID = "00000000-0000-4000-8000-000000000001"
+_FILLER = ("the notebook sources describe this topic in some detail and the answer below summarises "
+           "what they say about it with a few supporting points drawn from each source").split()
+
+MOCK_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Mock notebook __NOTEBOOK__</title></head>
+<body>
+<div class="sources">__SOURCES__</div>
+<div id="chat"></div>
+<textarea placeholder="Start typing..." rows="2" cols="60"></textarea>
+<button type="submit" aria-label="Submit">Send</button>
+<script>
+const config = __CONFIG__;
+const chat = document.getElementById('chat');
+const input = document.querySelector('textarea');
+const submit = document.querySelector('button[aria-label="Submit"]');
+
+function answerText(body) {
+    // Each line is one RPC envelope holding the answer so far; the last complete one wins.
+    let text = null;
+    for (const line of body.split('\\n')) {
+        if (!line.startsWith('[')) continue;
+        try { text = JSON.parse(JSON.parse(line)[0][2])[0][0]; } catch (e) { /* partial line */ }
+    }
+    return text;
+}
+
+function newCard() {
+    const card = document.createElement('mat-card');
+    card.appendChild(document.createElement('mat-card-content'));
+    chat.appendChild(card);
+    return card;
+}
+
+async function ask(query) {
+    submit.disabled = true;
+    const question = document.createElement('div');
+    question.className = 'user-message';
+    question.textContent = query;
+    chat.appendChild(question);
+    let card = null;
+    try {
+        const response = await fetch(config.rpc_path, {method: 'POST', body: JSON.stringify({query: query})});
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let body = '';
+        for (;;) {
+            const {value, done} = await reader.read();
+            if (done) break;
+            body += decoder.decode(value, {stream: true});
+            const text = answerText(body);
+            if (text === null) continue;
+            if (card === null) card = newCard();
+            card.firstChild.innerText = text;
+        }
+    } catch (e) {
+        console.error('Mock answer request failed', e);
+    }
+    if (card === null) {
+        // No answer came back: show an error card, as NotebookLM does, so the page never waits forever.
+        card = newCard();
+        card.className = 'error';
+        card.firstChild.innerText = 'Something went wrong. Please try again.';
+    }
+    setTimeout(function () {
+        const copy = document.createElement('button');
+        copy.setAttribute('aria-label', 'Copy model response to clipboard');
+        copy.textContent = 'Copy';
+        card.appendChild(copy);
+        submit.disabled = false;
+    }, config.copy_delay_ms);
+}
+
+submit.addEventListener('click', function () {
+    const query = input.value.trim();
+    if (!query) return;
+    input.value = '';
+    ask(query);
+});
+</script>
+</body>
+</html>
+"""
+
+
+def mock_answer(query: str, words: int) -> str:
+    """The full answer text for a query; deterministic so runs are comparable."""
+    body = [_FILLER[i % len(_FILLER)] for i in range(max(0, words - 4))]
+    return f"Answer to {query!r}: " + " ".join(body) + "."
+
+
+class MockNotebookServer:
+    """Threaded HTTP server for the mock notebook; start() runs it in the background, stop() shuts it down."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, first_token_ms: int = MOCK_FIRST_TOKEN_MS,
+                 chunk_ms: int = MOCK_CHUNK_MS, words_per_chunk: int = MOCK_WORDS_PER_CHUNK,
+                 answer_words: int = MOCK_ANSWER_WORDS, copy_delay_ms: int = MOCK_COPY_DELAY_MS,
+                 source_count: int = MOCK_SOURCE_COUNT):
+        self.first_token_ms = first_token_ms
+        self.chunk_ms = chunk_ms
+        self.words_per_chunk = max(1, words_per_chunk)
+        self.answer_words = answer_words
+        self.copy_delay_ms = copy_delay_ms
+        self.source_count = source_count
+        self.answers = 0
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def notebook_url(self, notebook: str = "benchmark") -> str:
+        return f"{self.base_url}/notebook/{notebook}"
+
+    def page(self, notebook: str) -> str:
+        sources = "".join(f'<div class="source-title">Mock source {i + 1}</div>' for i in range(self.source_count))
+        config = json.dumps({"rpc_path": ANSWER_RPC_PATH, "copy_delay_ms": self.copy_delay_ms})
+        return (MOCK_PAGE.replace("__NOTEBOOK__", notebook)
+                .replace("__SOURCES__", sources).replace("__CONFIG__", config))
+
+    def chunks(self, query: str):
+        """RPC envelope lines for the answer, each carrying the text so far, as NotebookLM's stream does."""
+        words = mock_answer(query, self.answer_words).split(" ")
+        for end in range(self.words_per_chunk, len(words) + self.words_per_chunk, self.words_per_chunk):
+            payload = json.dumps([[" ".join(words[:end]), None, [MOCK_SOURCE_ID]]])
+            yield json.dumps([["wrb.fr", None, payload]]) + "\n"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                module_logger.debug(f"{self.address_string()} {format % args}")
+
+            def do_GET(self):
+                if not self.path.startswith("/notebook/"):
+                    self.send_error(404)
+                    return
+                body = server.page(self.path.split("?", 1)[0][len("/notebook/"):]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path != ANSWER_RPC_PATH:
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", "0"))
+                query = json.loads(self.rfile.read(length) or b"{}").get("query", "")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.end_headers()
+                # No Content-Length: the body streams until the connection closes, like a chunked RPC.
+                time.sleep(server.first_token_ms / 1000)
+                self.wfile.write(b")]}'\n")
+                for i, line in enumerate(server.chunks(query)):
+                    if i:
+                        time.sleep(server.chunk_ms / 1000)
+                    self.wfile.write(line.encode("utf-8"))
+                    self.wfile.flush()
+                with server._lock:
+                    server.answers += 1
+
+        return Handler
+
+    def start(self) -> "MockNotebookServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-notebook", daemon=True)
+        self._thread.start()
+        module_logger.info(f"Mock notebook serving at {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def add_timing_arguments(parser: argparse.ArgumentParser):
+    """The mock's timing flags, shared with query_benchmark.py."""
+    parser.add_argument("--first-token-ms", type=int, default=MOCK_FIRST_TOKEN_MS, help="Delay before the answer starts streaming.")
+    parser.add_argument("--chunk-ms", type=int, default=MOCK_CHUNK_MS, help="Delay between streamed chunks.")
+    parser.add_argument("--words-per-chunk", type=int, default=MOCK_WORDS_PER_CHUNK)
+    parser.add_argument("--answer-words", type=int, default=MOCK_ANSWER_WORDS)
+    parser.add_argument("--copy-delay-ms", type=int, default=MOCK_COPY_DELAY_MS,
+                        help="Delay between the last chunk and the answer's Copy button appearing.")
+
+
+def server_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> MockNotebookServer:
+    return MockNotebookServer(host, port, first_token_ms=args.first_token_ms, chunk_ms=args.chunk_ms,
+                              words_per_chunk=args.words_per_chunk, answer_words=args.answer_words,
+                              copy_delay_ms=args.copy_delay_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock NotebookLM notebook page.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_timing_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    server = server_from_args(args, args.host, args.port)
+    print(f"Notebook URL: {server.notebook_url()}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
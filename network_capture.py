@@ -0,0 +1,162 @@
+import base64
+import json
+import logging
+import os
+import re
+import time
+
+from cdp_transport import CdpError, CdpSession
+
+module_logger = logging.getLogger("app.network_capture")
+
+# --- Extraction Configuration ---
+# "dom" reads the rendered answer card; "network" parses the answer out of the
+# backend response as soon as it has been received, falling back to the DOM.
+ANSWER_EXTRACTION = os.environ.get("ANSWER_EXTRACTION", "dom")
+# Requests whose URL matches this carry the generated answer (NotebookLM's streamed chat RPC).
+ANSWER_RESPONSE_URL_PATTERN = os.environ.get("ANSWER_RESPONSE_URL_PATTERN", r"GenerateFreeFormStreamed")
+# How often the capture checks the websocket for network events while waiting.
+POLL_INTERVAL_SECONDS = 0.1
+# Give up on the network (and read the DOM) if no answer request was sent within this long of submitting.
+REQUEST_START_SECONDS = 10
+
+# Google RPC responses start with this guard line before the first chunk.
+_XSSI_PREFIX = ")]}'"
+# NotebookLM refers to sources (and notebooks and conversations) by UUID.
+_SOURCE_ID = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b")
+
+
+def _json_chunks(body: str):
+    """Yield every top-level JSON array in a (possibly length-prefixed, chunked) RPC response body."""
+    if body.startswith(_XSSI_PREFIX):
+        body = body[len(_XSSI_PREFIX):]
+    decoder = json.JSONDecoder()
+    pos = 0
+    while (start := body.find("[", pos)) >= 0:
+        try:
+            value, pos = decoder.raw_decode(body, start)
+        except ValueError:
+            pos = start + 1
+            continue
+        yield value
+
+
+def _rpc_payloads(body: str) -> list:
+    """Decode the JSON string each ["wrb.fr", rpc_id, "<json>", ...] envelope carries, in arrival order."""
+    payloads = []
+    for chunk in _json_chunks(body):
+        for entry in chunk if isinstance(chunk, list) else ():
+            if isinstance(entry, list) and len(entry) > 2 and entry[0] == "wrb.fr" and isinstance(entry[2], str):
+                try:
+                    payloads.append(json.loads(entry[2]))
+                except ValueError:
+                    continue
+    return payloads
+
+
+def _source_ids(value) -> list[str]:
+    """Source UUIDs in a citation array: entries are a UUID or an array whose first item is one."""
+    ids = []
+    for entry in value if isinstance(value, list) else ():
+        while isinstance(entry, list) and entry:
+            entry = entry[0]
+        if isinstance(entry, str) and _SOURCE_ID.fullmatch(entry) and entry not in ids:
+            ids.append(entry)
+    return ids
+
+
+def parse_answer_payload(body: str, exclude_ids=()) -> dict | None:
+    """
+    Extract {"text", "citations"} from an answer response body, or None if it does not hold one.
+
+    Each envelope's payload is [answer, ...] with answer = [text, _, citations, ...].
+    Streamed responses repeat the growing answer in successive envelopes, so the
+    last one with answer text is the complete answer. exclude_ids (the notebook
+    and conversation ids) are never reported as citations. None means the
+    structure was not found and the caller should read the DOM.
+    """
+    for payload in reversed(_rpc_payloads(body)):
+        answer = payload[0] if isinstance(payload, list) and payload else None
+        if not isinstance(answer, list) or not answer or not isinstance(answer[0], str) or not answer[0].strip():
+            continue
+        citations = _source_ids(answer[2]) if len(answer) > 2 else []
+        return {"text": answer[0].strip(),
+                "citations": [{"source_id": source_id} for source_id in citations if source_id not in exclude_ids]}
+    return None
+
+
+class NetworkAnswerCapture:
+    """
+    Watches one query's backend traffic over a session's DevTools websocket.
+
+    start() before submitting, wait() for the parsed answer, stop() afterwards.
+    Blocking; runs on the session's worker thread like the rest of the query.
+    """
+
+    def __init__(self, cdp: CdpSession, url_pattern: str = ANSWER_RESPONSE_URL_PATTERN, notebook_id: str | None = None):
+        self.cdp = cdp
+        self.url_pattern = re.compile(url_pattern)
+        # Ids the answer payload may carry that are not citations; the answer request's URL adds its conversation's.
+        self._exclude_ids = {notebook_id} if notebook_id else set()
+        self._urls: dict[str, str] = {}
+        self._finished: list[str] = []
+        self._failed: list[str] = []
+
+    def _on_request(self, params: dict):
+        url = params.get("request", {}).get("url", "")
+        if self.url_pattern.search(url):
+            self._urls[params["requestId"]] = url
+            self._exclude_ids.update(_SOURCE_ID.findall(url))
+
+    def _on_finished(self, params: dict):
+        if params.get("requestId") in self._urls:
+            self._finished.append(params["requestId"])
+
+    def _on_failed(self, params: dict):
+        if params.get("requestId") in self._urls:
+            self._failed.append(params["requestId"])
+
+    def start(self):
+        self.cdp.on("Network.requestWillBeSent", self._on_request)
+        self.cdp.on("Network.loadingFinished", self._on_finished)
+        self.cdp.on("Network.loadingFailed", self._on_failed)
+        self.cdp.send("Network.enable")
+
+    def stop(self):
+        self.cdp.off("Network.requestWillBeSent", self._on_request)
+        self.cdp.off("Network.loadingFinished", self._on_finished)
+        self.cdp.off("Network.loadingFailed", self._on_failed)
+        try:
+            self.cdp.send("Network.disable")
+        except CdpError as e:
+            module_logger.debug(f"Network.disable failed: {e}")
+
+    def wait(self, timeout: float) -> dict | None:
+        """
+        Block until an answer response has arrived and parse it.
+
+        Returns {"text", "citations", "url", "bytes"}, or None when no matching
+        response holds a parseable answer (the caller then reads the DOM).
+        """
+        started = time.monotonic()
+        while time.monotonic() - started < timeout:
+            self.cdp.poll_events(POLL_INTERVAL_SECONDS)
+            if self._finished:
+                request_id = self._finished.pop(0)
+                body = self.cdp.send("Network.getResponseBody", {"requestId": request_id})
+                text = body.get("body", "")
+                if body.get("base64Encoded"):
+                    text = base64.b64decode(text).decode("utf-8", errors="replace")
+                answer = parse_answer_payload(text, self._exclude_ids)
+                if answer is None:
+                    module_logger.warning(f"Response from {self._urls[request_id]} held no parseable answer ({len(text)} bytes); falling back to the DOM.")
+                    return None
+                answer.update(url=self._urls[request_id], bytes=len(text))
+                return answer
+            if self._failed:
+                module_logger.warning("The answer request failed at the network level; falling back to the DOM.")
+                return None
+            if not self._urls and time.monotonic() - started > REQUEST_START_SECONDS:
+                module_logger.warning(f"No request matching {self.url_pattern.pattern} within {REQUEST_START_SECONDS}s; falling back to the DOM.")
+                return None
+        return None
@@ -0,0 +1,293 @@
+"""
+WebDriver nodes sessions can be launched on, and the consistent-hash ring that maps notebooks to them.
+
+Besides this host's chromedriver (the "local" node), any W3C WebDriver endpoint
+can be a node: another selenium/standalone-chrome container built from this
+repo's Dockerfile, or an extra chromedriver process. To try several nodes on
+one machine:
+
+    python node_registry.py spawn --count 3 --base-port 9515
+    python node_registry.py route --nodes http://127.0.0.1:9515,http://127.0.0.1:9516 <notebook url> ...
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+from answer_cache import normalize_notebook
+
+module_logger = logging.getLogger("app.node_registry")
+
+# --- Node Configuration ---
+# Remote WebDriver endpoints, comma-separated; "name=url" names a node (default: its host:port).
+WEBDRIVER_NODES = os.environ.get("WEBDRIVER_NODES", "")
+# Whether sessions may also run on this host's chromedriver.
+WEBDRIVER_LOCAL_NODE = os.environ.get("WEBDRIVER_LOCAL_NODE", "1") == "1"
+# Sessions each remote node accepts (selenium/standalone-chrome runs one unless SE_NODE_MAX_SESSIONS says otherwise).
+NODE_MAX_SESSIONS = int(os.environ.get("WEBDRIVER_NODE_MAX_SESSIONS", "1"))
+NODE_HEALTH_INTERVAL_SECONDS = float(os.environ.get("WEBDRIVER_NODE_HEALTH_INTERVAL", "15"))
+# Consecutive failed checks or launches before a node leaves the ring and its sessions are evicted.
+NODE_FAILURE_THRESHOLD = 2
+NODE_CHECK_TIMEOUT_SECONDS = 5
+# Points per node on the hash ring; more points spread notebooks more evenly.
+RING_POINTS_PER_NODE = 64
+LOCAL_NODE = "local"
+_LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+class NodeUnavailableError(RuntimeError):
+    """No healthy node has room for another session."""
+
+
+class NodeNotFoundError(KeyError):
+    """Raised when a node name is not registered."""
+
+
+def _ring_hash(value: str) -> int:
+    return int(hashlib.sha1(value.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class WebDriverNode:
+    """One place Chrome sessions can run: the local chromedriver (url None) or a remote WebDriver endpoint."""
+
+    def __init__(self, name: str, url: str | None = None, max_sessions: int | None = None):
+        self.name = name
+        self.url = url.rstrip("/") if url else None
+        # None: bounded only by the pool's max_size.
+        self.max_sessions = max_sessions
+        self.sessions = 0
+        self.healthy = True
+        # Set when a session launched here was not logged in; /status cannot tell, so only re-registering clears it.
+        self.login_failed = False
+        self.consecutive_failures = 0
+        self.last_error: str | None = None
+        self.last_checked_at: float | None = None
+        self.launches = 0
+
+    @property
+    def is_local(self) -> bool:
+        return self.url is None
+
+    @property
+    def same_host(self) -> bool:
+        """Sessions here can use locally staged profiles and reach Chrome's DevTools port."""
+        return self.is_local or urlsplit(self.url).hostname in _LOOPBACK_HOSTS
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.max_sessions is None or self.sessions < self.max_sessions
+
+    def probe(self):
+        """GET /status on the endpoint; raises if the node is unreachable or reports itself not ready. Blocking."""
+        if self.is_local:
+            return
+        with urllib.request.urlopen(f"{self.url}/status", timeout=NODE_CHECK_TIMEOUT_SECONDS) as response:
+            value = json.load(response).get("value", {})
+        if not value.get("ready", True):
+            raise RuntimeError(f"not ready: {value.get('message', 'no message')}")
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "login_failed": self.login_failed,
+            "sessions": self.sessions,
+            "max_sessions": self.max_sessions,
+            "launches": self.launches,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_checked_at": self.last_checked_at,
+        }
+
+
+def parse_nodes(spec: str, max_sessions: int = NODE_MAX_SESSIONS) -> list[WebDriverNode]:
+    nodes = []
+    for entry in (e.strip() for e in spec.split(",")):
+        if not entry:
+            continue
+        name, url = "", entry
+        if "=" in entry.split("://", 1)[0]:
+            name, url = entry.split("=", 1)
+        nodes.append(WebDriverNode(name or urlsplit(url).netloc, url, max_sessions))
+    return nodes
+
+
+class NodeRegistry:
+    """
+    Registered nodes plus a consistent-hash ring of the healthy ones.
+
+    A notebook hashes to a point on the ring and prefers the nodes that follow
+    it, so its sessions (and their open tabs) keep landing on the same node.
+    When a node fails only the notebooks that hashed to it move, to the next
+    node along the ring. Thread-safe; probes block, so call check_all() off the event loop.
+    """
+
+    def __init__(self, nodes: list[WebDriverNode] | None = None):
+        self._lock = threading.Lock()
+        self._nodes: dict[str, WebDriverNode] = {}
+        self._ring: list[tuple[int, str]] = []
+        for node in nodes or ():
+            self._nodes[node.name] = node
+        self._rebuild()
+
+    @classmethod
+    def from_env(cls) -> "NodeRegistry":
+        nodes = [WebDriverNode(LOCAL_NODE)] if WEBDRIVER_LOCAL_NODE else []
+        return cls(nodes + parse_nodes(WEBDRIVER_NODES))
+
+    def _rebuild(self):
+        self._ring = sorted((_ring_hash(f"{name}#{i}"), name)
+                            for name, node in self._nodes.items() if node.healthy
+                            for i in range(RING_POINTS_PER_NODE))
+
+    @property
+    def has_remote(self) -> bool:
+        return any(not node.is_local for node in self._nodes.values())
+
+    def get(self, name: str) -> WebDriverNode:
+        try:
+            return self._nodes[name]
+        except KeyError:
+            raise NodeNotFoundError(name)
+
+    def add(self, node: WebDriverNode):
+        with self._lock:
+            if node.name in self._nodes:
+                raise ValueError(f"A node named {node.name} is already registered.")
+            self._nodes[node.name] = node
+            self._rebuild()
+        module_logger.info(f"Registered WebDriver node {node.name} ({node.url or 'local chromedriver'}).")
+
+    def remove(self, name: str) -> WebDriverNode:
+        with self._lock:
+            node = self.get(name)
+            del self._nodes[name]
+            self._rebuild()
+        module_logger.info(f"Removed WebDriver node {name}.")
+        return node
+
+    def capacity(self) -> float:
+        """Sessions the healthy nodes can hold in total (infinite with the local node)."""
+        return sum(float("inf") if n.max_sessions is None else n.max_sessions for n in self._nodes.values() if n.healthy)
+
+    def route(self, notebook_id: str | None) -> list[WebDriverNode]:
+        """Healthy nodes in preference order: ring order from the notebook's hash, or least loaded first without one."""
+        with self._lock:
+            if notebook_id is None:
+                return sorted((n for n in self._nodes.values() if n.healthy), key=lambda n: n.sessions)
+            order = []
+            healthy = sum(1 for n in self._nodes.values() if n.healthy)
+            start = bisect.bisect(self._ring, (_ring_hash(normalize_notebook(notebook_id)), ""))
+            for i in range(len(self._ring)):
+                name = self._ring[(start + i) % len(self._ring)][1]
+                if name not in order:
+                    order.append(name)
+                    if len(order) == healthy:
+                        break
+            return [self._nodes[name] for name in order]
+
+    def reserve(self, notebook_id: str | None) -> WebDriverNode:
+        """Claim a session slot on the first node in the notebook's route with room; raises NodeUnavailableError."""
+        for node in self.route(notebook_id):
+            with self._lock:
+                if node.healthy and node.has_capacity:
+                    node.sessions += 1
+                    node.launches += 1
+                    return node
+        raise NodeUnavailableError("No healthy WebDriver node has room for another session.")
+
+    def release(self, node: WebDriverNode):
+        with self._lock:
+            node.sessions = max(0, node.sessions - 1)
+
+    def record(self, node: WebDriverNode, error: Exception | None = None, login_failed: bool = False) -> bool:
+        """
+        Record a probe or launch outcome. Returns True if this took the node out of the ring.
+
+        login_failed takes the node out at once and keeps it out until it is
+        removed and registered again: its browsers would only see sign-in pages.
+        """
+        with self._lock:
+            node.last_checked_at = time.time()
+            if error is None:
+                node.consecutive_failures = 0
+                if not node.healthy and not node.login_failed:
+                    node.healthy = True
+                    self._rebuild()
+                    module_logger.info(f"WebDriver node {node.name} is healthy again; rejoining the ring.")
+                return False
+            node.consecutive_failures += 1
+            node.last_error = f"{type(error).__name__} - {error}"
+            node.login_failed = node.login_failed or login_failed
+            if node.healthy and (node.login_failed or node.consecutive_failures >= NODE_FAILURE_THRESHOLD):
+                node.healthy = False
+                self._rebuild()
+                module_logger.warning(f"WebDriver node {node.name} failed {node.consecutive_failures} times "
+                                      f"({node.last_error}); its notebooks move to the next node on the ring.")
+                return True
+            return False
+
+    def check_all(self) -> list[WebDriverNode]:
+        """Probe every remote node. Returns the nodes that just went down. Blocking."""
+        went_down = []
+        for node in list(self._nodes.values()):
+            if node.is_local:
+                continue
+            try:
+                node.probe()
+                self.record(node)
+            except (OSError, ValueError, RuntimeError, urllib.error.URLError) as e:
+                if self.record(node, e):
+                    went_down.append(node)
+        return went_down
+
+    def stats(self) -> list[dict]:
+        return [node.describe() for node in self._nodes.values()]
+
+
+def _spawn(count: int, base_port: int, chromedriver: str):
+    """Run `count` chromedriver processes on consecutive ports until interrupted."""
+    processes = [subprocess.Popen([chromedriver, f"--port={base_port + i}"]) for i in range(count)]
+    urls = ",".join(f"http://127.0.0.1:{base_port + i}" for i in range(count))
+    print(f"WEBDRIVER_NODES={urls}", flush=True)
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local WebDriver nodes or show how notebooks route across nodes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    spawn = commands.add_parser("spawn", help="Start several chromedriver nodes on this machine.")
+    spawn.add_argument("--count", type=int, default=3)
+    spawn.add_argument("--base-port", type=int, default=9515)
+    spawn.add_argument("--chromedriver", default=os.environ.get("CHROMEDRIVER_EXECUTABLE", "/opt/selenium/chromedriver"))
+    route = commands.add_parser("route", help="Print each notebook's node preference order.")
+    route.add_argument("--nodes", default=WEBDRIVER_NODES, help="Comma-separated node URLs (default: WEBDRIVER_NODES).")
+    route.add_argument("notebooks", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "spawn":
+        _spawn(args.count, args.base_port, args.chromedriver)
+        return
+    registry = NodeRegistry(parse_nodes(args.nodes))
+    for notebook_id in args.notebooks:
+        print(json.dumps({"notebook_id": notebook_id, "route": [node.name for node in registry.route(notebook_id)]}))
+
+
+if __name__ == "__main__":
+    main()
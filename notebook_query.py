@@ -0,0 +1,639 @@
+import hashlib
+import logging
+import os
+import time
+import uuid
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, ElementClickInterceptedException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+from cdp_transport import CdpError, CdpSession
+from metrics import QUERIES, STALE_ELEMENT_ERRORS, TIMEOUTS, PhaseTimer
+from network_capture import NetworkAnswerCapture
+
+module_logger = logging.getLogger("app.notebook_query")
+
+# --- Query Configuration ---
+# Longest time to wait for NotebookLM to start and finish an answer.
+ANSWER_TIMEOUT_SECONDS = 60
+# An answer counts as complete once its text has not changed for this long.
+ANSWER_QUIET_PERIOD_MS = int(os.environ.get("ANSWER_QUIET_PERIOD_MS", "500"))
+# Least time left for reading the answer from the page after a network capture used up most of ANSWER_TIMEOUT_SECONDS.
+DOM_FALLBACK_MIN_SECONDS = 5
+# Elements whose text names a notebook source; hashed into the source fingerprint the answer cache keys on.
+SOURCE_LIST_SELECTOR = os.environ.get("SOURCE_LIST_SELECTOR", ".source-title, [class*='source-title'], [class*='source-name']")
+# How long the query box and the submit button may take to become usable.
+ELEMENT_WAIT_SECONDS = 30
+QUERY_INPUT_XPATH = "//input[@placeholder='Start typing...'] | //textarea[@placeholder='Start typing...']"
+SUBMIT_BUTTON_XPATH = "//button[@aria-label='Submit' or @type='submit' or @aria-label='Send' or contains(@class,'send-button-class')]"
+
+
+class QueryError(Exception):
+    """A query failed; status_code is how the HTTP layer should report it."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# Answers are counted by position rather than by searching the whole chat: the
+# "answered position" is the 1-based index, among the page's mat-cards, of the
+# newest card holding a Copy button. Each answer card gets its own button, so the
+# scan back from the last card stops within the newest turn however long the
+# chat has grown. With one card per answer it equals the number of answers.
+JS_ANSWERED_POSITION = """
+const copySelector = "button[aria-label*='Copy']";
+function answeredPosition(cards) {
+    for (let i = cards.length - 1; i >= 0; i--) {
+        if (cards[i].querySelector(copySelector)) return i + 1;
+    }
+    return 0;
+}
+"""
+
+
+# Injected into the page after submit. A MutationObserver watches for a new Copy
+# button (one per answer card) and then for the answer text to stop changing for
+# the quiet period, so we return as soon as the answer settles instead of on the
+# next poll tick, and never while text is still streaming in.
+#
+# The watcher's state lives on window so the same watch can be awaited several
+# times: with sinceLength >= 0 a call also resolves as soon as the newest answer
+# card's text length differs from sinceLength, which is how streaming reads deltas.
+#
+# On completion it also describes the new Copy button and its answer card in the
+# same script (label, XPath, visibility, answer text), so no further WebDriver
+# round trips are needed to read the answer.
+JS_WATCH_ANSWER = JS_ANSWERED_POSITION + """
+const watchId = arguments[0];
+const initialCount = arguments[1];
+const initialCardCount = arguments[2];
+const quietMs = arguments[3];
+const timeoutMs = arguments[4];
+const sinceLength = arguments[5];
+const done = arguments[arguments.length - 1];
+const cards = document.getElementsByTagName('mat-card');
+
+function copyButton(position) {
+    return position > 0 ? cards[position - 1].querySelector(copySelector) : null;
+}
+
+function cardText(card) {
+    const content = card ? card.querySelector('mat-card-content') : null;
+    return content ? content.innerText : null;
+}
+
+function elementXPath(elt) {
+    let path = '';
+    for (; elt && elt.nodeType === Node.ELEMENT_NODE; elt = elt.parentNode) {
+        let idx = 0;
+        let hasNextSiblingWithSameTag = false;
+        for (let sibling = elt.previousElementSibling; sibling; sibling = sibling.previousElementSibling) {
+            if (sibling.tagName === elt.tagName) idx++;
+        }
+        for (let sibling = elt.nextElementSibling; sibling; sibling = sibling.nextElementSibling) {
+            if (sibling.tagName === elt.tagName) { hasNextSiblingWithSameTag = true; break; }
+        }
+        let nodeName = elt.tagName.toLowerCase();
+        if (idx > 0 || hasNextSiblingWithSameTag) nodeName += '[' + (idx + 1) + ']';
+        path = '/' + nodeName + path;
+    }
+    return path;
+}
+
+function describeAnswer(button) {
+    if (!button) return null;
+    const rect = button.getBoundingClientRect();
+    const style = window.getComputedStyle(button);
+    const text = cardText(button.closest('mat-card'));
+    return {
+        aria_label: button.getAttribute('aria-label'),
+        text_content: (button.innerText || '').trim(),
+        xpath: elementXPath(button),
+        is_displayed: rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none',
+        in_viewport: rect.bottom > 0 && rect.top < window.innerHeight,
+        answer_text: text === null ? null : text.trim(),
+    };
+}
+
+// The element holding the chat turns: the smallest ancestor of the newest card that
+// also holds the one before it. Until there are two cards the chat is small, so body is watched.
+function turnList() {
+    if (cards.length < 2) return document.body;
+    const previous = cards[cards.length - 2];
+    let el = cards[cards.length - 1].parentElement;
+    while (el && !el.contains(previous)) el = el.parentElement;
+    return el || document.body;
+}
+
+function newestAnswerText(position) {
+    if (position > initialCount) {
+        return cardText(cards[position - 1]);
+    }
+    // Before the Copy button shows up, follow the newest card while it streams.
+    return cards.length > initialCardCount ? cardText(cards[cards.length - 1]) : null;
+}
+
+let watch = window.__notebooklmAnswerWatch;
+if (!watch || watch.id !== watchId) {
+    if (watch) watch.stop();
+    watch = {id: watchId, status: 'pending', text: null, count: 0, button: null, details: null,
+             waiters: [], quietTimer: null, hardTimer: null, scheduled: false,
+             observer: null, cardObserver: null, observedCard: null};
+    watch.notify = function () {
+        const pending = watch.waiters;
+        watch.waiters = [];
+        pending.forEach(function (waiter) {
+            if (!waiter()) watch.waiters.push(waiter);
+        });
+    };
+    watch.stop = function () {
+        if (watch.observer) watch.observer.disconnect();
+        if (watch.cardObserver) watch.cardObserver.disconnect();
+        clearTimeout(watch.quietTimer);
+        clearTimeout(watch.hardTimer);
+    };
+    watch.finish = function (status) {
+        if (watch.status !== 'pending') return;
+        // Look again so a button Angular re-rendered meanwhile is not handed back stale.
+        const position = answeredPosition(cards);
+        watch.status = status;
+        watch.count = position;
+        if (status === 'complete') {
+            watch.button = copyButton(position) || watch.button;
+            watch.text = newestAnswerText(position);
+            watch.details = describeAnswer(watch.button);
+        }
+        watch.stop();
+        watch.notify();
+    };
+    watch.watchNewestCard = function () {
+        // Text only streams into the newest card, so only it is watched for character data.
+        const newest = cards.length ? cards[cards.length - 1] : null;
+        if (newest === watch.observedCard) return;
+        watch.cardObserver.disconnect();
+        if (newest) watch.cardObserver.observe(newest, {childList: true, subtree: true, characterData: true});
+        watch.observedCard = newest;
+    };
+    watch.check = function () {
+        watch.scheduled = false;
+        if (watch.status !== 'pending') return;
+        watch.watchNewestCard();
+        const position = answeredPosition(cards);
+        const text = newestAnswerText(position);
+        const changed = text !== watch.text;
+        watch.text = text;
+        if (position > initialCount && (changed || watch.quietTimer === null)) {
+            watch.button = copyButton(position);
+            clearTimeout(watch.quietTimer);
+            watch.quietTimer = setTimeout(function () { watch.finish('complete'); }, quietMs);
+        }
+        if (changed) watch.notify();
+    };
+    const schedule = function () {
+        // Coalesce bursts of streaming mutations into one check per task.
+        if (!watch.scheduled) {
+            watch.scheduled = true;
+            setTimeout(watch.check, 0);
+        }
+    };
+    // New cards and Copy buttons are element insertions under the turn list; the rest of the page is not watched.
+    watch.observer = new MutationObserver(schedule);
+    watch.observer.observe(turnList(), {childList: true, subtree: true});
+    watch.cardObserver = new MutationObserver(schedule);
+    watch.hardTimer = setTimeout(function () { watch.finish('timeout'); }, timeoutMs);
+    window.__notebooklmAnswerWatch = watch;
+    watch.check();
+}
+
+watch.waiters.push(function () {
+    const text = watch.text || '';
+    if (watch.status === 'pending' && (sinceLength < 0 || text.length === sinceLength)) {
+        return false;
+    }
+    const complete = watch.status === 'complete';
+    done({status: watch.status, count: watch.count, text: watch.text,
+          button: complete ? watch.button : null, details: complete ? watch.details : null});
+    return true;
+});
+watch.notify();
+"""
+
+
+JS_SOURCE_TITLES = """
+return Array.from(document.querySelectorAll(arguments[0]))
+    .map(function (el) { return el.innerText.trim(); })
+    .filter(function (title) { return title.length > 0; });
+"""
+
+
+# Everything run_query needs to know about the page before submitting, in one round trip.
+# dom_nodes feeds the conversation reset policy (see notebook_tabs.py); counting every
+# element walks the whole document, so it is only done when arguments[1] asks for it.
+JS_PAGE_STATE = JS_ANSWERED_POSITION + """
+const cards = document.getElementsByTagName('mat-card');
+return {
+    answered_position: answeredPosition(cards),
+    card_count: cards.length,
+    dom_nodes: arguments[1] ? document.getElementsByTagName('*').length : null,
+    source_titles: Array.from(document.querySelectorAll(arguments[0]))
+        .map(function (el) { return el.innerText.trim(); })
+        .filter(function (title) { return title.length > 0; }),
+};
+"""
+
+
+# CDP transport: wait in-page for the element at arguments[0] to be visible and
+# enabled (WebDriver's "clickable"), then either focus it and select its text so
+# Input.insertText replaces it ("focus"), or click it ("click"). Resolves with the
+# page state run_query needs, or {error: 'timeout'}.
+JS_READY_ELEMENT = JS_ANSWERED_POSITION + """
+const xpath = arguments[0];
+const action = arguments[1];
+const timeoutMs = arguments[2];
+const sourceSelector = arguments[3];
+const countNodes = arguments[4];
+const done = arguments[arguments.length - 1];
+const started = Date.now();
+
+function usable() {
+    const el = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    return el && !el.disabled && el.getClientRects().length > 0 ? el : null;
+}
+
+(function attempt() {
+    const el = usable();
+    if (!el) {
+        if (Date.now() - started > timeoutMs) return done({error: 'timeout'});
+        return setTimeout(attempt, 50);
+    }
+    if (action === 'click') {
+        el.click();
+    } else {
+        el.focus();
+        if (typeof el.select === 'function') el.select();
+    }
+    const cards = document.getElementsByTagName('mat-card');
+    done({
+        answered_position: answeredPosition(cards),
+        card_count: cards.length,
+        dom_nodes: countNodes ? document.getElementsByTagName('*').length : null,
+        source_titles: Array.from(document.querySelectorAll(sourceSelector))
+            .map(function (el) { return el.innerText.trim(); })
+            .filter(function (title) { return title.length > 0; }),
+    });
+})();
+"""
+
+
+def ensure_notebook(driver: webdriver.Chrome, notebook_id: str):
+    """Navigate to notebook_id unless the browser is already showing it."""
+    current_page_url = driver.current_url
+    if notebook_id not in current_page_url:
+        module_logger.info(f"Current URL is '{current_page_url}'. Navigating to: {notebook_id}")
+        driver.get(notebook_id)
+        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+        module_logger.info(f"Successfully navigated to {notebook_id}.")
+    else:
+        module_logger.info(f"Already on a page related to notebook URL: {notebook_id} (Current: {current_page_url})")
+
+
+def _fingerprint_titles(titles: list[str]) -> str | None:
+    if not titles:
+        return None
+    return hashlib.sha256("\n".join(sorted(titles)).encode("utf-8")).hexdigest()[:16]
+
+
+def source_fingerprint(driver: webdriver.Chrome) -> str | None:
+    """Short hash of the notebook's source list as rendered, or None if no sources could be found."""
+    return _fingerprint_titles(driver.execute_script(JS_SOURCE_TITLES, SOURCE_LIST_SELECTOR))
+
+
+def read_source_fingerprint(driver: webdriver.Chrome, notebook_id: str) -> str | None:
+    """Open the notebook if needed and fingerprint its sources. Blocking; raises QueryError."""
+    try:
+        ensure_notebook(driver, notebook_id)
+        return source_fingerprint(driver)
+    except TimeoutException as te:
+        TIMEOUTS.inc(operation="fingerprint")
+        raise QueryError(408, f"Timeout occurred while reading the notebook's sources: {str(te)}")
+    except Exception as e:
+        raise QueryError(500, f"An error occurred while reading the notebook's sources: {type(e).__name__} - {str(e)}")
+
+
+def wait_for_answer(driver: webdriver.Chrome, initial_position: int, initial_card_count: int, on_delta=None,
+                    cdp: CdpSession | None = None, timeout: float = ANSWER_TIMEOUT_SECONDS) -> dict:
+    """
+    Block until the in-page watcher reports the new answer complete (or timed out).
+
+    Without on_delta this is a single execute_async_script round trip; with it,
+    each round trip returns as soon as more text has rendered and on_delta is fed the difference.
+    With cdp the round trips go over the DevTools websocket; if it fails, the same
+    watch (its state lives in the page) is picked up again through WebDriver.
+    """
+    watch_id = uuid.uuid4().hex
+    driver.set_script_timeout(timeout + 5)
+    known_text = ""
+    while True:
+        args = (JS_WATCH_ANSWER, watch_id, initial_position, initial_card_count,
+                ANSWER_QUIET_PERIOD_MS, int(timeout * 1000),
+                len(known_text) if on_delta else -1)
+        detection = None
+        if cdp is not None:
+            try:
+                detection = cdp.execute_async_script(*args, timeout=timeout + 5)
+            except CdpError as e:
+                module_logger.warning(f"CDP transport failed while waiting for the answer ({e}); continuing over WebDriver.")
+                cdp = None
+        if detection is None:
+            detection = driver.execute_async_script(*args)
+        text = detection.get("text") or ""
+        if on_delta and text != known_text:
+            if text.startswith(known_text):
+                on_delta({"delta": text[len(known_text):]})
+            else:
+                on_delta({"delta": text, "replace": True})
+            known_text = text
+        if detection["status"] != "pending":
+            return detection
+
+
+def _click_copy_button(driver: webdriver.Chrome, new_button, new_button_details: dict) -> str:
+    """Scroll the new Copy button into view and click it so NotebookLM copies the answer. Returns a note for the message."""
+    wait = WebDriverWait(driver, 30)
+    # Scroll the new button into view, using 'false' to align to bottom
+    module_logger.debug("Scrolling the new copy button into view for the clipboard copy...")
+    driver.execute_script("arguments[0].scrollIntoView(false);", new_button)
+    time.sleep(1) # Small pause after scroll to allow rendering
+
+    # Wait for the button to be clickable explicitly before attempting to click
+    module_logger.debug("Waiting for the new copy button to be clickable...")
+    wait.until(EC.element_to_be_clickable(new_button))
+    is_displayed_after_scroll = new_button.is_displayed()
+    new_button_details['is_displayed_after_scroll'] = is_displayed_after_scroll
+    new_button_details['is_clickable_after_scroll'] = True # Confirmed by WebDriverWait
+    module_logger.debug(f"Is Displayed (after scroll): {is_displayed_after_scroll}")
+
+    if not is_displayed_after_scroll:
+        module_logger.warning("Button might not be fully visible after scroll attempt. Not clicking.")
+        return " Copy button scrolled into view but not clicked due to visibility."
+    try:
+        new_button.click() # Attempt standard click first
+        module_logger.debug("New copy button clicked successfully (native click).")
+        return " Copy button scrolled into view and clicked."
+    except ElementClickInterceptedException as click_err:
+        module_logger.warning(f"Native click intercepted: {click_err.msg}. Attempting JavaScript click...")
+        driver.execute_script("arguments[0].click();", new_button)
+        module_logger.debug("New copy button clicked successfully (JavaScript click).")
+        new_button_details['error'] = f"ElementClickInterceptedException (resolved with JS click): {click_err.msg}"
+        return " Copy button scrolled into view and clicked (via JS)."
+    except Exception as generic_click_error:
+        module_logger.warning(f"Error during click: {type(generic_click_error).__name__} - {generic_click_error}. Not clicked.")
+        new_button_details['error'] = f"Error during click: {type(generic_click_error).__name__} - {generic_click_error}"
+        return f" Copy button scrolled into view, but click failed: {type(generic_click_error).__name__}."
+
+
+def _submit_over_cdp(cdp: CdpSession, llmquery: str, phases: PhaseTimer, count_dom_nodes: bool = True) -> dict:
+    """Type and submit the query over the DevTools websocket in three round trips. Returns the pre-submit page state."""
+    with phases.phase("input"):
+        page_state = cdp.execute_async_script(JS_READY_ELEMENT, QUERY_INPUT_XPATH, "focus",
+                                              ELEMENT_WAIT_SECONDS * 1000, SOURCE_LIST_SELECTOR, count_dom_nodes,
+                                              timeout=ELEMENT_WAIT_SECONDS + 5)
+        if page_state.get("error"):
+            raise TimeoutException(f"Query input field did not become usable within {ELEMENT_WAIT_SECONDS} seconds.")
+        cdp.insert_text(llmquery)
+    module_logger.info(f"Query entered over CDP: '{llmquery}'")
+    with phases.phase("submit"):
+        clicked = cdp.execute_async_script(JS_READY_ELEMENT, SUBMIT_BUTTON_XPATH, "click",
+                                           ELEMENT_WAIT_SECONDS * 1000, SOURCE_LIST_SELECTOR, False,
+                                           timeout=ELEMENT_WAIT_SECONDS + 5)
+    if clicked.get("error"):
+        raise TimeoutException(f"Submit button did not become clickable within {ELEMENT_WAIT_SECONDS} seconds.")
+    module_logger.info("Submit button clicked over CDP.")
+    return page_state
+
+
+def _submit_query(driver: webdriver.Chrome, llmquery: str, cdp: CdpSession | None,
+                  phases: PhaseTimer, count_dom_nodes: bool = True) -> tuple[dict, CdpSession | None]:
+    """Type and submit the query, over cdp when given. Returns the pre-submit page state and the cdp still usable."""
+    if cdp is not None:
+        try:
+            return _submit_over_cdp(cdp, llmquery, phases, count_dom_nodes), cdp
+        except CdpError as e:
+            module_logger.warning(f"CDP transport failed before the query was submitted ({e}); falling back to WebDriver.")
+
+    text_input_selector = (By.XPATH, QUERY_INPUT_XPATH)
+    wait = WebDriverWait(driver, ELEMENT_WAIT_SECONDS)
+    with phases.phase("input"):
+        module_logger.debug("Attempting to find input field with placeholder 'Start typing...'")
+        input_field = wait.until(EC.element_to_be_clickable(text_input_selector))
+        page_state = driver.execute_script(JS_PAGE_STATE, SOURCE_LIST_SELECTOR, count_dom_nodes)
+        module_logger.debug(f"Input field found. Clearing and entering query: '{llmquery}'")
+        input_field.clear()
+        input_field.send_keys(llmquery)
+        module_logger.debug("Query entered into the text field successfully.")
+
+    submit_button_selector = (By.XPATH, SUBMIT_BUTTON_XPATH)
+    with phases.phase("submit"):
+        module_logger.debug(f"Attempting to find and click the submit button using selector: {submit_button_selector}")
+        submit_button_element = wait.until(EC.element_to_be_clickable(submit_button_selector))
+        submit_button_element.click()
+    module_logger.info("Submit button clicked.")
+    return page_state, None
+
+
+def _legacy_count_keys(initial_position: int, final_position: int) -> dict:
+    # Deprecated names of the answered positions, still emitted so existing clients keep working.
+    return {
+        "initial_generic_copy_button_count": initial_position,
+        "final_generic_copy_button_count": final_position,
+    }
+
+
+def _wait_for_previous_answer(driver: webdriver.Chrome, expect_answered_position: int):
+    """
+    A network-captured answer is returned before NotebookLM renders it. Before
+    the next query counts Copy buttons, make sure that answer's button is there.
+    Raises TimeoutException if it never appears: the counts can't be trusted then,
+    and the caller should reset the conversation.
+    """
+    page_state = driver.execute_script(JS_PAGE_STATE, SOURCE_LIST_SELECTOR)
+    if page_state["answered_position"] < expect_answered_position:
+        module_logger.debug("The previous answer has not rendered yet; waiting for it before submitting.")
+        detection = wait_for_answer(driver, expect_answered_position - 1, page_state["card_count"])
+        if detection["status"] != "complete":
+            raise TimeoutException(f"The previous network-captured answer did not render within {ANSWER_TIMEOUT_SECONDS} seconds; the query was not submitted.")
+
+
+def run_query(driver: webdriver.Chrome, notebook_id: str, llmquery: str, on_delta=None,
+              copy_to_clipboard: bool = False, cdp: CdpSession | None = None,
+              capture: NetworkAnswerCapture | None = None, expect_answered_position: int | None = None,
+              phases: PhaseTimer | None = None, count_dom_nodes: bool = True) -> dict:
+    """
+    Drive one question/answer round trip on a checked-out browser.
+
+    Blocking; runs on the session's worker thread. If on_delta is given it is
+    called with {"delta": str} (or {"delta": str, "replace": True} when the
+    page rewrote earlier text) as the answer renders, before the result is returned.
+
+    The answer text and Copy button details come back with the completion
+    signal itself. Only with copy_to_clipboard does the button get scrolled to
+    and clicked, which costs several more round trips and a one second pause.
+
+    With cdp (and without copy_to_clipboard, which needs WebDriver element
+    handles) typing, submitting and waiting go over the DevTools websocket;
+    a websocket failure falls back to WebDriver for the rest of the query.
+
+    With capture the answer (and its citations) is parsed from NotebookLM's
+    network response as soon as it has arrived, without waiting for it to
+    render; if that fails the answer is read from the page as usual.
+    expect_answered_position is the answered position (see JS_ANSWERED_POSITION; the
+    result's initial/final_answered_position are measured the same way) a
+    previous network-captured answer will leave once rendered. dom_nodes in the result
+    is the page's element count before submitting, for the caller's reset policy,
+    or None unless count_dom_nodes.
+
+    Each phase's duration is added to phases (see metrics.py).
+    """
+    phases = phases or PhaseTimer()
+    try:
+        with phases.phase("navigation"):
+            ensure_notebook(driver, notebook_id)
+        if copy_to_clipboard:
+            cdp = None
+        if expect_answered_position:
+            with phases.phase("wait_for_answer"):
+                _wait_for_previous_answer(driver, expect_answered_position)
+
+        if capture is not None and (on_delta or copy_to_clipboard):
+            capture = None # Streaming and clipboard copies need the rendered answer anyway.
+        if capture is not None:
+            try:
+                capture.start()
+            except CdpError as e:
+                module_logger.warning(f"Could not watch network responses ({e}); the answer will be read from the page.")
+                capture.stop()
+                capture = None
+
+        network_answer = None
+        try:
+            page_state, cdp = _submit_query(driver, llmquery, cdp, phases, count_dom_nodes)
+            # One answer budget per query, shared by the network capture and the page fallback after it.
+            answer_deadline = time.monotonic() + ANSWER_TIMEOUT_SECONDS
+            if capture is not None:
+                module_logger.debug("Waiting for the answer in NotebookLM's network response...")
+                try:
+                    with phases.phase("wait_for_answer"):
+                        network_answer = capture.wait(ANSWER_TIMEOUT_SECONDS)
+                except CdpError as e:
+                    module_logger.warning(f"Network capture failed ({e}); the answer will be read from the page.")
+        finally:
+            if capture is not None:
+                capture.stop()
+
+        notebook_source_fingerprint = _fingerprint_titles(page_state["source_titles"])
+        initial_position = page_state["answered_position"]
+        initial_card_count = page_state["card_count"]
+
+        if network_answer is not None:
+            module_logger.info(f"Answer captured from network response {network_answer['url']} ({network_answer['bytes']} bytes).")
+            QUERIES.inc(outcome="ok")
+            return {
+                "message": "Query submitted, answer captured from NotebookLM's network response.",
+                "initial_answered_position": initial_position,
+                # The answer's Copy button renders after this returns; this is the position to expect.
+                "final_answered_position": initial_position + 1,
+                **_legacy_count_keys(initial_position, initial_position + 1),
+                "query_submitted": llmquery,
+                "new_button_details": {},
+                "extracted_response_text": network_answer["text"],
+                "citations": network_answer["citations"],
+                "answer_source": "network",
+                "source_fingerprint": notebook_source_fingerprint,
+                "dom_nodes": page_state.get("dom_nodes"),
+            }
+
+        module_logger.debug(f"Initial answered position: {initial_position}")
+
+        module_logger.debug("Waiting for a new 'Copy' button and for its answer text to settle (indicates complete response)...")
+        answer_timeout = max(answer_deadline - time.monotonic(), DOM_FALLBACK_MIN_SECONDS)
+        with phases.phase("wait_for_answer"):
+            detection = wait_for_answer(driver, initial_position, initial_card_count, on_delta, cdp, answer_timeout)
+        if detection["status"] != "complete":
+            raise TimeoutException(f"Timeout: No answer card past position {initial_position} got a 'Copy' button within {ANSWER_TIMEOUT_SECONDS} seconds, or the answer text never settled. A new response might not have appeared.")
+
+        with phases.phase("extraction"):
+            final_position = detection["count"]
+            module_logger.debug(f"Answered position has advanced from {initial_position} to: {final_position}. New response detected.")
+
+            action_message = f"Query submitted, new response detected. Answered position changed from {initial_position} to {final_position}."
+            new_button_details = {}
+            extracted_response_text = None
+
+            # The newly added button is the last one in document order; the detector hands it back, already described.
+            details = detection.get("details")
+            if details is not None:
+                extracted_response_text = details["answer_text"]
+                new_button_details = {
+                    'aria_label': details["aria_label"],
+                    'text_content': details["text_content"],
+                    'xpath': details["xpath"],
+                    'is_displayed': details["is_displayed"],
+                    'in_viewport': details["in_viewport"],
+                }
+                module_logger.debug(f"Name (Aria-Label): {details['aria_label'] or 'N/A'}; XPath: {details['xpath'] or 'N/A'}")
+                if extracted_response_text is not None:
+                    module_logger.debug(f"Extracted response text from DOM: '{extracted_response_text[:100]}...'") # Log first 100 chars
+                action_message += " Newly added copy button details read in-page."
+
+                if copy_to_clipboard:
+                    try:
+                        action_message += _click_copy_button(driver, detection["button"], new_button_details)
+                    except StaleElementReferenceException:
+                        STALE_ELEMENT_ERRORS.inc()
+                        stale_msg = "Error: The new copy button became stale before it could be clicked."
+                        module_logger.warning(stale_msg)
+                        action_message += f" {stale_msg}"
+                        new_button_details['error'] = stale_msg
+                    except Exception as e_attr:
+                        # The answer is already in hand; a failed copy is reported, not raised.
+                        attr_err_msg = f"Error clicking button: {type(e_attr).__name__} - {e_attr}"
+                        module_logger.warning(attr_err_msg)
+                        action_message += f" {attr_err_msg}"
+                        new_button_details['error'] = attr_err_msg
+            else:
+                action_message += " No new copy buttons found in the list to detail (this shouldn't happen if count increased)."
+
+        # Return the extracted text along with other details
+        QUERIES.inc(outcome="ok")
+        return {
+            "message": action_message,
+            "initial_answered_position": initial_position,
+            "final_answered_position": final_position,
+            **_legacy_count_keys(initial_position, final_position),
+            "query_submitted": llmquery,
+            "new_button_details": new_button_details,
+            "extracted_response_text": extracted_response_text, # This will now contain the scraped text
+            "citations": None,
+            "answer_source": "dom",
+            "source_fingerprint": notebook_source_fingerprint,
+            "dom_nodes": page_state.get("dom_nodes"),
+        }
+
+    except TimeoutException as te:
+        QUERIES.inc(outcome="timeout")
+        TIMEOUTS.inc(operation="query")
+        error_message = f"Timeout occurred during query execution: {str(te)}"
+        module_logger.warning(error_message)
+        raise QueryError(408, error_message)
+    except Exception as e:
+        QUERIES.inc(outcome="error")
+        if isinstance(e, StaleElementReferenceException):
+            STALE_ELEMENT_ERRORS.inc()
+        error_message = f"An error occurred during query execution: {type(e).__name__} - {str(e)}"
+        module_logger.error(error_message)
+        raise QueryError(500, error_message)
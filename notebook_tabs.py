@@ -0,0 +1,220 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from selenium.common.exceptions import NoSuchWindowException, WebDriverException
+
+from cdp_transport import CdpSession
+from metrics import CONVERSATION_RESETS
+from resource_blocking import ResourceBlocker
+
+module_logger = logging.getLogger("app.notebook_tabs")
+
+# --- Tab Configuration ---
+# Notebooks each browser session keeps open as separate tabs. Switching to an open
+# tab skips the reload; past this many, the least recently used tab is navigated away.
+NOTEBOOK_TABS_PER_SESSION = int(os.environ.get("NOTEBOOK_TABS_PER_SESSION", "1"))
+# Every answer adds to the chat, and with it to Chrome's memory and the cost of each page
+# script. Past either limit the tab starts a fresh conversation before the next query:
+# "tab" replaces it with a new tab, "reload" reloads it, "off" lets the chat grow.
+CONVERSATION_RESET = os.environ.get("CONVERSATION_RESET", "tab")
+CONVERSATION_MAX_TURNS = int(os.environ.get("CONVERSATION_MAX_TURNS", "30"))
+CONVERSATION_MAX_DOM_NODES = int(os.environ.get("CONVERSATION_MAX_DOM_NODES", "15000"))
+# Counting the page's elements walks the whole document, so it is done every this many turns.
+CONVERSATION_DOM_SAMPLE_TURNS = max(1, int(os.environ.get("CONVERSATION_DOM_SAMPLE_TURNS", "5")))
+
+
+class NotebookTab:
+    """One tab (window handle) and the page state that belongs to it rather than to the browser."""
+
+    def __init__(self, handle: str, notebook_id: str | None = None, blocker: ResourceBlocker | None = None):
+        self.handle = handle
+        self.notebook_id = notebook_id
+        # DevTools websocket to this tab; window handles are DevTools target ids.
+        self.cdp: CdpSession | None = None
+        self.blocker = blocker
+        # Answered position (see notebook_query.JS_ANSWERED_POSITION) the page will reach once a network-captured answer has rendered.
+        self.unrendered_answered_position: int | None = None
+        # Set when the page's answer counts can no longer be trusted; forces a reset before the next query.
+        self.reset_requested: str | None = None
+        self.queries_served = 0
+        # Queries since the page was last loaded, and its element count as of the last one.
+        self.turns = 0
+        self.dom_nodes: int | None = None
+        self.last_used_at = time.monotonic()
+
+    def reset_reason(self) -> str | None:
+        """Why the conversation should be reset before the next query, or None."""
+        if self.reset_requested is not None:
+            return self.reset_requested
+        if CONVERSATION_RESET == "off":
+            return None
+        if CONVERSATION_MAX_TURNS and self.turns >= CONVERSATION_MAX_TURNS:
+            return "turns"
+        if CONVERSATION_MAX_DOM_NODES and (self.dom_nodes or 0) >= CONVERSATION_MAX_DOM_NODES:
+            return "dom_nodes"
+        return None
+
+    def should_count_dom_nodes(self) -> bool:
+        """Whether the next query should measure the page's element count (see CONVERSATION_DOM_SAMPLE_TURNS)."""
+        return CONVERSATION_MAX_DOM_NODES > 0 and self.turns % CONVERSATION_DOM_SAMPLE_TURNS == 0
+
+    def forget_conversation(self):
+        self.turns = 0
+        self.dom_nodes = None
+        self.unrendered_answered_position = None
+        self.reset_requested = None
+
+    def close(self):
+        """Close this tab's DevTools connections (the window itself goes with the browser)."""
+        if self.cdp is not None:
+            self.cdp.close()
+            self.cdp = None
+        if self.blocker is not None:
+            self.blocker.close()
+            self.blocker = None
+
+    def describe(self) -> dict:
+        return {
+            "handle": self.handle,
+            "notebook_id": self.notebook_id,
+            "queries_served": self.queries_served,
+            "turns": self.turns,
+            "dom_nodes": self.dom_nodes,
+            "idle_seconds": round(time.monotonic() - self.last_used_at, 3),
+        }
+
+
+class NotebookTabs:
+    """
+    Up to max_tabs tabs of one browser, ordered from least to most recently used.
+
+    Blocking and only used from the session's worker thread. activate() only
+    picks and focuses the tab; navigating it to the notebook is left to the
+    query flow, which skips the load when the tab already shows it.
+    """
+
+    def __init__(self, driver, name: str, max_tabs: int = NOTEBOOK_TABS_PER_SESSION,
+                 first: NotebookTab | None = None, on_open=None):
+        self.driver = driver
+        self.name = name
+        self.max_tabs = max(1, max_tabs)
+        # Called with each tab opened after the first, while it is focused and still blank.
+        self.on_open = on_open
+        first = first or NotebookTab(driver.current_window_handle)
+        self._tabs: OrderedDict[str, NotebookTab] = OrderedDict([(first.handle, first)])
+        self.active = first
+        self.switches = 0
+        self.opened = 0
+        self.evictions = 0
+        self.resets = 0
+
+    def __iter__(self):
+        return iter(list(self._tabs.values()))
+
+    @property
+    def notebooks(self) -> list[str]:
+        return [tab.notebook_id for tab in self._tabs.values() if tab.notebook_id is not None]
+
+    def find(self, notebook_id: str) -> NotebookTab | None:
+        for tab in self._tabs.values():
+            if tab.notebook_id == notebook_id:
+                return tab
+        return None
+
+    def _open(self) -> NotebookTab:
+        self.driver.switch_to.new_window("tab")
+        tab = NotebookTab(self.driver.current_window_handle)
+        self._tabs[tab.handle] = tab
+        self.active = tab
+        self.opened += 1
+        if self.on_open is not None:
+            self.on_open(tab)
+        return tab
+
+    def _focus(self, tab: NotebookTab):
+        if tab is not self.active:
+            self.driver.switch_to.window(tab.handle)
+            self.active = tab
+            self.switches += 1
+
+    def activate(self, notebook_id: str) -> NotebookTab:
+        """Focus the tab showing notebook_id, else a blank or new tab, else recycle the least recently used one."""
+        tab = self.find(notebook_id) or self.find(None)
+        try:
+            if tab is None and len(self._tabs) < self.max_tabs:
+                tab = self._open()
+            elif tab is None:
+                tab = next(iter(self._tabs.values()))
+                module_logger.info(f"[{self.name}] Recycling the tab showing {tab.notebook_id} for {notebook_id}.")
+                tab.forget_conversation()
+                self.evictions += 1
+            self._focus(tab)
+        except NoSuchWindowException:
+            if tab is None:
+                raise
+            # The tab was closed or crashed under us; forget it and pick again.
+            module_logger.warning(f"[{self.name}] Tab {tab.handle} is gone; dropping it.")
+            self._forget(tab)
+            return self.activate(notebook_id)
+        tab.notebook_id = notebook_id
+        tab.last_used_at = time.monotonic()
+        self._tabs.move_to_end(tab.handle)
+        return tab
+
+    def reset(self, tab: NotebookTab, reason: str) -> NotebookTab:
+        """
+        Start a fresh conversation for the tab's notebook; returns the (focused) tab to use from now on.
+
+        A new tab is left blank for the query flow to navigate, the old one is closed.
+        Either way the next page shows only what NotebookLM itself restores.
+        """
+        module_logger.info(f"[{self.name}] Resetting the conversation with {tab.notebook_id} "
+                           f"({reason}: {tab.turns} turns, {tab.dom_nodes} DOM nodes) by {CONVERSATION_RESET}.")
+        CONVERSATION_RESETS.inc(reason=reason)
+        self.resets += 1
+        if CONVERSATION_RESET == "reload":
+            self._focus(tab)
+            self.driver.refresh()
+            tab.forget_conversation()
+            return tab
+        fresh = self._open()
+        fresh.notebook_id = tab.notebook_id
+        try:
+            self.driver.switch_to.window(tab.handle)
+            self.driver.close()
+        except NoSuchWindowException:
+            pass
+        self.driver.switch_to.window(fresh.handle)
+        self._forget(tab)
+        return fresh
+
+    def _forget(self, tab: NotebookTab):
+        tab.close()
+        self._tabs.pop(tab.handle, None)
+        if not self._tabs:
+            # Never leave the session without a tab to work in.
+            handles = self.driver.window_handles
+            if not handles:
+                raise WebDriverException("The browser has no windows left.")
+            self.driver.switch_to.window(handles[0])
+            replacement = NotebookTab(handles[0])
+            self._tabs[replacement.handle] = replacement
+            self.active = replacement
+        elif tab is self.active:
+            self.active = None
+
+    def close(self):
+        for tab in self._tabs.values():
+            tab.close()
+
+    def describe(self) -> dict:
+        return {
+            "max_tabs": self.max_tabs,
+            "switches": self.switches,
+            "opened": self.opened,
+            "evictions": self.evictions,
+            "resets": self.resets,
+            "open": [tab.describe() for tab in self._tabs.values()],
+        }
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.remote.command import Command
+
+module_logger = logging.getLogger("app.performance_log")
+
+# --- Performance Log Configuration ---
+# Whether Chrome records the performance (DevTools) log that waterfalls are built from.
+PERF_LOG_ENABLED = os.environ.get("PERF_LOG_ENABLED", "1") == "1"
+# chromedriver holds log entries until they are read; the pool drains every session this often.
+PERF_LOG_DRAIN_SECONDS = float(os.environ.get("PERF_LOG_DRAIN_SECONDS", "10"))
+# Waterfalls kept per session (oldest dropped first) and requests kept per waterfall.
+PERF_LOG_MAX_WATERFALLS = int(os.environ.get("PERF_LOG_MAX_WATERFALLS", "20"))
+PERF_LOG_MAX_REQUESTS = int(os.environ.get("PERF_LOG_MAX_REQUESTS", "300"))
+# Log types requested in goog:loggingPrefs; every one of them has to be drained.
+DRAINED_LOG_TYPES = ("performance", "browser", "driver")
+# Requests listed under "slowest" in a waterfall summary.
+SLOWEST_REQUESTS = 5
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class Waterfall:
+    """The network requests one tab made during a navigation, a query or the time between them."""
+
+    def __init__(self, kind: str, label: str | None = None, webview: str | None = None,
+                 max_requests: int = PERF_LOG_MAX_REQUESTS):
+        self.kind = kind
+        self.label = label
+        # Tab (DevTools target id, which is also its window handle) whose events belong here; None takes any.
+        self.webview = webview
+        self.max_requests = max_requests
+        self.started_at = time.time()
+        self.finished_at: float | None = None
+        self._requests: dict[str, dict] = {}
+        self.dropped_requests = 0
+        self.navigated = False
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def add(self, method: str, params: dict):
+        request_id = params.get("requestId")
+        if method == "Network.requestWillBeSent":
+            if request_id not in self._requests and len(self._requests) >= self.max_requests:
+                self.dropped_requests += 1
+                return
+            request = params.get("request", {})
+            if params.get("type") == "Document" and request_id == params.get("loaderId"):
+                self.navigated = True
+            # A redirect reuses the request id; the entry then describes the final hop.
+            self._requests[request_id] = {
+                "url": request.get("url", "")[:500],
+                "method": request.get("method"),
+                "type": params.get("type"),
+                "started": params.get("timestamp"),
+                "status": None,
+                "from_cache": False,
+                "ttfb": None,
+                "finished": None,
+                "bytes": None,
+                "error": None,
+            }
+            return
+        entry = self._requests.get(request_id)
+        if entry is None:
+            return
+        if method == "Network.responseReceived":
+            response = params.get("response", {})
+            timing = response.get("timing") or {}
+            entry["status"] = response.get("status")
+            entry["from_cache"] = bool(response.get("fromDiskCache") or response.get("fromServiceWorker"))
+            if "receiveHeadersEnd" in timing and "sendStart" in timing:
+                entry["ttfb"] = (timing["receiveHeadersEnd"] - timing["sendStart"]) / 1000
+        elif method == "Network.loadingFinished":
+            entry["finished"] = params.get("timestamp")
+            entry["bytes"] = int(params.get("encodedDataLength", 0))
+        elif method == "Network.loadingFailed":
+            entry["finished"] = params.get("timestamp")
+            entry["error"] = params.get("errorText") or ("canceled" if params.get("canceled") else "failed")
+
+    def describe(self, requests: bool = True) -> dict:
+        entries = sorted(self._requests.values(), key=lambda r: r["started"] or 0)
+        origin = entries[0]["started"] if entries else None
+        rows = []
+        for r in entries:
+            duration = r["finished"] - r["started"] if r["finished"] is not None and r["started"] is not None else None
+            rows.append({
+                "url": r["url"],
+                "method": r["method"],
+                "type": r["type"],
+                "status": r["status"],
+                "from_cache": r["from_cache"],
+                "start_ms": _ms(r["started"] - origin) if r["started"] is not None else None,
+                "duration_ms": _ms(duration),
+                "ttfb_ms": _ms(r["ttfb"]),
+                "bytes": r["bytes"],
+                "error": r["error"],
+            })
+        finished = [r["finished"] for r in entries if r["finished"] is not None]
+        summary = {
+            "kind": self.kind,
+            "label": self.label,
+            "started_at": self.started_at,
+            "wall_seconds": round((self.finished_at or time.time()) - self.started_at, 3),
+            "network_ms": _ms(max(finished) - origin) if finished and origin is not None else None,
+            "navigated": self.navigated,
+            "requests": len(rows),
+            "dropped_requests": self.dropped_requests,
+            "failed_requests": sum(1 for r in rows if r["error"]),
+            "bytes": sum(r["bytes"] or 0 for r in rows),
+            "slowest": sorted((r for r in rows if r["duration_ms"] is not None),
+                              key=lambda r: r["duration_ms"], reverse=True)[:SLOWEST_REQUESTS],
+        }
+        if requests:
+            summary["waterfall"] = rows
+        return summary
+
+
+class PerformanceLog:
+    """
+    Drains one session's chromedriver logs and keeps its last few waterfalls.
+
+    chromedriver buffers every log type enabled in goog:loggingPrefs until it is
+    read, so a session nobody reads from grows without bound. drain() empties all
+    of them: performance entries become waterfall rows, browser console messages
+    are logged at DEBUG and driver entries are discarded (chromedriver already
+    writes them to stdout). drain(), begin() and end() call the driver, so they
+    run on the session's worker thread; describe() is safe from any thread.
+    """
+
+    def __init__(self, driver, name: str, max_waterfalls: int = PERF_LOG_MAX_WATERFALLS,
+                 max_requests: int = PERF_LOG_MAX_REQUESTS):
+        self.driver = driver
+        self.name = name
+        self.max_requests = max_requests
+        self._lock = threading.Lock()
+        self.waterfalls: deque[Waterfall] = deque(maxlen=max_waterfalls)
+        # The navigation or query in progress, and what other tabs did (or any tab did between queries).
+        self.current: Waterfall | None = None
+        self.background: Waterfall | None = None
+        self.log_types = [t for t in DRAINED_LOG_TYPES if PERF_LOG_ENABLED or t != "performance"]
+        self.drained = {t: 0 for t in self.log_types}
+        self.drains = 0
+        self.last_drain_at: float | None = None
+
+    def drain(self, log_types: tuple[str, ...] | None = None):
+        """Read and clear the enabled log buffers (or just log_types). Blocking; call on the session's worker."""
+        for log_type in [t for t in self.log_types if log_types is None or t in log_types]:
+            try:
+                entries = self.driver.execute(Command.GET_LOG, {"type": log_type})["value"]
+            except WebDriverException as e:
+                if "log type" in str(e).lower():
+                    # Not recorded by this node (e.g. a remote Chrome without our logging prefs).
+                    module_logger.info(f"[{self.name}] {log_type} log is not available; no longer draining it.")
+                    self.log_types.remove(log_type)
+                    continue
+                raise
+            self.drained[log_type] += len(entries)
+            if log_type == "performance":
+                self._record(entries)
+            elif log_type == "browser":
+                for entry in entries:
+                    module_logger.debug(f"[{self.name}] console {entry.get('level')}: {entry.get('message')}")
+        self.drains += 1
+        self.last_drain_at = time.time()
+
+    def _record(self, entries: list[dict]):
+        with self._lock:
+            for entry in entries:
+                try:
+                    message = json.loads(entry["message"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                method = message.get("message", {}).get("method", "")
+                if not method.startswith("Network."):
+                    continue
+                webview = message.get("webview")
+                target = self.current
+                if target is None or (target.webview is not None and webview != target.webview):
+                    if self.background is None:
+                        self.background = Waterfall("background", max_requests=self.max_requests)
+                    target = self.background
+                target.add(method, message["message"].get("params", {}))
+
+    def _close(self, waterfall: Waterfall | None):
+        # Caller holds self._lock.
+        if waterfall is not None and (waterfall.kind != "background" or len(waterfall)):
+            waterfall.finished_at = time.time()
+            self.waterfalls.append(waterfall)
+
+    def _drain_performance(self):
+        # Waterfall boundaries only need the performance log; the pool's periodic drain takes care of the rest.
+        try:
+            self.drain(("performance",))
+        except WebDriverException as e:
+            module_logger.warning(f"[{self.name}] Could not drain the performance log: {type(e).__name__} - {e}")
+
+    def begin(self, kind: str, label: str | None = None, webview: str | None = None):
+        """Start attributing requests to a new navigation or query waterfall. Blocking; call on the session's worker."""
+        self._drain_performance()
+        with self._lock:
+            self._close(self.current)
+            self._close(self.background)
+            self.background = None
+            self.current = Waterfall(kind, label, webview, self.max_requests)
+
+    def end(self):
+        """Finish the current waterfall; later requests count as background traffic. Blocking; call on the session's worker."""
+        self._drain_performance()
+        with self._lock:
+            self._close(self.current)
+            self.current = None
+
+    def describe(self, limit: int | None = None, requests: bool = True) -> dict:
+        with self._lock:
+            waterfalls = list(self.waterfalls)[-limit:] if limit else list(self.waterfalls)
+            return {
+                "drains": self.drains,
+                "last_drain_at": self.last_drain_at,
+                "drained_entries": dict(self.drained),
+                "waterfalls": [w.describe(requests) for w in reversed(waterfalls)],
+                "in_progress": [w.describe(requests) for w in (self.current, self.background) if w is not None],
+            }
+
+    def stats(self) -> dict:
+        return {"drains": self.drains, "drained_entries": dict(self.drained), "waterfalls": len(self.waterfalls)}
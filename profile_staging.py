@@ -0,0 +1,339 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+module_logger = logging.getLogger("app.profile_staging")
+
+# --- Staging Configuration ---
+STAGING_ROOT = os.environ.get("PROFILE_STAGING_ROOT", tempfile.gettempdir())
+# Every staged directory carries this prefix so the janitor (and start.sh) can find it.
+STAGING_PREFIX = "notebooklm_profile_"
+# "hardlink" shares the read-only parts of the template, "copy" reproduces the old full copy.
+STAGING_MODE = os.environ.get("PROFILE_STAGING_MODE", "hardlink")
+# Number of ready-to-use directories kept staged ahead of demand.
+STAGING_SPARES = int(os.environ.get("PROFILE_STAGING_SPARES", "1"))
+# Unowned directories younger than this are left alone; they may still be being staged.
+JANITOR_GRACE_SECONDS = 300
+# Also remove bare tempfile.mkdtemp() "tmp*" Chrome profiles, as created by versions before staging.
+# Off by default: in a shared temp dir those may belong to someone else's Chrome.
+JANITOR_LEGACY_CLEANUP = os.environ.get("PROFILE_JANITOR_LEGACY_CLEANUP", "0") == "1"
+MARKER_FILE = ".notebooklm_staging"
+
+# Template entries Chrome only ever reads, or replaces by writing a new file
+# and renaming it over the old one. Hardlinking them is safe because a rename
+# swaps the directory entry in the staged copy without touching the shared inode.
+# Everything else (cookies, LevelDB stores, Preferences, ...) is written in
+# place and therefore copied.
+SHARED_ENTRIES = (
+    "AmountExtractionHeuristicRegexes",
+    "AutofillStates",
+    "CertificateRevocation",
+    "CookieReadinessList",
+    "Crowd Deny",
+    "Default/Extensions",
+    "Dictionaries",
+    "FileTypePolicies",
+    "FirstPartySetsPreloaded",
+    "MEIPreload",
+    "OnDeviceHeadSuggestModel",
+    "OpenCookieDatabase",
+    "OptimizationHints",
+    "OriginTrials",
+    "PKIMetadata",
+    "PrivacySandboxAttestationsPreloaded",
+    "ProbabilisticRevealTokenRegistry",
+    "SSLErrorAssistant",
+    "SafetyTips",
+    "Subresource Filter",
+    "TpcdMetadata",
+    "TrustTokenKeyCommitments",
+    "WidevineCdm",
+    "ZxcvbnData",
+    "component_crx_cache",
+    "extensions_crx_cache",
+    "hyphen-data",
+    "optimization_guide_model_store",
+)
+
+
+def _link_tree(src: str, dst: str) -> tuple[int, int]:
+    """Recreate src under dst with hardlinked files. Returns (files_linked, bytes_copied)."""
+    linked = copied = 0
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        for name in list(dirs):
+            s = os.path.join(root, name)
+            if os.path.islink(s):
+                os.symlink(os.readlink(s), os.path.join(target_root, name))
+                dirs.remove(name)
+        for name in files:
+            s = os.path.join(root, name)
+            d = os.path.join(target_root, name)
+            if os.path.islink(s):
+                os.symlink(os.readlink(s), d)
+                continue
+            try:
+                os.link(s, d)
+                linked += 1
+            except OSError:
+                # Cross-device template or a filesystem without hardlinks.
+                shutil.copy2(s, d)
+                copied += os.path.getsize(d)
+    return linked, copied
+
+
+def _tree_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            f = os.path.join(root, name)
+            if not os.path.islink(f):
+                total += os.path.getsize(f)
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_identity(pid: int) -> str | None:
+    """"<boot id>:<start time>" of a running process, or None where /proc is not available."""
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        # The command name (field 2) may contain spaces; the start time is field 22, 20 fields after it.
+        start_time = stat.rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+    return f"{boot_id}:{start_time}"
+
+
+def _marker_owner_alive(marker: str) -> bool:
+    """Whether the process that wrote a staging marker ("<pid>" or "<pid> <identity>") is still running."""
+    pid_text, _, identity = marker.strip().partition(" ")
+    pid = int(pid_text)
+    if identity:
+        # A restarted container reuses PIDs (the server is PID 1 again); its start time or boot id differs.
+        return _process_identity(pid) == identity
+    if _process_identity(os.getpid()) is not None:
+        # A marker without an identity was written by an earlier version, so never by this process.
+        return pid != os.getpid() and _pid_alive(pid)
+    return pid == os.getpid() or _pid_alive(pid)
+
+
+def _chrome_lock_pid(profile_dir: str) -> int | None:
+    # Chrome's SingletonLock is a symlink to "<hostname>-<pid>" while the browser runs.
+    try:
+        target = os.readlink(os.path.join(profile_dir, "SingletonLock"))
+        return int(target.rsplit("-", 1)[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class ProfileStager:
+    """
+    Creates per-session Chrome user-data-dirs from a shared read-only template.
+
+    Directories are staged under STAGING_ROOT with STAGING_PREFIX, and a few
+    spares are kept ready so acquire() normally returns without touching disk.
+    """
+
+    def __init__(self, template_dir: str, staging_root: str = STAGING_ROOT, mode: str = STAGING_MODE,
+                 spares: int = STAGING_SPARES, shared_entries: tuple[str, ...] = SHARED_ENTRIES):
+        if mode not in ("hardlink", "copy"):
+            raise ValueError(f"Unknown profile staging mode: {mode}")
+        self.template_dir = template_dir
+        self.staging_root = staging_root
+        self.mode = mode
+        self.spares = spares
+        self.shared_entries = set(shared_entries) if mode == "hardlink" else set()
+        self._ready: list[str] = []
+        self._lock = threading.Lock()
+        self._replenishing = False
+        self.last_stage_seconds: float | None = None
+        self.last_files_linked = 0
+        self.last_bytes_copied = 0
+
+    def _stage_entry(self, rel: str, target_dir: str) -> tuple[int, int]:
+        s = os.path.join(self.template_dir, rel)
+        d = os.path.join(target_dir, rel)
+        if rel in self.shared_entries and os.path.isdir(s):
+            return _link_tree(s, d)
+        if os.path.islink(s):
+            os.symlink(os.readlink(s), d)
+            return 0, 0
+        if os.path.isdir(s):
+            if any(shared.startswith(rel + "/") for shared in self.shared_entries):
+                os.makedirs(d, exist_ok=True)
+                linked = copied = 0
+                for child in os.listdir(s):
+                    child_linked, child_copied = self._stage_entry(f"{rel}/{child}", target_dir)
+                    linked += child_linked
+                    copied += child_copied
+                return linked, copied
+            shutil.copytree(s, d, symlinks=True, ignore_dangling_symlinks=True)
+            return 0, _tree_size(d)
+        shutil.copy2(s, d)
+        return 0, os.path.getsize(d)
+
+    def stage(self) -> str:
+        """Build one new profile directory from the template. Blocking."""
+        started = time.monotonic()
+        path = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.staging_root)
+        try:
+            identity = _process_identity(os.getpid())
+            with open(os.path.join(path, MARKER_FILE), "w") as f:
+                f.write(f"{os.getpid()} {identity}" if identity else str(os.getpid()))
+            linked = copied = 0
+            for item in os.listdir(self.template_dir):
+                item_linked, item_copied = self._stage_entry(item, path)
+                linked += item_linked
+                copied += item_copied
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        self.last_stage_seconds = time.monotonic() - started
+        self.last_files_linked = linked
+        self.last_bytes_copied = copied
+        module_logger.info(f"Staged profile {path} in {self.last_stage_seconds:.3f}s ({self.mode}: {linked} files linked, {copied} bytes copied).")
+        return path
+
+    def acquire(self) -> str:
+        """Hand out a staged directory, preferring a spare, and top the spares back up."""
+        with self._lock:
+            path = self._ready.pop() if self._ready else None
+        if path is None:
+            path = self.stage()
+        else:
+            module_logger.info(f"Using pre-staged profile {path}.")
+        self._replenish_in_background()
+        return path
+
+    def release(self, path: str):
+        if path and os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+            module_logger.info(f"Removed staged profile {path}.")
+
+    def _replenish_in_background(self):
+        with self._lock:
+            if self._replenishing or len(self._ready) >= self.spares:
+                return
+            self._replenishing = True
+        threading.Thread(target=self._replenish, name="profile-stager", daemon=True).start()
+
+    def _replenish(self):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._ready) >= self.spares:
+                        return
+                path = self.stage()
+                with self._lock:
+                    self._ready.append(path)
+        except Exception as e:
+            module_logger.error(f"Failed to pre-stage profile directory: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._replenishing = False
+
+    def prestage(self):
+        """Fill the spare pool synchronously (e.g. before the first session is launched)."""
+        with self._lock:
+            missing = self.spares - len(self._ready)
+        for _ in range(max(0, missing)):
+            path = self.stage()
+            with self._lock:
+                self._ready.append(path)
+
+    def discard_spares(self):
+        with self._lock:
+            spares, self._ready = self._ready, []
+        for path in spares:
+            self.release(path)
+
+    def janitor(self) -> list[str]:
+        """
+        Remove staged profiles left behind by crashed processes.
+
+        Only directories this code staged are touched: STAGING_PREFIX, our marker
+        file naming a dead owner (its PID plus start time and boot id, so a
+        restarted container's reused PIDs do not count), and owned by this user. With JANITOR_LEGACY_CLEANUP
+        it also removes this user's bare "tmp*" profiles from earlier versions, as
+        long as no live Chrome holds their SingletonLock.
+        """
+        removed = []
+        try:
+            entries = os.listdir(self.staging_root)
+        except OSError as e:
+            module_logger.warning(f"Janitor could not list {self.staging_root}: {e}")
+            return removed
+
+        with self._lock:
+            ready = set(self._ready)
+        now = time.time()
+        for name in entries:
+            path = os.path.join(self.staging_root, name)
+            if path in ready or not os.path.isdir(path) or os.path.islink(path):
+                continue
+            try:
+                if os.stat(path).st_uid != os.getuid():
+                    continue
+            except OSError:
+                continue
+            if name.startswith(STAGING_PREFIX):
+                try:
+                    with open(os.path.join(path, MARKER_FILE)) as f:
+                        owner = f.read()
+                    if _marker_owner_alive(owner):
+                        continue
+                except (OSError, ValueError):
+                    # No marker: not one of ours, or still being staged.
+                    continue
+            elif (JANITOR_LEGACY_CLEANUP and name.startswith("tmp")
+                  and os.path.exists(os.path.join(path, "Local State"))):
+                owner = None
+            else:
+                continue
+            lock_pid = _chrome_lock_pid(path)
+            if lock_pid is not None and _pid_alive(lock_pid):
+                continue
+            if owner is None:
+                # No owner recorded: only remove it once it is clearly not being staged right now.
+                try:
+                    if now - os.path.getmtime(path) < JANITOR_GRACE_SECONDS:
+                        continue
+                except OSError:
+                    continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+        if removed:
+            module_logger.warning(f"Janitor removed {len(removed)} orphaned profile director(ies): {removed}")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            ready = len(self._ready)
+        return {
+            "template_dir": self.template_dir,
+            "staging_root": self.staging_root,
+            "mode": self.mode,
+            "spares_ready": ready,
+            "spares_target": self.spares,
+            "last_stage_seconds": self.last_stage_seconds,
+            "last_files_linked": self.last_files_linked,
+            "last_bytes_copied": self.last_bytes_copied,
+        }
@@ -0,0 +1,140 @@
+"""
+Baseline latency and throughput of the query path, against the mock notebook by default.
+
+Starts mock_notebook.py in-process, starts a DriverPool sized for the highest
+concurrency level (timing the setup), then for each level runs --queries
+queries through pool checkouts with that many in flight at once. Reports
+per-query latency percentiles, query phases and throughput for each level.
+
+    python query_benchmark.py --concurrency 1,2,4 --queries 20
+    python query_benchmark.py --url https://notebooklm.google.com/notebook/<id> --concurrency 1 --queries 5
+
+Against the mock no Google login is needed: an empty profile is used unless
+CHROME_PROFILE_DIR is set. Pool settings such as BROWSER_TRANSPORT,
+ANSWER_EXTRACTION or RESOURCE_BLOCKING are read from the environment as usual.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import statistics
+import tempfile
+import time
+
+from mock_notebook import add_timing_arguments, server_from_args
+
+module_logger = logging.getLogger("app.query_benchmark")
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        "mean_s": round(statistics.fmean(ordered), 3),
+        "p50_s": round(rank(50), 3),
+        "p90_s": round(rank(90), 3),
+        "p95_s": round(rank(95), 3),
+        "p99_s": round(rank(99), 3),
+        "max_s": round(ordered[-1], 3),
+    }
+
+
+async def run_level(pool, url: str, concurrency: int, queries: int) -> dict:
+    """Run `queries` queries with `concurrency` of them in flight at once."""
+    latencies: list[float] = []
+    phases: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    remaining = iter(range(queries))
+
+    async def client(client_id: int):
+        for i in remaining:
+            started = time.perf_counter()
+            session = await pool.checkout(notebook_id=url)
+            broken = False
+            try:
+                result = await session.query(url, f"benchmark question {client_id}-{i}")
+            except Exception as e:
+                broken = not await session.run(session.probe)
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            finally:
+                await pool.checkin(session, broken=broken)
+            latencies.append(time.perf_counter() - started)
+            for name, seconds in result["timing"]["phases"].items():
+                phases.setdefault(name, []).append(seconds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "queries": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_qps": round(len(latencies) / wall, 3) if wall else None,
+        "latency": _percentiles(latencies),
+        "phases_p50_s": {name: round(statistics.median(samples), 3) for name, samples in phases.items()},
+    }
+
+
+async def benchmark(url: str, levels: list[int], queries: int, warmup: int) -> dict:
+    from driver_pool import DriverPool
+
+    pool = DriverPool(min_size=max(levels), max_size=max(levels))
+    report = {"url": url, "levels": []}
+    try:
+        started = time.perf_counter()
+        sessions = await pool.start(url)
+        report["setup"] = {"sessions": len(sessions), "seconds": round(time.perf_counter() - started, 3)}
+        if warmup:
+            await run_level(pool, url, max(levels), warmup)
+        for concurrency in levels:
+            module_logger.info(f"Running {queries} queries at concurrency {concurrency}...")
+            report["levels"].append(await run_level(pool, url, concurrency, queries))
+    finally:
+        await pool.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query latency and throughput against a mock or real notebook.")
+    parser.add_argument("--url", default=None, help="Notebook to query (default: a mock notebook served in-process).")
+    parser.add_argument("--concurrency", default="1,2,4", help="Comma-separated numbers of queries in flight.")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per concurrency level.")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed queries before the first level.")
+    add_timing_arguments(parser)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    server = None
+    url = args.url
+    with tempfile.TemporaryDirectory(prefix="mock-profile-") as mock_profile:
+        if url is None:
+            server = server_from_args(args).start()
+            url = server.notebook_url()
+            # The mock needs no login; don't stage (or require) the real Chrome profile.
+            os.environ.setdefault("CHROME_PROFILE_DIR", mock_profile)
+            os.environ.setdefault("CHROME_PROFILE_MODE", "full")
+        try:
+            report = asyncio.run(benchmark(url, levels, args.queries, args.warmup))
+        finally:
+            if server is not None:
+                server.stop()
+    if server is not None:
+        report["mock"] = {"first_token_ms": args.first_token_ms, "chunk_ms": args.chunk_ms,
+                          "words_per_chunk": args.words_per_chunk, "answer_words": args.answer_words,
+                          "copy_delay_ms": args.copy_delay_ms, "answers_served": server.answers}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import fnmatch
+import logging
+import os
+import threading
+
+from cdp_transport import CdpError, CdpSession
+
+module_logger = logging.getLogger("app.resource_blocking")
+
+# --- Blocking Configuration ---
+# "off" leaves page loads alone; "on" fails matching requests before they are sent;
+# "observe" lets them load but counts what blocking would have skipped, bytes included.
+RESOURCE_BLOCKING = os.environ.get("RESOURCE_BLOCKING", "off")
+# DevTools resource types the query flow never needs (comma-separated).
+RESOURCE_BLOCK_TYPES = [t.strip() for t in os.environ.get("RESOURCE_BLOCK_TYPES", "Image,Media,Font,Ping").split(",") if t.strip()]
+# Telemetry and analytics endpoints, as DevTools URL patterns ("*" and "?" wildcards, comma-separated).
+RESOURCE_BLOCK_URL_PATTERNS = [p.strip() for p in os.environ.get(
+    "RESOURCE_BLOCK_URL_PATTERNS",
+    "*://play.google.com/log*,*://www.google-analytics.com/*,*://*.googletagmanager.com/*,*://*.doubleclick.net/*",
+).split(",") if p.strip()]
+# How long the blocker thread waits on the websocket before checking whether it should stop.
+POLL_INTERVAL_SECONDS = 0.5
+
+
+class ResourceBlocker:
+    """
+    Blocks (or, when not enforcing, just tallies) requests a session's tab does not need.
+
+    Owns a second DevTools connection to the tab and a daemon thread that answers
+    Fetch.requestPaused for matching requests and counts traffic from Network
+    events, so it keeps working while the session's worker is busy in WebDriver.
+    If the connection drops, Chrome stops intercepting and pages load unblocked.
+    """
+
+    def __init__(self, cdp: CdpSession, name: str, enforce: bool = True,
+                 resource_types: list[str] = RESOURCE_BLOCK_TYPES,
+                 url_patterns: list[str] = RESOURCE_BLOCK_URL_PATTERNS):
+        self.cdp = cdp
+        self.name = name
+        self.enforce = enforce
+        self.resource_types = list(resource_types)
+        self.url_patterns = list(url_patterns)
+        self._lock = threading.Lock()
+        # requestId -> would-block resource type, for requests still loading in observe mode.
+        self._pending: dict[str, str] = {}
+        self.blocked_requests = 0
+        # Only known when observing: blocked requests never transfer anything.
+        self.blocked_bytes = 0
+        self.blocked_by_type: dict[str, int] = {}
+        self.loaded_requests = 0
+        self.loaded_bytes = 0
+        self.failed = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"resource-blocker-{name}", daemon=True)
+
+    @classmethod
+    def attach(cls, driver, name: str, enforce: bool = True) -> "ResourceBlocker":
+        """Connect to the driver's current tab and start blocking. Call before navigating."""
+        blocker = cls(CdpSession.attach(driver), name, enforce=enforce)
+        blocker.start()
+        return blocker
+
+    def matches(self, url: str, resource_type: str | None) -> bool:
+        return resource_type in self.resource_types or any(fnmatch.fnmatchcase(url, p) for p in self.url_patterns)
+
+    def start(self):
+        self.cdp.on("Network.requestWillBeSent", self._on_request)
+        self.cdp.on("Network.loadingFinished", self._on_finished)
+        self.cdp.on("Network.loadingFailed", self._on_failed)
+        self.cdp.send("Network.enable")
+        if self.enforce:
+            patterns = [{"urlPattern": "*", "resourceType": t, "requestStage": "Request"} for t in self.resource_types]
+            patterns += [{"urlPattern": p, "requestStage": "Request"} for p in self.url_patterns]
+            self.cdp.on("Fetch.requestPaused", self._on_paused)
+            self.cdp.send("Fetch.enable", {"patterns": patterns})
+        self._thread.start()
+        module_logger.info(f"[{self.name}] Resource blocking {'on' if self.enforce else 'observing'}: "
+                           f"types {self.resource_types}, {len(self.url_patterns)} URL pattern(s).")
+
+    def _count_blocked(self, resource_type: str, size: int = 0):
+        with self._lock:
+            self.blocked_requests += 1
+            self.blocked_bytes += size
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+
+    def _on_paused(self, params: dict):
+        # Only matching requests are paused, so every one of them is failed.
+        self.cdp.post("Fetch.failRequest", {"requestId": params["requestId"], "errorReason": "BlockedByClient"})
+        self._count_blocked(params.get("resourceType", "Other"))
+
+    def _on_request(self, params: dict):
+        if not self.enforce:
+            resource_type = params.get("type", "Other")
+            if self.matches(params.get("request", {}).get("url", ""), resource_type):
+                self._pending[params["requestId"]] = resource_type
+
+    def _on_finished(self, params: dict):
+        size = int(params.get("encodedDataLength", 0))
+        resource_type = self._pending.pop(params.get("requestId"), None)
+        if resource_type is not None:
+            self._count_blocked(resource_type, size)
+        with self._lock:
+            self.loaded_requests += 1
+            self.loaded_bytes += size
+
+    def _on_failed(self, params: dict):
+        self._pending.pop(params.get("requestId"), None)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.cdp.poll_events(POLL_INTERVAL_SECONDS)
+            except CdpError as e:
+                if not self._stop.is_set():
+                    self.failed = True
+                    module_logger.warning(f"[{self.name}] Resource blocker lost its DevTools connection, pages now load unblocked: {e}")
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": "on" if self.enforce else "observe",
+                "active": not self.failed and self._thread.is_alive(),
+                "blocked_requests": self.blocked_requests,
+                "blocked_bytes": None if self.enforce else self.blocked_bytes,
+                "blocked_by_type": dict(self.blocked_by_type),
+                "loaded_requests": self.loaded_requests,
+                "loaded_bytes": self.loaded_bytes,
+            }
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=POLL_INTERVAL_SECONDS * 4)
+        self.cdp.close()
+
+
+def merge_stats(stats: list[dict]) -> dict | None:
+    """Add up the stats() of several blockers (one per tab); None if there are none."""
+    if not stats:
+        return None
+    merged = {
+        "mode": stats[0]["mode"],
+        "active": all(s["active"] for s in stats),
+        "blocked_requests": sum(s["blocked_requests"] for s in stats),
+        "blocked_bytes": None if stats[0]["blocked_bytes"] is None else sum(s["blocked_bytes"] or 0 for s in stats),
+        "blocked_by_type": {},
+        "loaded_requests": sum(s["loaded_requests"] for s in stats),
+        "loaded_bytes": sum(s["loaded_bytes"] for s in stats),
+    }
+    for s in stats:
+        for resource_type, count in s["blocked_by_type"].items():
+            merged["blocked_by_type"][resource_type] = merged["blocked_by_type"].get(resource_type, 0) + count
+    return merged
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from driver_pool import POOL_CHECKOUT_TIMEOUT, BrowserSession, DriverPool, PoolNotStartedError
+
+module_logger = logging.getLogger("app.scheduler")
+
+# --- Scheduler Configuration ---
+# Requests waiting for a browser beyond this many are rejected with 429.
+SCHEDULER_MAX_QUEUE = int(os.environ.get("SCHEDULER_MAX_QUEUE", "64"))
+# Seconds a request may wait for a browser when it does not set its own deadline.
+SCHEDULER_DEFAULT_DEADLINE_SECONDS = float(os.environ.get("SCHEDULER_DEFAULT_DEADLINE_SECONDS", str(POOL_CHECKOUT_TIMEOUT)))
+# Assumed browser time per request until real runs have been measured; used for Retry-After.
+INITIAL_SERVICE_SECONDS = 30.0
+# Weight of the newest run in the moving average of browser time.
+SERVICE_TIME_SMOOTHING = 0.2
+
+# Lower value is served first.
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the wait queue is at SCHEDULER_MAX_QUEUE; retry_after is a suggested back-off in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(RuntimeError):
+    """Raised when a request's deadline passes before a browser session was handed to it."""
+
+
+class Ticket:
+    """One request's place in the queue, and when it got (and started using) its browser."""
+
+    def __init__(self, notebook_id: str | None, client_id: str, priority: str, deadline_seconds: float):
+        self.notebook_id = notebook_id
+        self.client_id = client_id
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + deadline_seconds
+        self.started_at: float | None = None
+        self.granted = asyncio.get_running_loop().create_future()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def timing(self) -> dict:
+        """Seconds spent queued (including session checkout) and, so far, on the browser."""
+        now = time.monotonic()
+        started = self.started_at if self.started_at is not None else now
+        return {
+            "queue_wait_seconds": round(started - self.enqueued_at, 3),
+            "browser_seconds": round(now - started, 3),
+        }
+
+
+class Scheduler:
+    """
+    Admits requests to the driver pool: at most pool.capacity run at once, the rest wait.
+
+    Waiting requests are served by priority class first; within a class, each
+    client's flow takes turns so one busy caller cannot starve the others, however
+    many notebooks it queries. Inside a flow the client's notebooks take turns
+    in the same way. The queue is bounded, and a request whose deadline passes while
+    it waits is dropped from it. A browser run that has started is not interrupted.
+    """
+
+    def __init__(self, pool: DriverPool, max_queue: int = SCHEDULER_MAX_QUEUE,
+                 default_deadline_seconds: float = SCHEDULER_DEFAULT_DEADLINE_SECONDS):
+        self.pool = pool
+        self.max_queue = max_queue
+        self.default_deadline_seconds = default_deadline_seconds
+        # priority -> client -> notebook -> tickets; both levels are served round robin.
+        self._flows: dict[int, OrderedDict[str, OrderedDict[str | None, deque[Ticket]]]] = {
+            p: OrderedDict() for p in PRIORITIES.values()}
+        self._queued = 0
+        self._running = 0
+        self._service_seconds: float | None = None
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self._queue_wait_totals = {name: [0, 0.0] for name in PRIORITIES}
+
+    @property
+    def capacity(self) -> int:
+        return self.pool.capacity
+
+    def retry_after(self) -> int:
+        """Rough seconds until a new request would get a browser, given the queue and recent browser times."""
+        service = self._service_seconds or INITIAL_SERVICE_SECONDS
+        return max(1, math.ceil((self._queued + 1) / max(1, self.capacity) * service))
+
+    def _enqueue(self, ticket: Ticket):
+        flow = self._flows[PRIORITIES[ticket.priority]].setdefault(ticket.client_id, OrderedDict())
+        flow.setdefault(ticket.notebook_id, deque()).append(ticket)
+        self._queued += 1
+
+    def _withdraw(self, ticket: Ticket):
+        flows = self._flows[PRIORITIES[ticket.priority]]
+        flow = flows.get(ticket.client_id, {})
+        tickets = flow.get(ticket.notebook_id)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            self._queued -= 1
+            if not tickets:
+                del flow[ticket.notebook_id]
+            if not flow:
+                del flows[ticket.client_id]
+
+    def _next_ticket(self) -> Ticket | None:
+        for priority in sorted(self._flows):
+            flows = self._flows[priority]
+            while flows:
+                client_id, flow = next(iter(flows.items()))
+                notebook_id, tickets = next(iter(flow.items()))
+                ticket = tickets.popleft()
+                self._queued -= 1
+                # Round robin at both levels: the notebook goes to the back of the client's flow and the
+                # client to the back of its class, or each leaves when drained.
+                if tickets:
+                    flow.move_to_end(notebook_id)
+                else:
+                    del flow[notebook_id]
+                if flow:
+                    flows.move_to_end(client_id)
+                else:
+                    del flows[client_id]
+                if not ticket.granted.done():
+                    return ticket
+        return None
+
+    def _dispatch(self):
+        while self._running < self.capacity:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._running += 1
+            ticket.granted.set_result(None)
+
+    def _release_permit(self):
+        self._running -= 1
+        self._dispatch()
+
+    async def acquire(self, notebook_id: str | None, client_id: str, priority: str = "interactive",
+                      deadline_seconds: float | None = None) -> tuple[BrowserSession, Ticket]:
+        """Wait for a turn, then check a session out of the pool. Release it with release()."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        if not self.pool.started:
+            raise PoolNotStartedError("Driver pool not initialized. Please call /driver/setup first.")
+        if self._queued >= self.max_queue and self._running >= self.capacity:
+            self.rejected += 1
+            retry_after = self.retry_after()
+            module_logger.warning(f"Rejecting request from {client_id}: {self._queued} requests already queued (retry after {retry_after}s).")
+            raise QueueFullError(f"Too many queued requests ({self._queued}); retry in about {retry_after} seconds.", retry_after)
+
+        ticket = Ticket(notebook_id, client_id, priority,
+                        self.default_deadline_seconds if deadline_seconds is None else deadline_seconds)
+        self._enqueue(ticket)
+        self.admitted += 1
+        self._dispatch()
+        try:
+            # asyncio.wait leaves the future alone on timeout, so a grant can never be lost to a race.
+            await asyncio.wait({ticket.granted}, timeout=max(0.0, ticket.remaining()))
+        except BaseException:
+            if ticket.granted.done():
+                self._release_permit()
+            else:
+                self._withdraw(ticket)
+                ticket.granted.cancel()
+            raise
+        if not ticket.granted.done():
+            self._withdraw(ticket)
+            ticket.granted.cancel()
+            self.expired += 1
+            raise DeadlineExceededError(f"Request deadline passed after {ticket.timing()['queue_wait_seconds']} seconds in the queue.")
+
+        try:
+            remaining = ticket.remaining()
+            if remaining <= 0:
+                self.expired += 1
+                raise DeadlineExceededError("Request deadline passed before a browser session was free.")
+            session = await self.pool.checkout(timeout=remaining, notebook_id=ticket.notebook_id)
+        except BaseException:
+            self._release_permit()
+            raise
+        ticket.started_at = time.monotonic()
+        totals = self._queue_wait_totals[priority]
+        totals[0] += 1
+        totals[1] += ticket.started_at - ticket.enqueued_at
+        return session, ticket
+
+    async def release(self, ticket: Ticket, session: BrowserSession, broken: bool = False):
+        """Return the session to the pool and let the next queued request run."""
+        browser_seconds = time.monotonic() - ticket.started_at
+        if self._service_seconds is None:
+            self._service_seconds = browser_seconds
+        else:
+            self._service_seconds += SERVICE_TIME_SMOOTHING * (browser_seconds - self._service_seconds)
+        try:
+            await self.pool.checkin(session, broken=broken)
+        finally:
+            self._release_permit()
+
+    @asynccontextmanager
+    async def session(self, notebook_id: str | None, client_id: str, priority: str = "interactive",
+                      deadline_seconds: float | None = None):
+        """acquire()/release() as a context manager yielding (session, ticket); probes the browser on error."""
+        session, ticket = await self.acquire(notebook_id, client_id, priority, deadline_seconds)
+        try:
+            yield session, ticket
+        except BaseException:
+            session.broken = session.broken or not await session.healthy()
+            raise
+        finally:
+            await self.release(ticket, session)
+
+    def should_yield(self, ticket: Ticket) -> bool:
+        """True when higher-priority requests are waiting, so a long-running holder (a batch worker) should step aside."""
+        level = PRIORITIES[ticket.priority]
+        return any(self._flows[p] for p in self._flows if p < level)
+
+    def stats(self) -> dict:
+        queued = {name: sum(len(t) for flow in self._flows[level].values() for t in flow.values())
+                  for name, level in PRIORITIES.items()}
+        return {
+            "capacity": self.capacity,
+            "running": self._running,
+            "queued": queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "avg_browser_seconds": round(self._service_seconds, 3) if self._service_seconds is not None else None,
+            "avg_queue_wait_seconds": {
+                name: round(total / count, 3) if count else None
+                for name, (count, total) in self._queue_wait_totals.items()
+            },
+        }
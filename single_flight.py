@@ -0,0 +1,48 @@
+import asyncio
+import copy
+import logging
+
+module_logger = logging.getLogger("app.single_flight")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one running task.
+
+    The first caller for a key starts the work; callers arriving while it runs
+    wait for the same task and receive a deep copy of its result (or its
+    exception). The work runs as its own task, so a caller disconnecting does
+    not cancel it for everyone else.
+    """
+
+    def __init__(self):
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self.runs = 0
+        self.coalesced = 0
+
+    async def do(self, key: tuple, fn) -> tuple[object, bool]:
+        """Return (result, shared); shared is True when this caller piggybacked on another's run."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            module_logger.info(f"Coalescing request onto in-flight run for {key}.")
+            return copy.deepcopy(await asyncio.shield(task)), True
+
+        task = asyncio.create_task(fn())
+        self._inflight[key] = task
+        self.runs += 1
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task), False
+
+    def _finished(self, key: tuple, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so a run whose callers all went away does not log "exception was never retrieved".
+            module_logger.debug(f"In-flight run for {key} failed: {task.exception()!r}")
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+        }
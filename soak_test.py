@@ -0,0 +1,241 @@
+"""
+Soak test: drive the pool for a long time against the mock notebook and fail on resource growth.
+
+Two phases, run one after the other (or alone with --mode):
+
+- cycles: --cycles rounds of pool setup, one query and pool close, the way
+  /driver/setup and /driver/close are used. Every --fail-every cycles a setup is
+  made to fail (the notebook URL points at a closed port), which is the path
+  that used to leave staged profile copies behind.
+- conversation: one session answers --conversation-queries queries in a row,
+  so the chat, the DOM and Chrome's memory grow the way a long-lived tab does.
+
+Every --sample-every iterations it records the RSS of this process and of the
+chromedriver/Chrome processes below it, their count, open file descriptors,
+the DOM node count of the notebook tab and the size of the temp directory.
+Growth is the median of the last few samples minus the median of the first
+few; the run exits 1 if any growth is over its budget.
+
+    python soak_test.py --cycles 2000 --conversation-queries 500 --sample-every 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from metrics import process_tree, process_tree_rss
+from mock_notebook import add_timing_arguments, server_from_args
+from profile_staging import STAGING_PREFIX, STAGING_ROOT
+
+module_logger = logging.getLogger("app.soak_test")
+
+# --- Soak Configuration ---
+# Allowed growth between the start and the end of each phase.
+SOAK_MAX_RSS_GROWTH_MB = 150
+SOAK_MAX_FD_GROWTH = 32
+SOAK_MAX_PROCESS_GROWTH = 2
+SOAK_MAX_TMP_GROWTH_MB = 64
+SOAK_MAX_TMP_ENTRY_GROWTH = 10
+# The chat itself grows the DOM; this bounds how much per conversation phase.
+SOAK_MAX_DOM_GROWTH = 50000
+# Samples averaged (median) at each end of a phase when measuring growth.
+GROWTH_WINDOW = 3
+# Temp entries left by failed setups or crashed browsers, counted separately.
+LEAK_PREFIXES = (STAGING_PREFIX, "scoped_dir", ".org.chromium.Chromium.")
+# Where a setup is sent to fail: nothing listens on the discard port.
+UNREACHABLE_NOTEBOOK = "http://127.0.0.1:9/notebook/unreachable"
+
+JS_DOM_NODES = "return document.getElementsByTagName('*').length;"
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _open_fds(pid: int) -> int:
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+def _dir_usage(path: str) -> tuple[int, int, dict[str, int]]:
+    """Bytes and top-level entries under path, plus entries per LEAK_PREFIXES prefix. Files may vanish mid-walk."""
+    total, entries = 0, os.listdir(path)
+    by_prefix = {prefix: sum(1 for e in entries if e.startswith(prefix)) for prefix in LEAK_PREFIXES}
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total, len(entries), by_prefix
+
+
+def take_sample(phase: str, iteration: int, started: float, dom_nodes: int | None = None) -> dict:
+    """One reading of everything the budgets look at. Blocking (walks /proc and the temp directory)."""
+    pid = os.getpid()
+    children = process_tree(pid)
+    tmp_bytes, tmp_entries, leaked = _dir_usage(STAGING_ROOT)
+    return {
+        "phase": phase,
+        "iteration": iteration,
+        "elapsed_seconds": round(time.monotonic() - started, 1),
+        "rss_bytes": _rss(pid) + process_tree_rss(pid),
+        "browser_rss_bytes": process_tree_rss(pid),
+        "processes": len(children),
+        "fds": _open_fds(pid) + sum(_open_fds(child) for child in children),
+        "tmp_bytes": tmp_bytes,
+        "tmp_entries": tmp_entries,
+        "tmp_leak_entries": leaked,
+        "dom_nodes": dom_nodes,
+    }
+
+
+def growth(samples: list[dict], key: str) -> float | None:
+    values = [s[key] for s in samples if s[key] is not None]
+    if len(values) < 2:
+        return None
+    window = min(GROWTH_WINDOW, len(values) // 2)
+    return statistics.median(values[-window:]) - statistics.median(values[:window])
+
+
+def check_budgets(samples: list[dict], budgets: dict[str, float]) -> dict:
+    """Growth of each budgeted measurement over the phase; "ok" is False if any exceeds its budget."""
+    verdicts = {}
+    for key, budget in budgets.items():
+        grew = growth(samples, key)
+        verdicts[key] = {"growth": grew, "budget": budget, "ok": grew is None or grew <= budget}
+    return {"ok": all(v["ok"] for v in verdicts.values()), "budgets": verdicts}
+
+
+async def _dom_nodes(session) -> int:
+    return await session.run(session.driver.execute_script, JS_DOM_NODES)
+
+
+async def _failed_setup(iteration: int):
+    from driver_pool import launch_session
+
+    try:
+        session = await asyncio.to_thread(launch_session, f"soak-failed-setup-{iteration}", UNREACHABLE_NOTEBOOK)
+    except Exception as e:
+        module_logger.debug(f"Setup {iteration} failed as intended: {type(e).__name__}")
+        return
+    module_logger.warning(f"Setup {iteration} against {UNREACHABLE_NOTEBOOK} unexpectedly succeeded.")
+    await asyncio.to_thread(session.close)
+
+
+async def soak_cycles(pool, url: str, cycles: int, sample_every: int, fail_every: int, started: float) -> list[dict]:
+    samples = []
+    for i in range(1, cycles + 1):
+        await pool.start(url, min_size=1, max_size=1)
+        session = await pool.checkout(notebook_id=url)
+        try:
+            await session.query(url, f"soak cycle {i}")
+            dom_nodes = await _dom_nodes(session)
+        finally:
+            await pool.checkin(session)
+        await pool.close()
+        if fail_every and i % fail_every == 0:
+            await _failed_setup(i)
+        if i == 1 or i % sample_every == 0 or i == cycles:
+            samples.append(await asyncio.to_thread(take_sample, "cycles", i, started, dom_nodes))
+            module_logger.info(f"Cycle {i}/{cycles}: {samples[-1]}")
+    return samples
+
+
+async def soak_conversation(pool, url: str, queries: int, sample_every: int, started: float) -> list[dict]:
+    samples = []
+    await pool.start(url, min_size=1, max_size=1)
+    session = await pool.checkout(notebook_id=url)
+    try:
+        for i in range(1, queries + 1):
+            await session.query(url, f"soak conversation turn {i}")
+            if i == 1 or i % sample_every == 0 or i == queries:
+                dom_nodes = await _dom_nodes(session)
+                samples.append(await asyncio.to_thread(take_sample, "conversation", i, started, dom_nodes))
+                module_logger.info(f"Turn {i}/{queries}: {samples[-1]}")
+    finally:
+        await pool.checkin(session)
+        await pool.close()
+    return samples
+
+
+async def soak(url: str, args: argparse.Namespace) -> dict:
+    from driver_pool import DriverPool
+
+    budgets = {
+        "rss_bytes": args.max_rss_growth_mb * 2**20,
+        "fds": args.max_fd_growth,
+        "processes": args.max_process_growth,
+        "tmp_bytes": args.max_tmp_growth_mb * 2**20,
+        "tmp_entries": args.max_tmp_entry_growth,
+    }
+    pool = DriverPool(min_size=1, max_size=1)
+    started = time.monotonic()
+    report = {"url": url, "phases": {}}
+    if args.mode in ("cycles", "both"):
+        samples = await soak_cycles(pool, url, args.cycles, args.sample_every, args.fail_every, started)
+        report["phases"]["cycles"] = {**check_budgets(samples, budgets), "samples": samples}
+    if args.mode in ("conversation", "both"):
+        samples = await soak_conversation(pool, url, args.conversation_queries, args.sample_every, started)
+        # A growing chat legitimately grows the DOM and the tab's memory; the DOM has its own budget.
+        report["phases"]["conversation"] = {
+            **check_budgets(samples, {**budgets, "dom_nodes": args.max_dom_growth}), "samples": samples}
+    report["elapsed_seconds"] = round(time.monotonic() - started, 1)
+    report["ok"] = all(phase["ok"] for phase in report["phases"].values())
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak the driver pool against a mock notebook and check resource growth.")
+    parser.add_argument("--mode", choices=("cycles", "conversation", "both"), default="both")
+    parser.add_argument("--cycles", type=int, default=1000, help="Setup/query/close rounds.")
+    parser.add_argument("--conversation-queries", type=int, default=300, help="Queries in the single-session conversation.")
+    parser.add_argument("--sample-every", type=int, default=20, help="Iterations between samples.")
+    parser.add_argument("--fail-every", type=int, default=25, help="Make every Nth setup fail (0: never).")
+    parser.add_argument("--url", default=None, help="Notebook to soak against (default: a mock notebook served in-process).")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=SOAK_MAX_RSS_GROWTH_MB)
+    parser.add_argument("--max-fd-growth", type=int, default=SOAK_MAX_FD_GROWTH)
+    parser.add_argument("--max-process-growth", type=int, default=SOAK_MAX_PROCESS_GROWTH)
+    parser.add_argument("--max-tmp-growth-mb", type=float, default=SOAK_MAX_TMP_GROWTH_MB)
+    parser.add_argument("--max-tmp-entry-growth", type=int, default=SOAK_MAX_TMP_ENTRY_GROWTH)
+    parser.add_argument("--max-dom-growth", type=int, default=SOAK_MAX_DOM_GROWTH)
+    add_timing_arguments(parser)
+    # Soaking is about repetitions, not realistic answer times.
+    parser.set_defaults(first_token_ms=100, chunk_ms=10, answer_words=60, copy_delay_ms=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    server = None
+    url = args.url
+    with tempfile.TemporaryDirectory(prefix="mock-profile-") as mock_profile:
+        if url is None:
+            server = server_from_args(args).start()
+            url = server.notebook_url("soak")
+            # The mock needs no login; don't stage (or require) the real Chrome profile.
+            os.environ.setdefault("CHROME_PROFILE_DIR", mock_profile)
+        try:
+            report = asyncio.run(soak(url, args))
+        finally:
+            if server is not None:
+                server.stop()
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ echo "Cleaning up potential orphaned Chrome/Chromedriver user data directories..
 
 # Clean up directories in /tmp (where mkdtemp might create them)
 rm -rf /tmp/selenium_profile_*
+rm -rf /tmp/notebooklm_profile_* # Staged session profiles (see profile_staging.py)
 rm -rf /tmp/.com.google.Chrome.*
 
 # Clean up default Chrome user data directory (if it exists)
@@ -17,21 +18,30 @@ rm -rf /tmp/.com.google.Chrome.*
 rm -rf /home/seluser/.config/google-chrome/Default # The 'Default' profile within user data
 rm -rf /home/seluser/.config/google-chrome/SingletonLock # Common lock file
 
-# Ensure permissions are correct just in case (though Dockerfile already sets /tmp)
-sudo chmod -R 777 /tmp
+# The Dockerfile sets /tmp's permissions. Only /tmp itself needs to be writable (a recursive
+# chmod walks every leftover profile on each start), so fix it only if something broke it.
+if [ ! -w /tmp ]; then
+    sudo chmod 1777 /tmp
+fi
 
-# --- Ensure Virtual Environment and Dependencies are Setup ---
-# Check if the virtual environment exists
-if [ ! -d "/opt/venv" ]; then
-    echo "Virtual environment not found at /opt/venv. Creating..."
-    python -m venv /opt/venv
-    echo "Installing dependencies into the virtual environment..."
-    /opt/venv/bin/pip install --no-cache-dir -r /app/requirements.txt
+# --- Virtual Environment ---
+# The venv and its dependencies are built into the image; building them here would add minutes to every start.
+if [ ! -x "/opt/venv/bin/python" ]; then
+    echo "Virtual environment not found at /opt/venv; rebuild the image." >&2
+    exit 1
 fi
 
 echo "Cleanup complete. Starting FastAPI application..."
 # Activate the virtual environment within the app directory
 source /opt/venv/bin/activate
 
+# With BROWSER_BROKER_SOCKET set, the browsers live in a separate broker process and
+# WEB_WORKERS stateless front ends share them; otherwise one process owns everything.
+if [ -n "$BROWSER_BROKER_SOCKET" ]; then
+    echo "Starting browser broker on $BROWSER_BROKER_SOCKET..."
+    python broker.py --socket "$BROWSER_BROKER_SOCKET" &
+    exec gunicorn main:app -k uvicorn.workers.UvicornWorker -w "${WEB_WORKERS:-4}" -b 0.0.0.0:8000
+fi
+
 # Execute the FastAPI application
 exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
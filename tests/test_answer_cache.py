@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from answer_cache import AnswerCache, make_key, normalize_notebook, normalize_query
+
+NOTEBOOK = "https://notebooklm.google.com/notebook/abc"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(str(tmp_path / "answers.sqlite3"))
+
+
+def test_notebook_normalization_drops_query_fragment_and_trailing_slash():
+    assert normalize_notebook(NOTEBOOK + "/?authuser=0#chat") == NOTEBOOK
+    assert normalize_notebook("HTTPS://NotebookLM.Google.com/notebook/abc") == NOTEBOOK
+    assert normalize_notebook("  plain-id ") == "plain-id"
+
+
+def test_query_normalization_folds_case_width_and_whitespace():
+    assert normalize_query("  What  is\tTHIS?\n") == "what is this?"
+    assert normalize_query("ｗｈａｔ") == "what"
+
+
+def test_key_depends_on_fingerprint_but_not_on_spelling():
+    assert make_key(NOTEBOOK + "?authuser=1", "What is it?", "fp") == make_key(NOTEBOOK, "what  is it?", "fp")
+    assert make_key(NOTEBOOK, "what is it?", "fp") != make_key(NOTEBOOK, "what is it?", "other")
+
+
+def test_hit_after_put_counts_and_reports_age(cache):
+    cache.put(NOTEBOOK, "Question", "fp", {"answer": 42})
+    result, age = cache.get(NOTEBOOK + "?authuser=0", " question ", "fp")
+    assert result == {"answer": 42}
+    assert age >= 0
+    assert cache.get(NOTEBOOK, "other question", "fp") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_nothing_is_cached_or_served_without_a_fingerprint(cache):
+    with pytest.raises(ValueError):
+        cache.put(NOTEBOOK, "q", "", {})
+    assert cache.store_result(NOTEBOOK, "q", {"answer": 1, "source_fingerprint": None}) is None
+    assert cache.get(NOTEBOOK, "q", None) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_store_result_drops_per_request_fields(cache):
+    cache.store_result(NOTEBOOK, "q", {"answer": 1, "source_fingerprint": "fp", "session_id": "s1",
+                                       "timing": {}, "cache": {}, "coalesced": False})
+    result, _ = cache.get(NOTEBOOK, "q", "fp")
+    assert result == {"answer": 1, "source_fingerprint": "fp"}
+    assert cache.fingerprint(NOTEBOOK) == "fp"
+
+
+def test_changed_sources_invalidate_the_notebooks_answers(cache):
+    cache.record_fingerprint(NOTEBOOK, "fp1")
+    cache.put(NOTEBOOK, "q", "fp1", {"answer": 1})
+    cache.put("https://notebooklm.google.com/notebook/other", "q", "fp1", {"answer": 2})
+    cache.record_fingerprint(NOTEBOOK, "fp2")
+    assert cache.get(NOTEBOOK, "q", "fp1") is None
+    assert cache.get("https://notebooklm.google.com/notebook/other", "q", "fp1") is not None
+    assert cache.invalidations == 1
+    assert cache.fingerprint(NOTEBOOK) == "fp2"
+
+
+def test_unreadable_sources_forget_the_fingerprint(cache):
+    cache.record_fingerprint(NOTEBOOK, "fp")
+    cache.record_fingerprint(NOTEBOOK, None)
+    assert cache.fingerprint(NOTEBOOK) is None
+
+
+def test_stale_fingerprint_is_not_trusted(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"), fingerprint_ttl_seconds=0)
+    cache.record_fingerprint(NOTEBOOK, "fp")
+    time.sleep(0.01)
+    assert cache.fingerprint(NOTEBOOK) is None
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"), ttl_seconds=0)
+    cache.put(NOTEBOOK, "q", "fp", {"answer": 1})
+    time.sleep(0.01)
+    assert cache.get(NOTEBOOK, "q", "fp") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"), max_entries=2)
+    cache.put(NOTEBOOK, "a", "fp", {})
+    time.sleep(0.01)
+    cache.put(NOTEBOOK, "b", "fp", {})
+    time.sleep(0.01)
+    cache.get(NOTEBOOK, "a", "fp")
+    cache.put(NOTEBOOK, "c", "fp", {})
+    assert cache.get(NOTEBOOK, "b", "fp") is None
+    assert cache.get(NOTEBOOK, "a", "fp") is not None
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+from batch_runner import _BatchQueue, parse_batch_lines, run_batch
+
+
+class FakeSession:
+    def __init__(self, current=None, notebooks=()):
+        self.session_id = "s1"
+        self.current_notebook = current
+        self.notebooks = list(notebooks)
+
+    def has_notebook(self, notebook_id):
+        return notebook_id in self.notebooks
+
+    async def query(self, notebook_id, llmquery):
+        self.current_notebook = notebook_id
+        return {"answer": llmquery, "source_fingerprint": "fp", "timing": {"phases": {"answer": 0.5}}}
+
+    async def healthy(self):
+        return True
+
+
+class FakeTicket:
+    def timing(self):
+        return {"queue_wait_seconds": 1.0, "browser_seconds": 0.0}
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.acquired = []
+
+    async def acquire(self, notebook_id, client_id, priority="interactive", deadline_seconds=None):
+        self.acquired.append((notebook_id, priority))
+        return FakeSession(), FakeTicket()
+
+    async def release(self, ticket, session, broken=False):
+        pass
+
+    def should_yield(self, ticket):
+        return False
+
+
+class FakeCache:
+    def __init__(self, answers):
+        self.answers = answers
+        self.stored = []
+
+    def fingerprint(self, notebook_id):
+        return "fp"
+
+    def get(self, notebook_id, llmquery, fingerprint):
+        return ({"answer": self.answers[llmquery]}, 3.0) if llmquery in self.answers else None
+
+    def store_result(self, notebook_id, llmquery, result):
+        self.stored.append(llmquery)
+
+
+def _item(index, notebook_id, llmquery="q"):
+    return {"index": index, "id": None, "notebook_id": notebook_id, "llmquery": llmquery}
+
+
+def test_parse_batch_lines_numbers_items_and_reports_bad_lines():
+    text = "\n".join([
+        json.dumps({"notebook_id": "nb", "llmquery": "q1", "id": "x"}),
+        "",
+        "not json",
+        json.dumps({"notebook_id": "nb"}),
+        json.dumps(["nb", "q"]),
+        json.dumps({"notebook_id": 1, "llmquery": "q"}),
+        json.dumps({"notebook_id": "nb", "llmquery": "q2"}),
+    ])
+    items, errors = parse_batch_lines(text)
+    assert items == [
+        {"index": 1, "id": "x", "notebook_id": "nb", "llmquery": "q1"},
+        {"index": 7, "id": None, "notebook_id": "nb", "llmquery": "q2"},
+    ]
+    assert [e["index"] for e in errors] == [3, 4, 5, 6]
+    assert all(e["status_code"] == 400 for e in errors)
+
+
+def test_queue_keeps_a_session_on_its_notebook():
+    queue = _BatchQueue([_item(1, "a"), _item(2, "b"), _item(3, "a")])
+    session = FakeSession(current="a", notebooks=["a"])
+    assert [queue.next_for(session)["index"] for _ in range(2)] == [1, 3]
+
+
+def test_queue_prefers_an_open_tab_then_the_least_covered_notebook():
+    queue = _BatchQueue([_item(1, "a"), _item(2, "b"), _item(3, "c"), _item(4, "c")])
+    assert queue.next_for(FakeSession(current="x", notebooks=["x", "b"]))["notebook_id"] == "b"
+    # a and c have no sessions yet; c has more work left.
+    assert queue.next_for(FakeSession())["notebook_id"] == "c"
+    assert queue.next_for(FakeSession())["notebook_id"] == "a"
+    assert queue.next_for(FakeSession())["notebook_id"] == "c"
+    assert queue.next_for(FakeSession()) is None
+
+
+def test_queue_notebook_for_and_drain():
+    queue = _BatchQueue([_item(1, "a"), _item(2, "b"), _item(3, "b")])
+    assert queue.notebook_for("a") == "a"
+    assert queue.notebook_for(None) == "b"
+    assert len(queue.drain()) == 3
+    assert queue.notebook_for(None) is None
+
+
+def test_cache_hits_are_answered_without_a_session():
+    async def scenario():
+        scheduler = FakeScheduler()
+        cache = FakeCache({"cached": "from cache"})
+        lines = [line async for line in run_batch(scheduler, [_item(1, "nb", "cached")], 2, cache)]
+        return scheduler, cache, lines
+
+    scheduler, cache, lines = asyncio.run(scenario())
+    assert scheduler.acquired == []
+    assert lines[0]["session_id"] is None
+    assert lines[0]["result"]["cache"] == {"status": "hit", "age_seconds": 3.0}
+
+
+def test_misses_run_with_notebook_affinity_and_keep_their_phases():
+    async def scenario():
+        scheduler = FakeScheduler()
+        cache = FakeCache({"cached": "from cache"})
+        items = [_item(1, "nb", "cached"), _item(2, "nb", "fresh")]
+        lines = [line async for line in run_batch(scheduler, items, 2, cache)]
+        return scheduler, cache, lines
+
+    scheduler, cache, lines = asyncio.run(scenario())
+    assert scheduler.acquired == [("nb", "batch")]
+    assert cache.stored == ["fresh"]
+    fresh = next(line for line in lines if line["llmquery"] == "fresh")
+    assert fresh["result"]["cache"] == {"status": "miss"}
+    timing = fresh["result"]["timing"]
+    assert timing["phases"] == {"answer": 0.5}
+    assert timing["queue_wait_seconds"] == 1.0
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+import driver_pool
+from driver_pool import BrowserSession, DriverPool, PoolExhaustedError, PoolNotStartedError
+from node_registry import NodeRegistry, WebDriverNode
+
+
+class FakeDriver:
+    current_window_handle = "tab-1"
+
+    def __init__(self, quits: list):
+        self.quits = quits
+
+    def execute(self, command, params=None):
+        return {"value": []}
+
+    def quit(self):
+        self.quits.append(self)
+
+
+class Launcher:
+    """Stands in for launch_session on the session's worker thread: sleeps, then fails (if set when called) or returns a session."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.fail = False
+        self.quits = []
+
+    def __call__(self, session_id, notebook_id, worker=None, node=None):
+        fail = self.fail
+        time.sleep(self.delay)
+        if fail:
+            raise RuntimeError("launch failed")
+        return BrowserSession(session_id, FakeDriver(self.quits), None, worker=worker, node=node)
+
+
+@pytest.fixture(autouse=True)
+def no_profiles(monkeypatch):
+    monkeypatch.setattr(driver_pool.profile_stager, "janitor", lambda: [])
+    monkeypatch.setattr(driver_pool, "_prepare_profile_template", lambda: None)
+
+
+def _pool(launcher, max_size=1):
+    return DriverPool(min_size=0, max_size=max_size, launcher=launcher,
+                      registry=NodeRegistry([WebDriverNode("local")]))
+
+
+def test_checkout_launches_up_to_max_size_then_waits():
+    async def scenario():
+        pool = _pool(Launcher(), max_size=1)
+        await pool.start("nb", min_size=0)
+        session = await pool.checkout(timeout=1)
+        assert pool.size == 1
+        with pytest.raises(PoolExhaustedError):
+            await pool.checkout(timeout=0.05)
+        await pool.checkin(session)
+        assert await pool.checkout(timeout=1) is session
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_slow_launch_is_bounded_by_the_deadline_and_kept_idle():
+    async def scenario():
+        pool = _pool(Launcher(delay=0.3))
+        await pool.start("nb", min_size=0)
+        started = time.monotonic()
+        with pytest.raises(PoolExhaustedError):
+            await pool.checkout(timeout=0.05)
+        assert time.monotonic() - started < 0.25
+        assert pool.size == 1
+        await asyncio.sleep(0.4)
+        assert pool.stats()["idle"] == 1 and pool.stats()["launching"] == 0
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_launch_wakes_a_waiting_checkout():
+    async def scenario():
+        launcher = Launcher(delay=0.1)
+        pool = _pool(launcher)
+        await pool.start("nb", min_size=0)
+        launcher.fail = True
+        failing = asyncio.create_task(pool.checkout(timeout=1))
+        await asyncio.sleep(0.02)
+        waiting = asyncio.create_task(pool.checkout(timeout=2))
+        await asyncio.sleep(0.02)
+        launcher.fail = False
+        with pytest.raises(RuntimeError):
+            await failing
+        session = await waiting
+        assert pool.size == 1
+        await pool.checkin(session)
+        await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_session_launched_after_close_is_quit():
+    async def scenario():
+        launcher = Launcher(delay=0.2)
+        pool = _pool(launcher)
+        await pool.start("nb", min_size=0)
+        checkout = asyncio.create_task(pool.checkout(timeout=2))
+        await asyncio.sleep(0.05)
+        await pool.close()
+        with pytest.raises(PoolNotStartedError):
+            await checkout
+        assert len(launcher.quits) == 1
+        assert pool.size == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, render, render_pool_metrics
+
+
+def test_unlabelled_counter_renders_zero_before_first_update():
+    counter = Counter("test_unlabelled_total", "A counter.")
+    assert counter.render() == ["# HELP test_unlabelled_total A counter.",
+                                "# TYPE test_unlabelled_total counter",
+                                "test_unlabelled_total 0"]
+    counter.inc()
+    counter.inc(2.5)
+    assert counter.render()[-1] == "test_unlabelled_total 3.5"
+
+
+def test_labels_are_sorted_and_escaped():
+    gauge = Gauge("test_labelled", "A gauge.", ("state",))
+    gauge.set(2, state="idle")
+    gauge.set(1, state='say "hi"\n')
+    assert gauge.render()[2:] == ['test_labelled{state="idle"} 2', 'test_labelled{state="say \\"hi\\"\\n"} 1']
+    assert gauge.value(state="idle") == 2
+
+
+def test_wrong_labels_are_rejected():
+    counter = Counter("test_wrong_labels_total", "A counter.", ("outcome",))
+    with pytest.raises(ValueError):
+        counter.inc(phase="x")
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    histogram = Histogram("test_seconds", "A histogram.", ("phase",), buckets=(1, 0.5))
+    for value in (0.2, 0.5, 0.7, 3):
+        histogram.observe(value, phase="answer")
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{phase="answer",le="0.5"} 2',
+        'test_seconds_bucket{phase="answer",le="1"} 3',
+        'test_seconds_bucket{phase="answer",le="+Inf"} 4',
+        'test_seconds_sum{phase="answer"} 4.4',
+        'test_seconds_count{phase="answer"} 4',
+    ]
+
+
+def test_pool_metrics_are_refreshed_at_scrape_time():
+    class Pool:
+        def stats(self):
+            return {"idle": 2, "in_use": 1, "launching": 0}
+
+        def browser_pids(self):
+            return []
+
+    class Scheduler:
+        def stats(self):
+            return {"queued": {"interactive": 3, "batch": 0}}
+
+    text = asyncio.run(render_pool_metrics(Pool(), Scheduler()))
+    assert text == render()
+    assert text.endswith("\n")
+    assert 'notebooklm_sessions{state="idle"} 2' in text.splitlines()
+    assert 'notebooklm_queue_depth{priority="interactive"} 3' in text.splitlines()
+    assert "notebooklm_chrome_rss_bytes 0" in text.splitlines()
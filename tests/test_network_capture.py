@@ -0,0 +1,45 @@
+import json
+
+from network_capture import parse_answer_payload
+
+NOTEBOOK_ID = "11111111-1111-4111-8111-111111111111"
+CONVERSATION_ID = "22222222-2222-4222-8222-222222222222"
+SOURCE_A = "aaaaaaaa-0000-4000-8000-000000000001"
+SOURCE_B = "bbbbbbbb-0000-4000-8000-000000000002"
+
+
+def _body(*payloads) -> str:
+    lines = [")]}'", ""]
+    for payload in payloads:
+        envelope = json.dumps([["wrb.fr", None, json.dumps(payload)]])
+        lines += [str(len(envelope)), envelope]
+    lines += ["25", '[["e",4,null,null,123]]']
+    return "\n".join(lines)
+
+
+def test_last_envelope_holds_the_complete_answer():
+    body = _body([["The answer", None, [SOURCE_A]]],
+                 [["The answer is forty two.", None, [[SOURCE_A], [SOURCE_B], [SOURCE_A]]]])
+    assert parse_answer_payload(body) == {
+        "text": "The answer is forty two.",
+        "citations": [{"source_id": SOURCE_A}, {"source_id": SOURCE_B}],
+    }
+
+
+def test_only_the_citation_array_counts_and_excluded_ids_are_dropped():
+    answer = ["Short answer.", None, [CONVERSATION_ID, SOURCE_A], None, [NOTEBOOK_ID, SOURCE_B]]
+    body = _body([answer, "a much longer string with spaces that is not the answer"])
+    result = parse_answer_payload(body, {NOTEBOOK_ID, CONVERSATION_ID})
+    assert result == {"text": "Short answer.", "citations": [{"source_id": SOURCE_A}]}
+
+
+def test_answer_without_citations():
+    assert parse_answer_payload(_body([["Just text."]])) == {"text": "Just text.", "citations": []}
+
+
+def test_unexpected_structure_falls_back_to_the_dom():
+    assert parse_answer_payload(_body([1, 2])) is None
+    assert parse_answer_payload(_body([[None, "text with spaces"]])) is None
+    assert parse_answer_payload(_body([["   ", None, [SOURCE_A]]])) is None
+    assert parse_answer_payload(")]}'\nnot json at all") is None
+    assert parse_answer_payload("") is None
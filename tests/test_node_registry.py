@@ -0,0 +1,68 @@
+import pytest
+
+from node_registry import NODE_FAILURE_THRESHOLD, NodeRegistry, NodeUnavailableError, WebDriverNode, parse_nodes
+
+NOTEBOOKS = [f"https://notebooklm.google.com/notebook/{i}" for i in range(50)]
+
+
+def _registry(count=3, max_sessions=None):
+    return NodeRegistry([WebDriverNode(f"node{i}", f"http://10.0.0.{i}:4444", max_sessions) for i in range(count)])
+
+
+def test_parse_nodes_names_entries():
+    nodes = parse_nodes("a=http://h1:4444, http://h2:4444/", max_sessions=2)
+    assert [(n.name, n.url, n.max_sessions) for n in nodes] == [("a", "http://h1:4444", 2), ("h2:4444", "http://h2:4444", 2)]
+
+
+def test_route_is_stable_and_covers_every_healthy_node():
+    registry = _registry()
+    for notebook_id in NOTEBOOKS:
+        route = [node.name for node in registry.route(notebook_id)]
+        assert sorted(route) == ["node0", "node1", "node2"]
+        # Query strings do not change where a notebook goes.
+        assert [node.name for node in registry.route(notebook_id + "?authuser=0")] == route
+    assert len({registry.route(n)[0].name for n in NOTEBOOKS}) == 3
+
+
+def test_route_without_notebook_is_least_loaded_first():
+    registry = _registry()
+    registry.get("node0").sessions = 2
+    registry.get("node2").sessions = 1
+    assert [node.name for node in registry.route(None)] == ["node1", "node2", "node0"]
+
+
+def test_failed_node_only_moves_its_own_notebooks():
+    registry = _registry()
+    before = {n: [node.name for node in registry.route(n)] for n in NOTEBOOKS}
+    failed = registry.get("node1")
+    for _ in range(NODE_FAILURE_THRESHOLD - 1):
+        assert not registry.record(failed, RuntimeError("down"))
+    assert registry.record(failed, RuntimeError("down"))
+    for notebook_id, route in before.items():
+        assert [node.name for node in registry.route(notebook_id)] == [name for name in route if name != "node1"]
+
+
+def test_recovered_node_rejoins_but_a_logged_out_node_does_not():
+    registry = _registry()
+    node = registry.get("node0")
+    for _ in range(NODE_FAILURE_THRESHOLD):
+        registry.record(node, RuntimeError("down"))
+    registry.record(node)
+    assert node.healthy
+
+    assert registry.record(node, RuntimeError("signed out"), login_failed=True)
+    registry.record(node)
+    assert not node.healthy
+    assert node not in registry.route(NOTEBOOKS[0])
+
+
+def test_reserve_respects_node_capacity():
+    registry = _registry(count=2, max_sessions=1)
+    first = registry.reserve(NOTEBOOKS[0])
+    second = registry.reserve(NOTEBOOKS[0])
+    assert {first.name, second.name} == {"node0", "node1"}
+    with pytest.raises(NodeUnavailableError):
+        registry.reserve(NOTEBOOKS[0])
+    registry.release(first)
+    assert registry.reserve(NOTEBOOKS[0]) is first
+    assert registry.capacity() == 2
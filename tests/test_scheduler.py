@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from driver_pool import PoolNotStartedError
+from scheduler import DeadlineExceededError, QueueFullError, Scheduler
+
+
+class FakeSession:
+    broken = False
+
+    async def healthy(self):
+        return True
+
+
+class FakePool:
+    started = True
+
+    def __init__(self, capacity: int = 1):
+        self.capacity = capacity
+        self.checkouts = []
+        self.checkins = []
+
+    async def checkout(self, timeout=None, notebook_id=None):
+        self.checkouts.append(notebook_id)
+        return FakeSession()
+
+    async def checkin(self, session, broken=False):
+        self.checkins.append(broken)
+
+
+async def _served_order(scheduler: Scheduler, requests: list[tuple]) -> list[tuple]:
+    """Queue requests behind a held session, release it and return the order they ran in."""
+    order = []
+    held = await scheduler.acquire("held", "holder")
+
+    async def request(notebook_id, client_id, priority):
+        session, ticket = await scheduler.acquire(notebook_id, client_id, priority)
+        order.append((client_id, notebook_id, priority))
+        await scheduler.release(ticket, session)
+
+    tasks = [asyncio.create_task(request(*r)) for r in requests]
+    await asyncio.sleep(0)
+    await scheduler.release(held[1], held[0])
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_interactive_requests_are_served_before_batch():
+    async def scenario():
+        return await _served_order(Scheduler(FakePool()), [
+            ("n", "a", "batch"), ("n", "b", "batch"), ("n", "c", "interactive"),
+        ])
+
+    order = asyncio.run(scenario())
+    assert [priority for _, _, priority in order] == ["interactive", "batch", "batch"]
+
+
+def test_clients_take_turns_however_many_notebooks_they_use():
+    async def scenario():
+        return await _served_order(Scheduler(FakePool()), [
+            ("a1", "A", "interactive"), ("a1", "A", "interactive"), ("a2", "A", "interactive"),
+            ("a3", "A", "interactive"), ("b1", "B", "interactive"), ("b1", "B", "interactive"),
+        ])
+
+    order = asyncio.run(scenario())
+    assert [client for client, _, _ in order] == ["A", "B", "A", "B", "A", "A"]
+    # Within client A, its notebooks take turns too.
+    assert [notebook for client, notebook, _ in order if client == "A"] == ["a1", "a2", "a3", "a1"]
+
+
+def test_should_yield_when_higher_priority_requests_wait():
+    async def scenario():
+        scheduler = Scheduler(FakePool())
+        session, ticket = await scheduler.acquire("n", "batch-client", "batch")
+        assert not scheduler.should_yield(ticket)
+        waiter = asyncio.create_task(scheduler.acquire("n", "user", "interactive"))
+        await asyncio.sleep(0)
+        assert scheduler.should_yield(ticket)
+        await scheduler.release(ticket, session)
+        session, ticket = await waiter
+        await scheduler.release(ticket, session)
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        scheduler = Scheduler(FakePool(), max_queue=1)
+        session, ticket = await scheduler.acquire("n", "a")
+        waiter = asyncio.create_task(scheduler.acquire("n", "b"))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as excinfo:
+            await scheduler.acquire("n", "c")
+        assert excinfo.value.retry_after >= 1
+        assert scheduler.stats()["rejected"] == 1
+        await scheduler.release(ticket, session)
+        session, ticket = await waiter
+        await scheduler.release(ticket, session)
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_grows_with_the_queue_and_measured_browser_time():
+    async def scenario():
+        scheduler = Scheduler(FakePool(capacity=2))
+        scheduler._service_seconds = 10.0
+        assert scheduler.retry_after() == 5
+        scheduler._queued = 3
+        assert scheduler.retry_after() == 20
+
+    asyncio.run(scenario())
+
+
+def test_deadline_passes_while_queued():
+    async def scenario():
+        scheduler = Scheduler(FakePool())
+        session, ticket = await scheduler.acquire("n", "a")
+        with pytest.raises(DeadlineExceededError):
+            await scheduler.acquire("n", "b", deadline_seconds=0.01)
+        assert scheduler.stats()["queued"] == {"interactive": 0, "batch": 0}
+        assert scheduler.expired == 1
+        await scheduler.release(ticket, session)
+
+    asyncio.run(scenario())
+
+
+def test_session_context_manager_passes_the_notebook_and_releases():
+    async def scenario():
+        pool = FakePool()
+        scheduler = Scheduler(pool)
+        async with scheduler.session("nb", "a") as (session, ticket):
+            assert ticket.timing()["queue_wait_seconds"] >= 0
+        assert pool.checkouts == ["nb"]
+        assert pool.checkins == [False]
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_unstarted_pool_is_refused():
+    async def scenario():
+        pool = FakePool()
+        pool.started = False
+        with pytest.raises(PoolNotStartedError):
+            await Scheduler(pool).acquire("n", "a")
+
+    asyncio.run(scenario())
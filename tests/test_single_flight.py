@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run_and_get_copies():
+    async def scenario():
+        flight = SingleFlight()
+        runs = 0
+        release = asyncio.Event()
+
+        async def work():
+            nonlocal runs
+            runs += 1
+            await release.wait()
+            return {"answer": [1]}
+
+        first = asyncio.create_task(flight.do(("nb", "q"), work))
+        second = asyncio.create_task(flight.do(("nb", "q"), work))
+        await asyncio.sleep(0)
+        release.set()
+        (result1, shared1), (result2, shared2) = await asyncio.gather(first, second)
+        assert runs == 1
+        assert (shared1, shared2) == (False, True)
+        assert result1 == result2
+        result2["answer"].append(2)
+        assert result1 == {"answer": [1]}
+        assert flight.stats() == {"in_flight": 0, "runs": 1, "coalesced": 1}
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            return 1
+
+        await asyncio.gather(flight.do(("nb", "a"), work), flight.do(("nb", "b"), work))
+        assert flight.runs == 2
+
+    asyncio.run(scenario())
+
+
+def test_failure_reaches_every_waiter_and_clears_the_key():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(flight.do(("k",), work), flight.do(("k",), work), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_run():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do(("k",), work))
+        second = asyncio.create_task(flight.do(("k",), work))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        assert await second == ("done", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+"""
+Compare per-command latency of classic WebDriver and the DevTools (CDP) websocket.
+
+Launches one session the way the pool does (staged profile, same Chrome
+options), opens --url, then runs each command below --iterations times over
+each transport against the same page.
+
+    python transport_benchmark.py --url https://notebooklm.google.com/notebook/<id> --iterations 200
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+
+from cdp_transport import CdpSession
+from notebook_query import JS_PAGE_STATE, SOURCE_LIST_SELECTOR
+
+module_logger = logging.getLogger("app.transport_benchmark")
+
+# name -> (script, arguments); the same calls run_query makes against the page.
+COMMANDS = {
+    "ready_state": ("return document.readyState;", ()),
+    "copy_button_count": (
+        "return document.evaluate(\"count(//button[contains(@aria-label, 'Copy')])\", document, null, "
+        "XPathResult.NUMBER_TYPE, null).numberValue;",
+        (),
+    ),
+    "page_state": (JS_PAGE_STATE, (SOURCE_LIST_SELECTOR,)),
+}
+
+
+def _summary(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+    }
+
+
+def benchmark(driver, cdp: CdpSession, iterations: int, warmup: int = 5) -> dict:
+    """Time every command over both transports; speedup is the WebDriver p50 over the CDP p50."""
+    report = {}
+    for name, (script, args) in COMMANDS.items():
+        calls = {
+            "webdriver": lambda: driver.execute_script(script, *args),
+            "cdp": lambda: cdp.execute_script(script, *args),
+        }
+        report[name] = {}
+        for transport, call in calls.items():
+            for _ in range(warmup):
+                call()
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                call()
+                samples.append(time.perf_counter() - started)
+            report[name][transport] = _summary(samples)
+        report[name]["speedup"] = round(report[name]["webdriver"]["p50_ms"] / max(report[name]["cdp"]["p50_ms"], 0.001), 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WebDriver against the CDP websocket transport.")
+    parser.add_argument("--url", default=None, help="Page to benchmark against (default: about:blank).")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    from driver_pool import _prepare_profile_template, launch_session, profile_stager
+
+    _prepare_profile_template()
+    session = launch_session("transport-benchmark", args.url)
+    try:
+        cdp = CdpSession.attach(session.driver)
+        try:
+            report = {
+                "url": args.url or "about:blank",
+                "iterations": args.iterations,
+                "commands": benchmark(session.driver, cdp, args.iterations, args.warmup),
+            }
+        finally:
+            cdp.close()
+    finally:
+        session.close()
+        profile_stager.discard_spares()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
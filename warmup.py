@@ -0,0 +1,126 @@
+"""
+Browser warm-up at startup, so the first request does not pay for Chrome.
+
+With WARMUP_NOTEBOOKS set, the process that owns the browsers (the API, or the
+broker when there is one) starts the pool as soon as it boots. Profiles are
+staged and DRIVER_POOL_MIN_SIZE sessions are launched in parallel. Each session
+then opens the configured notebooks, up to NOTEBOOK_TABS_PER_SESSION tabs, in
+rotation so that every notebook is open somewhere. With an answer cache, the
+sources read while opening a notebook seed its fingerprint, so the first cached
+lookup does not need a browser. The sessions are taken through
+the Scheduler like any request's, so queries arriving meanwhile are admitted
+fairly. GET /ready answers 503 until this has finished, or, without a warm-up or
+after a failed one, until /driver/setup has started the pool.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from metrics import record_startup
+from notebook_tabs import NOTEBOOK_TABS_PER_SESSION
+
+module_logger = logging.getLogger("app.warmup")
+
+# --- Warm-up Configuration ---
+# Notebook URLs to open at startup, comma-separated; the first one is the pool's notebook. Empty: no warm-up.
+WARMUP_NOTEBOOKS = os.environ.get("WARMUP_NOTEBOOKS", "")
+
+WARMUP_SKIPPED = "skipped"
+WARMUP_PENDING = "pending"
+WARMUP_RUNNING = "running"
+WARMUP_READY = "ready"
+WARMUP_FAILED = "failed"
+# Scheduler client id the warm-up's session leases are queued under.
+WARMUP_CLIENT_ID = "warmup"
+
+
+class Warmup:
+    """Warms one DriverPool through its Scheduler and reports whether it is ready to answer."""
+
+    def __init__(self, pool, scheduler, notebooks: list[str] | None = None, cache=None):
+        self.pool = pool
+        self.scheduler = scheduler
+        self.cache = cache
+        if notebooks is None:
+            notebooks = [n.strip() for n in WARMUP_NOTEBOOKS.split(",") if n.strip()]
+        self.notebooks = notebooks
+        self.state = WARMUP_PENDING if notebooks else WARMUP_SKIPPED
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.seconds: float | None = None
+        self.sessions = 0
+        # Set by mark_setup(); a pool left half-started by a failed warm-up does not count as ready.
+        self.setup_done = False
+
+    def mark_setup(self):
+        """Record that /driver/setup has started the pool."""
+        self.setup_done = True
+
+    @property
+    def ready(self) -> bool:
+        """Warmed, or started by /driver/setup (after a failed warm-up, or without one) and still running."""
+        if self.state == WARMUP_READY:
+            return True
+        return self.setup_done and self.pool.started and self.pool.size > 0
+
+    async def _open_notebooks(self, session, index: int):
+        # Session i opens notebooks i, i+1, ... so each notebook is open in at least one session when there are enough.
+        for j in range(min(len(self.notebooks), NOTEBOOK_TABS_PER_SESSION)):
+            notebook_id = self.notebooks[(index + j) % len(self.notebooks)]
+            if session.has_notebook(notebook_id):
+                continue
+            if self.cache is None:
+                await session.run(session.activate, notebook_id)
+                continue
+            # Opening the notebook is most of the cost of reading its sources, so seed the cache's fingerprint too.
+            fingerprint = await session.source_fingerprint(notebook_id)
+            await asyncio.to_thread(self.cache.record_fingerprint, notebook_id, fingerprint)
+
+    async def run(self):
+        """Start the pool and open the notebooks. Never raises; the outcome is in state and error."""
+        if self.state != WARMUP_PENDING:
+            return
+        self.state = WARMUP_RUNNING
+        self.started_at = time.monotonic()
+        module_logger.info(f"Warming up {self.pool.min_size} session(s) for {len(self.notebooks)} notebook(s)...")
+        try:
+            launched = await self.pool.start(self.notebooks[0])
+            self.sessions = len(launched)
+            # Lease every session at once so each one is warmed; queries queued meanwhile take their turns.
+            leases = await asyncio.gather(*(self.scheduler.acquire(None, WARMUP_CLIENT_ID) for _ in launched),
+                                          return_exceptions=True)
+            try:
+                for lease in leases:
+                    if isinstance(lease, BaseException):
+                        raise lease
+                await asyncio.gather(*(self._open_notebooks(session, i) for i, (session, _) in enumerate(leases)))
+            finally:
+                for lease in leases:
+                    if not isinstance(lease, BaseException):
+                        session, ticket = lease
+                        await self.scheduler.release(ticket, session)
+        except asyncio.CancelledError:
+            self.state = WARMUP_FAILED
+            self.error = "cancelled"
+            raise
+        except Exception as e:
+            self.state = WARMUP_FAILED
+            self.error = f"{type(e).__name__} - {e}"
+            module_logger.error(f"Warm-up failed: {self.error}", exc_info=True)
+            return
+        finally:
+            self.seconds = round(time.monotonic() - self.started_at, 3)
+        self.state = WARMUP_READY
+        record_startup("ready")
+        module_logger.info(f"Warm-up finished in {self.seconds}s with {self.sessions} session(s); ready.")
+
+    def describe(self) -> dict:
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "notebooks": self.notebooks,
+            "sessions": self.sessions,
+            "seconds": self.seconds,
+            "error": self.error,
+        }